@@ -0,0 +1,228 @@
+"""
+Pipeline benchmark on a synthetic archive.
+
+Generates (or reuses) a synthetic raw archive in a work directory laid out
+like the repo (data/raw/arpa, data/processed), then times each stage in a
+fresh process so that peak RSS is per stage:
+
+    load_raw         list(load_all_raw_records())
+    build_daily      build_daily_<engine>(records)    (+ daily.parquet, untimed)
+    build_monthly    build_monthly(daily)             (+ monthly.parquet, untimed)
+    build_anomalies  build_anomalies.main()           (reads and writes its files)
+
+Results (seconds, rows/s, peak RSS, commit, parameters) go to a JSON file
+so runs on different commits can be compared.
+
+    python -m src.benchmark.run --stations 100 --years 50 --workdir /tmp/fvg_bench
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.benchmark.synthetic import generate_archive, FIRST_YEAR
+
+
+RESULTS_DIR = Path("data/benchmarks")
+RAW_SUBDIR = Path("data/raw/arpa")
+PROCESSED_SUBDIR = Path("data/processed")
+PARAMS_FILE = "synthetic_params.json"
+
+STAGES = ("load_raw", "build_daily", "build_monthly", "build_anomalies")
+
+
+# ---- Stage bodies (run in a child process, cwd = workdir) ----
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def _timed(fn):
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = fn()
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def _stage_load_raw(engine: str) -> dict:
+    from src.processing.load_raw import load_all_raw_records
+
+    records, wall, cpu = _timed(lambda: list(load_all_raw_records()))
+    return {"rows_in": len(records), "rows_out": len(records), "seconds": wall, "cpu_seconds": cpu}
+
+
+def _stage_build_daily(engine: str) -> dict:
+    from src.processing.build_daily import build_daily_columnar, build_daily_pydantic
+    from src.processing.load_raw import load_all_raw_records
+
+    records = list(load_all_raw_records())
+    build = build_daily_columnar if engine == "columnar" else build_daily_pydantic
+    daily, wall, cpu = _timed(lambda: build(records))
+    daily.to_parquet(PROCESSED_SUBDIR / "daily.parquet", index=False)
+    return {"rows_in": len(records), "rows_out": len(daily), "seconds": wall, "cpu_seconds": cpu}
+
+
+def _stage_build_monthly(engine: str) -> dict:
+    from src.processing.build_monthly import build_monthly
+
+    daily = pd.read_parquet(PROCESSED_SUBDIR / "daily.parquet")
+    monthly, wall, cpu = _timed(lambda: build_monthly(daily))
+    monthly.to_parquet(PROCESSED_SUBDIR / "monthly.parquet", index=False)
+    return {"rows_in": len(daily), "rows_out": len(monthly), "seconds": wall, "cpu_seconds": cpu}
+
+
+def _stage_build_anomalies(engine: str) -> dict:
+    from src.processing import build_anomalies
+
+    n_in = len(pd.read_parquet(build_anomalies.IN_PATH, columns=["month"]))
+    _, wall, cpu = _timed(build_anomalies.main)
+    n_out = len(pd.read_parquet(build_anomalies.OUT_PATH, columns=["month"]))
+    return {"rows_in": n_in, "rows_out": n_out, "seconds": wall, "cpu_seconds": cpu}
+
+
+_STAGE_FUNCS = {
+    "load_raw": _stage_load_raw,
+    "build_daily": _stage_build_daily,
+    "build_monthly": _stage_build_monthly,
+    "build_anomalies": _stage_build_anomalies,
+}
+
+
+def _run_stage(stage: str, workdir: str, engine: str) -> dict:
+    os.chdir(workdir)
+    baseline = _peak_rss_mb()
+    result = _STAGE_FUNCS[stage](engine)
+    result["stage"] = stage
+    result["rows_per_s"] = result["rows_in"] / result["seconds"] if result["seconds"] else None
+    result["peak_rss_mb"] = _peak_rss_mb()
+    result["baseline_rss_mb"] = baseline
+    return result
+
+
+# ---- Harness ----
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True)
+        return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_archive(workdir: Path, params: dict, n_workers: int = 1) -> float:
+    """Generate the archive unless `workdir` already holds one with the same params."""
+    params_path = workdir / PARAMS_FILE
+    if params_path.exists() and json.loads(params_path.read_text(encoding="utf-8")) == params:
+        return 0.0
+
+    t0 = time.perf_counter()
+    generate_archive(
+        workdir / RAW_SUBDIR,
+        params["stations"],
+        params["years"],
+        first_year=params["first_year"],
+        seed=params["seed"],
+        n_workers=n_workers,
+    )
+    params_path.write_text(json.dumps(params, indent=2), encoding="utf-8")
+    return time.perf_counter() - t0
+
+
+def run_benchmark(
+    workdir: Path,
+    stations: int,
+    years: int,
+    first_year: int = FIRST_YEAR,
+    seed: int = 0,
+    engine: str = "columnar",
+    stages=STAGES,
+    n_workers: int = 1,
+) -> dict:
+    workdir = Path(workdir).resolve()
+    (workdir / PROCESSED_SUBDIR).mkdir(parents=True, exist_ok=True)
+
+    params = {"stations": stations, "years": years, "first_year": first_year, "seed": seed}
+    gen_seconds = prepare_archive(workdir, params, n_workers=n_workers)
+    if gen_seconds:
+        print(f"[OK] synthetic archive generated in {gen_seconds:.1f}s")
+
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for stage in stages:
+        # one fresh process per stage: ru_maxrss is a per-process high-water mark
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            result = pool.submit(_run_stage, stage, str(workdir), engine).result()
+        results.append(result)
+        print(
+            f"[OK] {stage:<16} {result['seconds']:8.2f}s  "
+            f"{result['rows_per_s'] or 0:12,.0f} rows/s  peak RSS {result['peak_rss_mb']:8.1f} MB"
+        )
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "params": {**params, "engine": engine},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "pyarrow": pa.__version__,
+        },
+        "stages": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the processing stages on synthetic data.")
+    parser.add_argument("--stations", type=int, default=20)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--first-year", type=int, default=FIRST_YEAR)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=("pydantic", "columnar"), default="columnar")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), help=f"subset of: {', '.join(STAGES)}")
+    parser.add_argument("--workdir", type=Path, default=None, help="reused between runs (default: a temporary directory)")
+    parser.add_argument("--workers", type=int, default=1, help="processes for data generation")
+    parser.add_argument("--out", type=Path, default=None, help=f"results JSON (default: {RESULTS_DIR}/<timestamp>_<commit>.json)")
+    args = parser.parse_args()
+
+    unknown = [s for s in args.stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory(prefix="fvg_bench_") as tmp:
+        report = run_benchmark(
+            args.workdir or Path(tmp),
+            args.stations,
+            args.years,
+            first_year=args.first_year,
+            seed=args.seed,
+            engine=args.engine,
+            stages=args.stages,
+            n_workers=args.workers,
+        )
+
+    out = args.out
+    if out is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = RESULTS_DIR / f"{stamp}_{(report['commit'] or 'nogit')[:8]}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"[OK] written: {out}")
+
+
+if __name__ == "__main__":
+    main()
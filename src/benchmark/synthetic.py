@@ -0,0 +1,133 @@
+"""
+Synthetic raw ARPA archive for benchmarks.
+
+Every station-year goes through the same steps as the scraper: a ';'
+separated CSV with the Italian column names and "-" for missing values is
+parsed with pd.read_csv, `anno` / `stazione` are added and the records are
+stored as a year chunk with RawStationStore. The JSON therefore has the
+same keys and value types as a real scrape (floats where a column had no
+"-" that year, strings otherwise).
+
+Values are seasonal and roughly plausible (temperature follows the day of
+year and the station's elevation, precipitation is mostly zero), so the
+monthly and anomaly stages see realistic group sizes and coverage.
+
+    python -m src.benchmark.synthetic --stations 200 --years 50 --out /tmp/arpa_synth
+"""
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from pathlib import Path
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from src.scraping.standin import CSV_COLUMNS
+from src.utils.raw_store import RawStationStore
+
+
+P_MISSING = 0.03      # single "-" values
+P_GAP_DAY = 0.01      # whole days missing from the export
+FIRST_YEAR = 1975
+
+
+def station_names(n_stations: int) -> list[str]:
+    return [f"Stazione Sintetica {i:03d}" for i in range(n_stations)]
+
+
+def _fmt(values: np.ndarray, decimals: int = 1) -> np.ndarray:
+    return np.char.mod(f"%.{decimals}f", np.round(values, decimals))
+
+
+def year_csv(rng: np.random.Generator, year: int, elevation: float) -> str:
+    """One 'mese = Tutti' export: every day of `year`, ';' separated."""
+    days = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="D")
+    days = days[rng.random(len(days)) >= P_GAP_DAY]
+    n = len(days)
+    doy = days.dayofyear.to_numpy()
+
+    season = np.sin(2 * np.pi * (doy - 110) / 365.25)
+    t_mean = 12 - elevation * 0.0065 + 10 * season + rng.normal(0, 3, n)
+    t_span = rng.uniform(3, 12, n)
+    rain = np.where(rng.random(n) < 0.3, rng.gamma(0.7, 12, n), 0.0)
+    h_mean = np.clip(75 - 10 * season + rng.normal(0, 10, n), 15, 100)
+    w_mean = rng.gamma(2, 3, n)
+
+    columns = {
+        "mese": days.month.astype(str),
+        "giorno*": days.day.astype(str),
+        "Pioggia mm": _fmt(rain),
+        "Temp. min °C": _fmt(t_mean - t_span / 2),
+        "Temp. med °C": _fmt(t_mean),
+        "Temp. max °C": _fmt(t_mean + t_span / 2),
+        "Umidita' min %": _fmt(np.clip(h_mean - rng.uniform(5, 30, n), 5, 100)),
+        "Umidita' med %": _fmt(h_mean),
+        "Umidita' max %": _fmt(np.clip(h_mean + rng.uniform(5, 25, n), 5, 100)),
+        "Vento med km/h": _fmt(w_mean),
+        "Vento max km/h": _fmt(w_mean * rng.uniform(1.5, 3.5, n)),
+        "Dir. V. max °N": rng.integers(0, 361, n).astype(str),
+        "Radiaz. KJ/m2": _fmt(np.clip(15000 + 11000 * season + rng.normal(0, 4000, n), 500, None), 0),
+        "Press. med hPa": _fmt(1013 - elevation * 0.12 + rng.normal(0, 6, n)),
+    }
+
+    table = np.column_stack([columns[c] for c in CSV_COLUMNS]).astype(object)
+    values = table[:, 2:]
+    values[rng.random(values.shape) < P_MISSING] = "-"
+
+    lines = [";".join(CSV_COLUMNS)] + [";".join(row) for row in table]
+    return "\n".join(lines) + "\n"
+
+
+def generate_station(root: Path, station: str, years: list[int], seed: int) -> int:
+    """Write all years of one station as chunks; returns the number of records."""
+    rng = np.random.default_rng(seed)
+    elevation = rng.uniform(0, 1800)
+    store = RawStationStore.for_station(root, station)
+
+    n_records = 0
+    for year in years:
+        if store.has_year(str(year)):
+            continue
+        # same steps as browser.fetch_year + scrape_station_monthly
+        df = pd.read_csv(StringIO(year_csv(rng, year, elevation)), sep=";")
+        df["anno"] = year
+        df["stazione"] = station
+        store.write_year(str(year), df.to_dict(orient="records"))
+        n_records += len(df)
+    return n_records
+
+
+def _station_job(args) -> int:
+    return generate_station(*args)
+
+
+def generate_archive(
+    root: Path,
+    n_stations: int,
+    n_years: int,
+    first_year: int = FIRST_YEAR,
+    seed: int = 0,
+    n_workers: int = 1,
+) -> int:
+    """Generate `n_stations` x `n_years` station-years under `root`."""
+    years = list(range(first_year, first_year + n_years))
+    jobs = [(Path(root), name, years, seed * 100_003 + i) for i, name in enumerate(station_names(n_stations))]
+
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            return sum(pool.map(_station_job, jobs))
+    return sum(map(_station_job, jobs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic raw ARPA archive.")
+    parser.add_argument("--out", type=Path, required=True, help="raw directory to fill (e.g. <dir>/data/raw/arpa)")
+    parser.add_argument("--stations", type=int, default=10)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--first-year", type=int, default=FIRST_YEAR)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    n = generate_archive(args.out, args.stations, args.years, args.first_year, args.seed, args.workers)
+    print(f"[OK] {n} records for {args.stations} stations x {args.years} years in {args.out}")
@@ -0,0 +1,157 @@
+"""
+One entry point for the project's commands:
+
+    python -m src <command> [args...]       # same args as python -m <module>
+    python -m src daily --engine columnar --ipc
+    python -m src importtime [command ...]  # startup cost per command
+
+Only the module of the chosen command is imported (and run as __main__,
+exactly like `python -m <module>`), so `python -m src audit` never loads
+selenium and `python -m src serve` never loads pydantic. This module
+itself imports nothing beyond the standard library.
+
+`importtime` runs `python -X importtime -c "import <module>"` in a fresh
+interpreter for every command and reports the import time of the module
+next to the interpreter startup (site, encodings), with the heaviest
+direct imports in the `-X importtime` format:
+
+    python -m src importtime                # all commands
+    python -m src importtime daily monthly --top 5
+"""
+import argparse
+import runpy
+import subprocess
+import sys
+import time
+
+
+PROG = "python -m src"
+
+# command -> (module run as __main__, help)
+COMMANDS = {
+    "scrape": ("src.scraping.scrape_all_months", "scrape the ARPA FVG archive into data/raw/"),
+    "standin": ("src.scraping.standin", "local stand-in of archivio.php for scraper tests"),
+    "raw-store": ("src.utils.raw_store", "convert legacy meteo_<station>.json files to chunked stores"),
+    "daily": ("src.processing.build_daily", "build daily.parquet from raw JSON"),
+    "monthly": ("src.processing.build_monthly", "build monthly.parquet from daily.parquet"),
+    "anomalies": ("src.processing.build_anomalies", "build monthly_anomalies.parquet"),
+    "trends": ("src.processing.build_trends", "build trends.parquet (Theil–Sen + Mann–Kendall)"),
+    "quantile-index": ("src.processing.quantile_index", "build quantile_index.parquet"),
+    "similar": ("src.processing.build_similar_months", "build similar_months.parquet"),
+    "audit": ("src.processing.audit", "data-quality audit of the raw archive"),
+    "update": ("src.processing.incremental", "incremental refresh of the processed datasets"),
+    "pipeline": ("src.processing.pipeline", "cached daily -> monthly -> anomalies / trends pipeline"),
+    "serve": ("src.service.query", "local HTTP query service over data/processed"),
+    "bench": ("src.benchmark.run", "benchmark the processing stages"),
+    "synthetic": ("src.benchmark.synthetic", "generate a synthetic raw archive"),
+}
+
+TOP_IMPORTS = 10
+
+
+# ---- -X importtime ----
+def parse_importtime(stderr: str) -> list[tuple[int, int, int, str]]:
+    """(self us, cumulative us, depth, module) of every line of `-X importtime` output, in order."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((int(self_us), int(cumulative), depth, name.strip()))
+    return entries
+
+
+def measure_import(module: str) -> dict:
+    """Wall time of a fresh interpreter importing `module`, split by -X importtime."""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+
+    entries = parse_importtime(proc.stderr)
+    # output is post-order: the module's own line comes after all of its imports
+    end = max(i for i, e in enumerate(entries) if e[2] == 0 and e[3] == module)
+    start = end
+    while start > 0 and entries[start - 1][2] > 0:
+        start -= 1
+    children = [e for e in entries[start:end] if e[2] == 1]
+
+    return {
+        "wall_us": int(wall * 1e6),
+        "startup_us": sum(e[1] for e in entries[:start] if e[2] == 0),
+        "import_us": entries[end][1],
+        "line": entries[end],
+        "children": sorted(children, key=lambda e: e[1], reverse=True),
+    }
+
+
+def _importtime_line(entry: tuple[int, int, int, str]) -> str:
+    self_us, cumulative, depth, name = entry
+    return f"import time: {self_us:>9} | {cumulative:>10} | {'  ' * depth}{name}"
+
+
+def importtime(argv: list[str]):
+    parser = argparse.ArgumentParser(
+        prog=f"{PROG} importtime",
+        description="Import cost of each command, measured in a fresh interpreter.",
+    )
+    parser.add_argument("commands", nargs="*", metavar="command", help="default: all")
+    parser.add_argument("--top", type=int, default=TOP_IMPORTS, help="heaviest direct imports shown per command")
+    args = parser.parse_args(argv)
+    unknown = [c for c in args.commands if c not in COMMANDS]
+    if unknown:
+        parser.error(f"unknown command(s): {', '.join(unknown)}")
+
+    results = {}
+    for name in args.commands or COMMANDS:
+        results[name] = measure_import(COMMANDS[name][0])
+
+    for name, r in results.items():
+        print(f"# {name}")
+        print("import time: self [us] | cumulative | imported package")
+        for entry in r["children"][:args.top]:
+            print(_importtime_line(entry))
+        print(_importtime_line(r["line"]))
+        print()
+
+    print(f"{'command':<16} {'module':<36} {'startup ms':>10} {'import ms':>10} {'wall ms':>9}")
+    for name, r in sorted(results.items(), key=lambda kv: kv[1]["import_us"]):
+        print(
+            f"{name:<16} {COMMANDS[name][0]:<36} {r['startup_us'] / 1e3:>10.1f} "
+            f"{r['import_us'] / 1e3:>10.1f} {r['wall_us'] / 1e3:>9.1f}"
+        )
+
+
+# ---- Dispatch ----
+def _usage() -> str:
+    width = max(map(len, COMMANDS))
+    lines = [f"usage: {PROG} <command> [args...]", "", "commands:"]
+    lines += [f"  {name:<{width}}  {help_}" for name, (_, help_) in COMMANDS.items()]
+    lines += [f"  {'importtime':<{width}}  import cost of each command (-X importtime)", ""]
+    lines += [f"`{PROG} <command> --help` lists the arguments of a command."]
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(_usage())
+        return
+    name, rest = argv[0], argv[1:]
+
+    if name == "importtime":
+        importtime(rest)
+        return
+    if name not in COMMANDS:
+        sys.exit(f"{PROG}: unknown command {name!r}\n\n{_usage()}")
+
+    # as `python -m <module> rest...`: runpy sets argv[0] to the module's file,
+    # and the module is __main__ while it runs (so worker functions pickle)
+    sys.argv = [sys.argv[0], *rest]
+    runpy.run_module(COMMANDS[name][0], run_name="__main__", alter_sys=True)
@@ -0,0 +1,270 @@
+"""
+Data-quality audit of the raw archive (the checks of notebook 02).
+
+Per station:
+- rows, rows without a valid date, duplicate (station_name, date) rows
+- first / last date, distinct days and coverage of that span
+- gap events, longest gap and total missing days inside the span
+- range violations, one count per DailyObservation constraint
+  (the rules of validate_columnar.schema_rules, e.g. "humidity_max.le")
+
+Each station is parsed with the columnar casting helpers; per-row state is
+reduced to a station code and a day number per dated row. Duplicates and
+gaps then come from one sort of those two arrays and adjacent differences,
+without a Python loop per station.
+
+Outputs a Parquet table (one row per station) and a JSON summary with
+totals, per-rule violations, observed min / max and missing percentages:
+
+    python -m src.processing.audit
+    python -m src.processing.incremental --audit   # after every ingest
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.schema.observations import SCHEMA_VERSION, DailyObservation
+from src.processing.load_raw import RAW_JSON_DIR, load_source_records, raw_sources
+from src.processing.normalize import FIELD_MAP, normalize_columns
+from src.processing.validate_columnar import (
+    DATE_PARTS,
+    COMPARE,
+    STATION_KEY,
+    records_to_columns,
+    schema_rules,
+    str_column,
+)
+from src.utils import metrics
+from src.utils.casting import date_from_parts, to_int_column
+
+
+OUT_DIR = Path("data/processed")
+REPORT_PATH = OUT_DIR / "quality_report.parquet"
+SUMMARY_PATH = OUT_DIR / "quality_report.json"
+
+# numeric constraints of the schema (station_name length is a type check)
+RULES = [
+    (rule, field, op, bound)
+    for rule, field, op, bound in schema_rules(DailyObservation)
+    if field not in ("date", "station_name")
+]
+FIELDS = list(dict.fromkeys(field for _, field, _, _ in RULES))
+
+
+# ---- Per-station scan ----
+def scan_records(records) -> dict:
+    """
+    Reduce raw records to what the audit needs: station names, per-row
+    station code and day number of the dated rows, per-station row /
+    invalid-date / violation counts, and per-field missing counts and
+    observed min / max.
+    """
+    columns = records_to_columns(records)
+    n = len(columns[STATION_KEY])
+
+    stations, is_str = str_column(columns[STATION_KEY], strip=True)
+    stations = np.where(is_str, stations, "").astype(str)
+    names, codes = np.unique(stations, return_inverse=True)
+    n_stations = len(names)
+
+    parts = {f: to_int_column(columns[k]) for f, k in DATE_PARTS.items()}
+    all_parts = np.logical_and.reduce([p for _, p in parts.values()]) if n else np.zeros(0, bool)
+    dates, date_ok = date_from_parts(parts["year"][0], parts["month"][0], parts["day"][0], all_parts)
+
+    values = {**parts, **normalize_columns({k: columns[k] for k in FIELD_MAP})}
+
+    violations = np.zeros((n_stations, len(RULES)), dtype=np.int64)
+    for j, (_, field, op, bound) in enumerate(RULES):
+        x, present = values[field]
+        with np.errstate(invalid="ignore"):
+            bad = present & ~COMPARE[op](x, bound)
+        violations[:, j] = np.bincount(codes[bad], minlength=n_stations)
+
+    missing, lo, hi = {}, {}, {}
+    for field in FIELDS:
+        x, present = values[field]
+        missing[field] = int(n - present.sum())
+        lo[field] = float(x[present].min()) if present.any() else None
+        hi[field] = float(x[present].max()) if present.any() else None
+
+    return {
+        "names": names,
+        "n_rows": np.bincount(codes, minlength=n_stations),
+        "invalid_dates": np.bincount(codes[~date_ok], minlength=n_stations),
+        "violations": violations,
+        "codes": codes[date_ok].astype(np.int32),
+        "days": dates[date_ok].astype(np.int64).astype(np.int32),
+        "n": n,
+        "missing": missing,
+        "min": lo,
+        "max": hi,
+    }
+
+
+def scan_source(path: Path) -> dict:
+    """scan_records on one entry of raw_sources (picklable for worker processes)."""
+    return scan_records(list(load_source_records(path)))
+
+
+# ---- Combine ----
+def date_stats(codes: np.ndarray, days: np.ndarray, n_stations: int) -> dict[str, np.ndarray]:
+    """
+    Per-station duplicates, span and gaps from the (station code, day
+    number) of every dated row, in any order.
+    """
+    order = np.lexsort((days, codes))
+    c, d = codes[order], days[order].astype(np.int64)
+
+    same = c[1:] == c[:-1]
+    step = d[1:] - d[:-1]
+    nxt = c[1:]
+
+    dup = same & (step == 0)
+    gap = same & (step > 1)
+
+    rows = np.bincount(c, minlength=n_stations)
+    dated = rows > 0
+    first = np.zeros(n_stations, dtype=np.int64)
+    last = np.zeros(n_stations, dtype=np.int64)
+    if len(c):
+        starts = np.concatenate([[True], ~same])
+        ends = np.concatenate([~same, [True]])
+        first[c[starts]] = d[starts]
+        last[c[ends]] = d[ends]
+
+    max_gap = np.zeros(n_stations, dtype=np.int64)
+    np.maximum.at(max_gap, nxt[gap], step[gap] - 1)
+
+    duplicates = np.bincount(nxt[dup], minlength=n_stations)
+    n_days = rows - duplicates
+    expected = np.where(dated, last - first + 1, 0)
+    nat = np.iinfo(np.int64).min
+
+    return {
+        "duplicate_rows": duplicates,
+        "first_date": np.where(dated, first, nat).astype("datetime64[D]"),
+        "last_date": np.where(dated, last, nat).astype("datetime64[D]"),
+        "n_days": n_days,
+        "expected_days": expected,
+        "coverage": np.divide(n_days, expected, out=np.full(n_stations, np.nan), where=dated),
+        "gap_events": np.bincount(nxt[gap], minlength=n_stations),
+        "max_gap_days": max_gap,
+        "missing_total_days": np.bincount(nxt[gap], weights=step[gap] - 1, minlength=n_stations).astype(np.int64),
+    }
+
+
+def combine_scans(scans: list[dict]) -> tuple[pd.DataFrame, dict]:
+    """Per-station report and summary from the scans of all sources."""
+    names = np.unique(np.concatenate([s["names"] for s in scans])) if scans else np.array([], dtype=str)
+    n_stations = len(names)
+
+    n_rows = np.zeros(n_stations, dtype=np.int64)
+    invalid = np.zeros(n_stations, dtype=np.int64)
+    violations = np.zeros((n_stations, len(RULES)), dtype=np.int64)
+    codes, days = [], []
+    for s in scans:
+        to_global = np.searchsorted(names, s["names"])
+        np.add.at(n_rows, to_global, s["n_rows"])
+        np.add.at(invalid, to_global, s["invalid_dates"])
+        np.add.at(violations, to_global, s["violations"])
+        codes.append(to_global[s["codes"]])
+        days.append(s["days"])
+
+    codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+    days = np.concatenate(days) if days else np.zeros(0, dtype=np.int32)
+    dated = date_stats(codes, days, n_stations)
+
+    report = pd.DataFrame({
+        "station_name": names.astype(object),
+        "n_rows": n_rows,
+        "invalid_dates": invalid,
+        **dated,
+        "range_violations": violations.sum(axis=1),
+        **{rule: violations[:, j] for j, (rule, _, _, _) in enumerate(RULES)},
+    })
+    report = report.astype({c: "int32" for c in report.columns if report[c].dtype == np.int64})
+
+    n = sum(s["n"] for s in scans)
+    summary = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "schema_version": SCHEMA_VERSION,
+        "stations": n_stations,
+        "rows": int(n),
+        "invalid_dates": int(invalid.sum()),
+        "duplicate_rows": int(dated["duplicate_rows"].sum()),
+        "gap_events": int(dated["gap_events"].sum()),
+        "missing_total_days": int(dated["missing_total_days"].sum()),
+        "range_violations": {
+            rule: {"bound": bound, "violations": int(violations[:, j].sum())}
+            for j, (rule, _, _, bound) in enumerate(RULES)
+        },
+        "fields": {
+            field: {
+                "missing_pct": round(100 * sum(s["missing"][field] for s in scans) / n, 3) if n else None,
+                "min": min((s["min"][field] for s in scans if s["min"][field] is not None), default=None),
+                "max": max((s["max"][field] for s in scans if s["max"][field] is not None), default=None),
+            }
+            for field in FIELDS
+        },
+    }
+    return report, summary
+
+
+# ---- Entry points ----
+@metrics.instrument()
+def audit_raw(raw_dir: Path = RAW_JSON_DIR, workers: int = 1) -> tuple[pd.DataFrame, dict]:
+    """(per-station report, summary) of the raw archive; workers > 1 scans stations in processes."""
+    sources = raw_sources(raw_dir)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scans = list(pool.map(scan_source, sources))
+    else:
+        scans = [scan_source(path) for path in sources]
+    return combine_scans(scans)
+
+
+def write_report(report: pd.DataFrame, summary: dict, report_path: Path = REPORT_PATH, summary_path: Path = SUMMARY_PATH):
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report.to_parquet(report_path, index=False, compression="zstd")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+@metrics.instrument(profile=False)
+def main(raw_dir: Path = RAW_JSON_DIR, workers: int = 1, top: int = 10):
+    t0 = time.perf_counter()
+    report, summary = audit_raw(raw_dir, workers=workers)
+    write_report(report, summary)
+
+    print(
+        f"[OK] audited {summary['rows']} rows / {summary['stations']} stations "
+        f"in {time.perf_counter() - t0:.2f}s"
+    )
+    print(
+        f"[OK] invalid dates: {summary['invalid_dates']}, duplicates: {summary['duplicate_rows']}, "
+        f"gap events: {summary['gap_events']} ({summary['missing_total_days']} days), "
+        f"range violations: {int(report['range_violations'].sum())}"
+    )
+    worst = report.sort_values("missing_total_days", ascending=False).head(top)
+    worst = worst[worst["missing_total_days"] > 0]
+    if not worst.empty:
+        print(worst[["station_name", "coverage", "gap_events", "max_gap_days", "missing_total_days"]].to_string(index=False))
+    print(f"[OK] written: {REPORT_PATH}, {SUMMARY_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Data-quality audit of the raw archive.")
+    parser.add_argument("--raw-dir", type=Path, default=RAW_JSON_DIR)
+    parser.add_argument("--workers", type=int, default=1, help="scan stations in this many processes")
+    parser.add_argument("--top", type=int, default=10, help="stations with most missing days to print")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.enable_from_args(args)
+
+    main(raw_dir=args.raw_dir, workers=args.workers, top=args.top)
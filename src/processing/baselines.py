@@ -0,0 +1,125 @@
+"""
+Robust baselines (median + scaled MAD) for the anomaly stage, in NumPy.
+
+Rows are sorted once by (group, year) into one contiguous array. Every
+baseline is then the median / MAD of a contiguous run of that array:
+- pooled: one run per group (e.g. a station-month over all its years)
+- rolling: one run per row, the years of its group within `window`
+  (centred on the row's year, truncated at the ends of the record)
+
+Runs are gathered in blocks into a NaN-padded (runs, run length, features)
+array and reduced with np.nanmedian along the run axis, so there is no
+per-group Python callback and the cost grows linearly with the number of
+rows (times the run length).
+
+    z = robust_zscores(df, features, by=["station_name", "month"], window=None)
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+SCALE = 1.4826
+BLOCK_ELEMENTS = 1 << 23   # padded floats gathered at once (64 MB)
+
+# Grouping of the baseline: one per station (all months pooled), or one
+# per station and calendar month (seasonal)
+BASELINE_KEYS = {
+    "station": ["station_name"],
+    "station_month": ["station_name", "month"],
+}
+
+
+def _run_median_mad(values: np.ndarray, lo: np.ndarray, hi: np.ndarray, scale: float = SCALE):
+    """
+    Median and scaled MAD of the rows values[lo[i]:hi[i]] for every run i,
+    NaNs ignored. Returns two (n_runs, n_features) arrays; MAD 0 -> NaN.
+    """
+    n_runs, n_features = len(lo), values.shape[1]
+    med = np.full((n_runs, n_features), np.nan)
+    mad = np.full((n_runs, n_features), np.nan)
+    if n_runs == 0:
+        return med, mad
+
+    width = int((hi - lo).max())
+    if width == 0:
+        return med, mad
+    step = max(1, BLOCK_ELEMENTS // (width * n_features))
+    offsets = np.arange(width)
+
+    with warnings.catch_warnings():
+        # runs where a feature is all-NaN give NaN, as pandas' median does
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for s in range(0, n_runs, step):
+            e = min(s + step, n_runs)
+            idx = lo[s:e, None] + offsets
+            inside = idx < hi[s:e, None]
+            block = values[np.where(inside, idx, 0)]
+            block[~inside] = np.nan
+
+            m = np.nanmedian(block, axis=1)
+            med[s:e] = m
+            mad[s:e] = np.nanmedian(np.abs(block - m[:, None, :]), axis=1) * scale
+
+    mad[mad == 0] = np.nan  # avoid division by zero
+    return med, mad
+
+
+def group_codes(df: pd.DataFrame, by: list[str]) -> tuple[np.ndarray, int]:
+    """Dense group number of every row (groups in sorted key order) and the number of groups."""
+    codes = df.groupby(by, sort=True, observed=True, dropna=False).ngroup().to_numpy()
+    return codes, int(codes.max()) + 1 if len(codes) else 0
+
+
+def robust_baseline(
+    df: pd.DataFrame,
+    features: list[str],
+    by: list[str],
+    window: int = None,
+    scale: float = SCALE,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Per-row baseline median and scaled MAD, both (len(df), len(features))
+    and aligned with the rows of `df`.
+
+    window=None pools every row of a group; window=N uses, for a row of
+    year Y, the rows of its group with year in [Y - N // 2, Y + (N - 1) // 2].
+    """
+    values = df[features].to_numpy(dtype="float64", na_value=np.nan)
+    codes, n_groups = group_codes(df, by)
+
+    if window is None:
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=n_groups)
+        hi = np.cumsum(counts)
+        med, mad = _run_median_mad(values[order], hi - counts, hi, scale)
+        return med[codes], mad[codes]
+
+    if window < 1:
+        raise ValueError(f"window must be >= 1 year, got {window}")
+
+    years = df["year"].to_numpy(dtype="int64")
+    order = np.lexsort((years, codes))
+    key = codes[order].astype("int64") * 100_000 + years[order]
+    lo = np.searchsorted(key, key - window // 2, side="left")
+    hi = np.searchsorted(key, key + (window - 1) // 2, side="right")
+    med_sorted, mad_sorted = _run_median_mad(values[order], lo, hi, scale)
+
+    med = np.empty_like(med_sorted)
+    mad = np.empty_like(mad_sorted)
+    med[order] = med_sorted
+    mad[order] = mad_sorted
+    return med, mad
+
+
+def robust_zscores(
+    df: pd.DataFrame,
+    features: list[str],
+    by: list[str],
+    window: int = None,
+    scale: float = SCALE,
+) -> np.ndarray:
+    """(x - median) / MAD for every row and feature, in one broadcast."""
+    med, mad = robust_baseline(df, features, by, window=window, scale=scale)
+    return (df[features].to_numpy(dtype="float64", na_value=np.nan) - med) / mad
@@ -1,25 +1,59 @@
 from __future__ import annotations
 
 from pathlib import Path
+import argparse
 import json
+import os
+import shutil
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.processing.baselines import BASELINE_KEYS, robust_zscores
+from src.processing.datasets import (
+    COMMON_METADATA,
+    MAX_ROWS_PER_GROUP,
+    PARTITION_COLS,
+    SORT_KEYS,
+    iter_stations,
+    write_common_metadata,
+    write_fragments,
+)
+from src.utils import metrics
 
 # -----------------
 # Config (MVP)
 # -----------------
 IN_PATH = Path("data/processed/monthly.parquet")
 OUT_PATH = Path("data/processed/monthly_anomalies.parquet")
+PARTITIONED_OUT = OUT_PATH.parent / "monthly_anomalies"
 
 SCALE = 1.4826
 ZCAP = 10
 PCTL = 0.99
 
+# Baseline grouping (see BASELINE_KEYS): "station_month" scores each month
+# against the same calendar month of the station; "station" pools all months.
+# BASELINE_WINDOW: None = all years, N = rolling N-year window around the year
+BASELINE = "station_month"
+BASELINE_WINDOW = None
+
 MIN_DAYS_ROWS = 28
 MIN_MEAN_COVERAGE = 0.70
 MIN_FEATURES_PRESENT = 6
 TOP_K = 5
 
+# "json": top_features as a JSON string (what existing readers expect)
+# "struct": list<struct<feature, abs_z, z, value>> column in Parquet
+TOP_FEATURES_FORMATS = ("json", "struct")
+TOP_FEATURE_TYPE = pa.list_(pa.struct([
+    ("feature", pa.string()),
+    ("abs_z", pa.float64()),
+    ("z", pa.float64()),
+    ("value", pa.float64()),
+]))
+
 CORE_FEATURES = [
     "precipitation_sum",
     "precipitation_rainy_days",
@@ -32,6 +66,14 @@ CORE_FEATURES = [
     "pressure_mean_mean",
 ]
 
+OUTPUT_COLUMNS = [
+    "station_name", "year", "month",
+    "anomaly_score", "threshold_p99", "is_anomaly",
+    "n_days_rows", "n_features_present", "n_features_used",
+    "mean_coverage_core", "gate_reason",
+    "top_features",
+]
+
 FEATURE_TO_COVERAGE = {
     "precipitation_sum": "precipitation_coverage",
     "precipitation_rainy_days": "precipitation_coverage",
@@ -48,14 +90,8 @@ FEATURE_TO_COVERAGE = {
 # -----------------
 # Helpers
 # -----------------
-def compute_baseline(group: pd.DataFrame, features: list[str]) -> pd.Series:
-    med = group[features].median()
-    mad = (group[features] - med).abs().median() * SCALE
-    mad = mad.replace(0, np.nan)  # avoid division by zero
-    return pd.concat([med.add_suffix("_median"), mad.add_suffix("_mad")])
-
-
 def top_features_row(row: pd.Series, features: list[str]) -> str:
+    """Scalar reference for a single row (same output as the JSON format)."""
     contrib = []
     for f in features:
         z = row.get(f"{f}_z")
@@ -66,11 +102,96 @@ def top_features_row(row: pd.Series, features: list[str]) -> str:
     return json.dumps(contrib[:TOP_K])
 
 
-def main() -> None:
-    if not IN_PATH.exists():
-        raise FileNotFoundError(f"Missing input: {IN_PATH}")
+def rank_top_features(df: pd.DataFrame, features: list[str], k: int = TOP_K):
+    """
+    Row-wise top-k of |z| over the `<feature>_z` columns.
+
+    Returns (idx, abs_z, z, raw, n): (n_rows, k) arrays holding the feature
+    index and values per slot, plus the number of filled slots per row.
+    Ties keep feature order and missing z-scores go last, as in
+    top_features_row.
+    """
+    z = df[[f"{f}_z" for f in features]].to_numpy(dtype="float64", na_value=np.nan)
+    raw = df[features].to_numpy(dtype="float64", na_value=np.nan)
+
+    abs_z = np.abs(z)
+    present = ~np.isnan(z)
+    key = np.where(present, -abs_z, np.inf)
+    idx = np.argsort(key, axis=1, kind="stable")[:, :k]
+
+    n = np.minimum(present.sum(axis=1), k)
+    return (
+        idx,
+        np.take_along_axis(abs_z, idx, axis=1),
+        np.take_along_axis(z, idx, axis=1),
+        np.take_along_axis(raw, idx, axis=1),
+        n,
+    )
+
+
+def top_features_json(ranked, features: list[str]) -> list[str]:
+    idx, abs_z, z, raw, n = ranked
+    names = np.asarray(features, dtype=object)[idx].tolist()
+    raw = np.where(np.isnan(raw), None, raw).tolist()
+    abs_z, z = abs_z.tolist(), z.tolist()
+    return [
+        json.dumps([(names[i][j], abs_z[i][j], z[i][j], raw[i][j]) for j in range(n_i)])
+        for i, n_i in enumerate(n.tolist())
+    ]
 
-    df = pd.read_parquet(IN_PATH)
+
+def top_features_struct(ranked, features: list[str]) -> pa.ListArray:
+    idx, abs_z, z, raw, n = ranked
+    filled = np.arange(idx.shape[1]) < n[:, None]
+
+    items = pa.StructArray.from_arrays(
+        [
+            pa.array(np.asarray(features, dtype=object)[idx[filled]], type=pa.string()),
+            pa.array(abs_z[filled]),
+            pa.array(z[filled]),
+            pa.array(raw[filled], from_pandas=True),
+        ],
+        fields=list(TOP_FEATURE_TYPE.value_type),
+    )
+    offsets = pa.array(np.concatenate([[0], np.cumsum(n)]).astype("int32"))
+    return pa.ListArray.from_arrays(offsets, items, type=TOP_FEATURE_TYPE)
+
+
+@metrics.instrument()
+def top_features(df: pd.DataFrame, features: list[str], fmt: str = "json") -> pd.Series:
+    """top_features column for `df` in one of TOP_FEATURES_FORMATS."""
+    if fmt not in TOP_FEATURES_FORMATS:
+        raise ValueError(f"Unknown top_features format: {fmt!r} (expected one of {TOP_FEATURES_FORMATS})")
+
+    ranked = rank_top_features(df, features)
+    if fmt == "json":
+        return pd.Series(top_features_json(ranked, features), index=df.index)
+    # plain lists of dicts: Parquet stores them as list<struct>, and they
+    # round-trip through read_parquet (ArrowDtype nested columns do not)
+    return pd.Series(top_features_struct(ranked, features).to_pylist(), index=df.index, dtype=object)
+
+
+@metrics.instrument()
+def build_anomalies(
+    df: pd.DataFrame,
+    top_features_format: str = "json",
+    baseline: str = BASELINE,
+    baseline_window: int = BASELINE_WINDOW,
+    verbose: bool = True,
+) -> pd.DataFrame:
+    """
+    Score monthly rows. Every step is per station (gating, baseline,
+    threshold), so scoring a subset of stations gives the same rows as
+    scoring the whole table and filtering.
+
+    top_features_format picks the explanation column layout, see
+    TOP_FEATURES_FORMATS; baseline / baseline_window pick the robust
+    baseline, see BASELINE and BASELINE_WINDOW.
+    """
+    if baseline not in BASELINE_KEYS:
+        raise ValueError(f"Unknown baseline: {baseline!r} (expected one of {tuple(BASELINE_KEYS)})")
+
+    df = df.copy()
 
     # ---- Sanity checks
     for c in ["station_name", "year", "month", "n_days_rows"]:
@@ -104,70 +225,198 @@ def main() -> None:
     df.loc[days_ok & feat_ok & ~cov_ok, "gate_reason"] = "LOW_COVERAGE"
 
     df_e = df[df["is_evaluable"]].copy()
-    print(f"[OK] evaluable rows: {len(df_e)} / {len(df)}")
-
-    # ---- Baseline per station (median + MAD)
-    # include_groups=False silences pandas deprecation (works on recent pandas)
-    try:
-        baseline = (
-            df_e.groupby("station_name", group_keys=False)
-            .apply(compute_baseline, features=core, include_groups=False)
-        )
-    except TypeError:
-        baseline = (
-            df_e.groupby("station_name", group_keys=False)
-            .apply(compute_baseline, features=core)
-        )
+    if verbose:
+        print(f"[OK] evaluable rows: {len(df_e)} / {len(df)}")
 
-    df_z = df_e.merge(baseline.reset_index(), on="station_name", how="left")
+    if df_e.empty:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
 
-    # ---- Robust z-scores
-    z_cols: list[str] = []
-    for f in core:
-        zc = f"{f}_z"
-        df_z[zc] = (df_z[f] - df_z[f"{f}_median"]) / df_z[f"{f}_mad"]
-        z_cols.append(zc)
+    # ---- Robust z-scores against the baseline (median + MAD)
+    with metrics.stage("build_anomalies.baseline"):
+        z = robust_zscores(df_e, core, by=BASELINE_KEYS[baseline], window=baseline_window, scale=SCALE)
 
     # ---- Cap z-scores (fix for near-zero dispersion vars dominating)
-    for zc in z_cols:
-        df_z[zc] = df_z[zc].clip(-ZCAP, ZCAP)
+    z_cols = [f"{f}_z" for f in core]
+    z = np.ascontiguousarray(np.clip(z, -ZCAP, ZCAP))
+    df_z = pd.concat([df_e.reset_index(drop=True), pd.DataFrame(z, columns=z_cols)], axis=1)
 
     # ---- Anomaly score
-    df_z["n_features_used"] = df_z[z_cols].notna().sum(axis=1)
-    df_z["anomaly_score"] = df_z[z_cols].abs().mean(axis=1, skipna=True)
+    # mean |z| per row from the C-contiguous array: each row is summed on its
+    # own, so the result does not depend on which other rows (stations) are
+    # in the frame (DataFrame.mean(axis=1) with NaNs does)
+    used = ~np.isnan(z)
+    n_used = used.sum(axis=1)
+    abs_sum = np.where(used, np.abs(z), 0.0).sum(axis=1)
+    df_z["n_features_used"] = n_used
+    df_z["anomaly_score"] = np.divide(abs_sum, n_used, out=np.full(len(z), np.nan), where=n_used > 0)
 
     # ---- Threshold per station (p99)
-    thresholds = (
-        df_z.groupby("station_name")["anomaly_score"]
-        .quantile(PCTL)
-        .rename("threshold_p99")
-        .reset_index()
-    )
+    with metrics.stage("build_anomalies.threshold"):
+        thresholds = (
+            df_z.groupby("station_name")["anomaly_score"]
+            .quantile(PCTL)
+            .rename("threshold_p99")
+            .reset_index()
+        )
 
-    df_a = df_z.merge(thresholds, on="station_name", how="left")
+        df_a = df_z.merge(thresholds, on="station_name", how="left")
     df_a["is_anomaly"] = df_a["anomaly_score"] >= df_a["threshold_p99"]
 
     # ---- Explanations
-    df_a["top_features"] = df_a.apply(lambda r: top_features_row(r, core), axis=1)
+    df_a["top_features"] = top_features(df_a, core, fmt=top_features_format)
+
+    cols_to_save = [c for c in OUTPUT_COLUMNS if c in df_a.columns]
+    return df_a[cols_to_save]
+
+
+def _anomaly_table(df_a: pd.DataFrame, schema: pa.Schema = None) -> pa.Table:
+    """Arrow table of one scored station, cast to the schema of the first one."""
+    if schema is not None:
+        return pa.Table.from_pandas(df_a, schema=schema, preserve_index=False)
+
+    table = pa.Table.from_pandas(df_a, preserve_index=False)
+    # struct top_features: a station with no z-scores would infer list<null>
+    if pa.types.is_list(table.schema.field("top_features").type):
+        i = table.schema.get_field_index("top_features")
+        table = table.set_column(i, "top_features", table["top_features"].cast(TOP_FEATURE_TYPE))
+    return table
+
+
+@metrics.instrument()
+def build_anomalies_streaming(
+    in_path: Path,
+    out_path: Path,
+    top_features_format: str = "json",
+    baseline: str = BASELINE,
+    baseline_window: int = BASELINE_WINDOW,
+    partitioned_root: Path = None,
+) -> dict:
+    """
+    build_anomalies one station at a time: read the station's monthly rows
+    (see iter_stations), score them and append them to `out_path`, and to
+    the partitioned dataset at `partitioned_root` if given. Since every step
+    is per station, the output is the same as scoring the whole table, but
+    peak memory is bounded by the largest station.
+
+    Returns counts: stations, rows, evaluable, anomalies.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+
+    if partitioned_root is not None and (Path(partitioned_root) / COMMON_METADATA).exists():
+        shutil.rmtree(partitioned_root)
+
+    counts = {"stations": 0, "rows": 0, "evaluable": 0, "anomalies": 0}
+    writer, pending = None, []
+
+    def flush():
+        writer.write_table(pa.concat_tables(pending), row_group_size=MAX_ROWS_PER_GROUP)
+        pending.clear()
 
-    # ---- Save output
-    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        for _, monthly in iter_stations(in_path):
+            df_a = build_anomalies(
+                monthly,
+                top_features_format=top_features_format,
+                baseline=baseline,
+                baseline_window=baseline_window,
+                verbose=False,
+            )
+            counts["stations"] += 1
+            counts["rows"] += len(monthly)
+            counts["evaluable"] += len(df_a)
+            if df_a.empty:
+                continue
+            counts["anomalies"] += int(df_a["is_anomaly"].sum())
+
+            table = _anomaly_table(df_a, writer.schema if writer is not None else None)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            if partitioned_root is not None:
+                write_fragments(table, partitioned_root, PARTITION_COLS["monthly_anomalies"])
+
+            # batch small stations into full row groups
+            pending.append(table)
+            if sum(len(t) for t in pending) >= MAX_ROWS_PER_GROUP:
+                flush()
+
+        if pending:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_parquet(tmp_path, index=False)
+    elif partitioned_root is not None:
+        write_common_metadata(
+            writer.schema,
+            partitioned_root,
+            PARTITION_COLS["monthly_anomalies"],
+            SORT_KEYS["monthly_anomalies"],
+        )
+    os.replace(tmp_path, out_path)
+    return counts
 
-    cols_to_save = [
-        "station_name", "year", "month",
-        "anomaly_score", "threshold_p99", "is_anomaly",
-        "n_days_rows", "n_features_present", "n_features_used",
-        "mean_coverage_core", "gate_reason",
-        "top_features",
-    ]
-    cols_to_save = [c for c in cols_to_save if c in df_a.columns]
 
-    df_a[cols_to_save].to_parquet(OUT_PATH, index=False)
+@metrics.instrument(profile=False)
+def main(
+    partitioned: bool = False,
+    top_features_format: str = "json",
+    baseline: str = BASELINE,
+    baseline_window: int = BASELINE_WINDOW,
+) -> None:
+    if not IN_PATH.exists():
+        raise FileNotFoundError(f"Missing input: {IN_PATH}")
+
+    counts = build_anomalies_streaming(
+        IN_PATH,
+        OUT_PATH,
+        top_features_format=top_features_format,
+        baseline=baseline,
+        baseline_window=baseline_window,
+        partitioned_root=PARTITIONED_OUT if partitioned else None,
+    )
 
-    pct = df_a["is_anomaly"].mean() * 100
+    print(f"[OK] evaluable rows: {counts['evaluable']} / {counts['rows']} ({counts['stations']} stations)")
+    pct = counts["anomalies"] / counts["evaluable"] * 100 if counts["evaluable"] else float("nan")
     print(f"[OK] anomalies: {pct:.2f}%")
     print(f"[OK] written: {OUT_PATH}")
 
+    if partitioned:
+        print(f"[OK] partitioned dataset: {PARTITIONED_OUT}")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Score monthly anomalies.")
+    parser.add_argument("--partitioned", action="store_true", help="also write data/processed/monthly_anomalies/ (by station)")
+    parser.add_argument(
+        "--top-features",
+        choices=TOP_FEATURES_FORMATS,
+        default="json",
+        help="top_features as JSON strings (default, compatible) or typed list<struct> columns",
+    )
+    parser.add_argument(
+        "--baseline",
+        choices=tuple(BASELINE_KEYS),
+        default=BASELINE,
+        help="robust baseline per station and calendar month (default) or per station over all months",
+    )
+    parser.add_argument(
+        "--baseline-window",
+        type=int,
+        default=BASELINE_WINDOW,
+        metavar="YEARS",
+        help="rolling baseline over this many years around each year (default: all years)",
+    )
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.enable_from_args(args)
+
+    main(
+        partitioned=args.partitioned,
+        top_features_format=args.top_features,
+        baseline=args.baseline,
+        baseline_window=args.baseline_window,
+    )
\ No newline at end of file
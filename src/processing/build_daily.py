@@ -1,29 +1,248 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import argparse
+import os
+import shutil
+import tempfile
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-from src.processing.load_raw import load_all_raw_records
-from src.processing.validate import record_to_daily_observation
+from src.processing.load_raw import (
+    RAW_JSON_DIR,
+    load_all_raw_records,
+    load_source_records,
+    raw_sources,
+    stream_all_raw_records,
+    iter_raw_batches,
+)
+from src.processing.validate import daily_observation_rows
+from src.processing.validate_columnar import validate_records, validate_batches
+from src.processing.datasets import (
+    COMMON_METADATA,
+    MAX_ROWS_PER_GROUP,
+    PARTITION_COLS,
+    SORT_KEYS,
+    compact_daily,
+    compact_daily_table,
+    compact_write_options,
+    decode_columns,
+    write_common_metadata,
+    write_daily,
+    write_fragments,
+    write_ipc,
+    write_processed,
+)
+from src.utils import metrics
 
 
 OUT_DIR = Path("data/processed")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+ENGINES = ("pydantic", "columnar")
+
+
+@metrics.instrument()
+def build_daily_pydantic(records) -> pd.DataFrame:
+    return pd.DataFrame(daily_observation_rows(records))
+
+
+@metrics.instrument()
+def build_daily_columnar(records=None, batches=None) -> pd.DataFrame:
+    if batches is not None:
+        df, rejections = validate_batches(batches)
+    else:
+        df, rejections = validate_records(records)
+
+    for rule, count in rejections.items():
+        if count:
+            print(f"[INFO] rejected by {rule}: {count}")
+
+    return df
+
+
+# ---- Parallel mode ----
+# One shard per raw station source. Workers validate their shard and write
+# it as an uncompressed Arrow IPC part; the parts are then streamed into
+# daily.parquet in raw_sources order (same rows, order and dtypes as the
+# serial path) and/or split into the partitioned dataset by the workers.
+def build_daily_shard(source: Path, part_path: Path, engine: str, compact: bool) -> dict:
+    """Worker: one raw source -> one IPC part. Returns row / rejection counts."""
+    records = load_source_records(source)
+    if engine == "columnar":
+        df, rejections = validate_records(records)
+    else:
+        df, rejections = build_daily_pydantic(records), {}
+
+    if df.empty:
+        return {"part": None, "rows": 0, "rejections": rejections}
+
+    table = compact_daily_table(df) if compact else pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(part_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return {"part": str(part_path), "rows": len(df), "rejections": rejections}
+
+
+def _read_part(part: str, schema: pa.Schema) -> pa.Table:
+    with pa.memory_map(part) as source:
+        return pa.ipc.open_file(source).read_all().cast(schema)
+
+
+def _partition_part(part: str, schema: pa.Schema, root: Path) -> pa.Schema:
+    """Worker: write the daily partitions of one part."""
+    table = decode_columns(_read_part(part, schema), PARTITION_COLS["daily"])
+    table = table.sort_by([(c, "ascending") for c in SORT_KEYS["daily"]])
+    return write_fragments(table, root, PARTITION_COLS["daily"]).schema
+
+
+def unify_part_schemas(parts: list[str]) -> pa.Schema:
+    """
+    Common schema of the parts, widened like pandas does when it builds one
+    frame from all records (int + float -> float, all-null stays null).
+    """
+    schemas = []
+    for part in parts:
+        with pa.memory_map(part) as source:
+            schemas.append(pa.ipc.open_file(source).schema)
+    return pa.unify_schemas(schemas, promote_options="permissive")
 
-def main():
-    rows = []
 
-    for raw in load_all_raw_records():
-        obs = record_to_daily_observation(raw)
-        if obs is not None:
-            rows.append(obs.model_dump())
+def combine_parts(parts: list[str], schema: pa.Schema, out_path: Path, compact: bool = False):
+    """Stream the parts into one Parquet file; memory is bounded by the largest part."""
+    options = compact_write_options(schema) if compact else {}
+    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+    with pq.ParquetWriter(tmp_path, schema, **options) as writer:
+        for part in parts:
+            writer.write_table(_read_part(part, schema), row_group_size=MAX_ROWS_PER_GROUP)
+    os.replace(tmp_path, out_path)
 
-    df = pd.DataFrame(rows)
 
+@metrics.instrument()
+def build_daily_parallel(
+    out_path: Path,
+    engine: str = "columnar",
+    workers: int = None,
+    compact: bool = False,
+    partitioned_root: Path = None,
+    raw_dir: Path = RAW_JSON_DIR,
+) -> int:
+    """
+    Build daily.parquet (and optionally the partitioned dataset at
+    `partitioned_root`) with a process pool sharded by station. Returns the
+    number of rows.
+    """
+    out_path = Path(out_path)
+    sources = raw_sources(raw_dir)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=".daily_parts_", dir=out_path.parent))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                build_daily_shard,
+                sources,
+                [tmp_dir / f"part-{i:05d}.arrow" for i in range(len(sources))],
+                [engine] * len(sources),
+                [compact] * len(sources),
+            ))
+
+            rejections = {}
+            for result in results:
+                for rule, count in result["rejections"].items():
+                    rejections[rule] = rejections.get(rule, 0) + count
+            for rule, count in rejections.items():
+                if count:
+                    print(f"[INFO] rejected by {rule}: {count}")
+
+            parts = [r["part"] for r in results if r["part"] is not None]
+            if not parts:
+                # nothing valid: same empty frame as the serial path
+                empty = build_daily_columnar(records=[]) if engine == "columnar" else build_daily_pydantic([])
+                write_daily(empty, out_path, compact=compact)
+                return 0
+
+            schema = unify_part_schemas(parts)
+
+            if partitioned_root is not None:
+                root = Path(partitioned_root)
+                if (root / COMMON_METADATA).exists():
+                    shutil.rmtree(root)
+                written = list(pool.map(_partition_part, parts, [schema] * len(parts), [root] * len(parts)))
+                write_common_metadata(written[0], root, PARTITION_COLS["daily"], SORT_KEYS["daily"])
+
+        combine_parts(parts, schema, out_path, compact=compact)
+        return sum(r["rows"] for r in results)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@metrics.instrument(profile=False)
+def main(
+    engine: str = "pydantic",
+    stream: bool = False,
+    partitioned: bool = False,
+    compact: bool = False,
+    workers: int = 1,
+    ipc: bool = False,
+):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine!r} (expected one of {ENGINES})")
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
     out_path = OUT_DIR / "daily.parquet"
-    df.to_parquet(out_path, index=False)
 
-    print(f"[OK] Written {len(df)} rows to {out_path}")
+    if workers > 1:
+        root = OUT_DIR / "daily" if partitioned else None
+        n = build_daily_parallel(out_path, engine=engine, workers=workers, compact=compact, partitioned_root=root)
+        print(f"[OK] Written {n} rows to {out_path} (engine={engine}, workers={workers}{', compact' if compact else ''})")
+        if partitioned:
+            print(f"[OK] partitioned dataset: {root}")
+        if ipc:
+            write_ipc_cache(out_path)
+        return
+
+    if engine == "columnar" and stream:
+        df = build_daily_columnar(batches=iter_raw_batches())
+    elif engine == "columnar":
+        df = build_daily_columnar(records=load_all_raw_records())
+    else:
+        records = stream_all_raw_records() if stream else load_all_raw_records()
+        df = build_daily_pydantic(records)
+
+    with metrics.stage("build_daily.write_parquet"):
+        write_daily(df, out_path, compact=compact)
+
+    print(f"[OK] Written {len(df)} rows to {out_path} (engine={engine}{', compact' if compact else ''})")
+
+    if partitioned:
+        print(f"[OK] partitioned dataset: {write_processed(compact_daily(df) if compact else df, 'daily', OUT_DIR)}")
+
+    if ipc:
+        write_ipc_cache(out_path)
+
+
+def write_ipc_cache(out_path: Path):
+    # from the file just written, so the cache has its exact (default or compact) layout
+    with metrics.stage("build_daily.write_ipc"):
+        path = write_ipc(pq.read_table(out_path), out_path)
+    print(f"[OK] Arrow IPC cache: {path}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build daily.parquet from raw ARPA JSON.")
+    parser.add_argument("--engine", choices=ENGINES, default="pydantic")
+    parser.add_argument("--stream", action="store_true", help="read raw JSON incrementally (bounded memory)")
+    parser.add_argument("--partitioned", action="store_true", help="also write data/processed/daily/ (station/year)")
+    parser.add_argument("--compact", action="store_true", help="narrow dtypes and categorical station_name (docs/schema.md)")
+    parser.add_argument("--workers", type=int, default=1, help="processes; > 1 shards the raw sources by station")
+    parser.add_argument("--ipc", action="store_true", help="also write data/processed/daily.arrow (memory-mapped cache)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.enable_from_args(args)
+
+    main(
+        engine=args.engine,
+        stream=args.stream,
+        partitioned=args.partitioned,
+        compact=args.compact,
+        workers=args.workers,
+        ipc=args.ipc,
+    )
@@ -1,16 +1,17 @@
 from pathlib import Path
+import argparse
+import numpy as np
 import pandas as pd
 
+from src.processing.datasets import read_table, write_ipc, write_processed
+from src.utils import metrics
+
 IN_PATH = Path("data/processed/daily.parquet")
 OUT_DIR = Path("data/processed")
 OUT_PATH = OUT_DIR / "monthly.parquet"
 
 
-# ---- Helpers ----
-def _count_valid(s: pd.Series) -> int:
-    return int(s.notna().sum())
-
-
+@metrics.instrument()
 def build_monthly(df: pd.DataFrame) -> pd.DataFrame:
     # Ensure expected core columns exist
     required = {"station_name", "year", "month"}
@@ -40,18 +41,17 @@ def build_monthly(df: pd.DataFrame) -> pd.DataFrame:
     df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
     df["month"] = pd.to_numeric(df["month"], errors="coerce").astype("Int64")
 
+    # Compact daily.parquet stores float32 / Int16 measures: aggregate in
+    # float64 so monthly.parquet keeps its dtypes
+    for c in measures:
+        if df[c].dtype == "float32" or isinstance(df[c].dtype, pd.api.extensions.ExtensionDtype):
+            df[c] = df[c].to_numpy(dtype="float64", na_value=np.nan)
+
     # Total days observed in that month (rows in daily for that station-month)
     # Note: if you have duplicate days, this will count duplicates. If you want strictly unique days:
     # total_days = df.groupby(keys)["date"].nunique()
     keys = ["station_name", "year", "month"]
 
-    total_days = (
-        df.groupby(keys, dropna=False)
-          .size()
-          .rename("n_days_rows")
-          .reset_index()
-    )
-
     # Base aggregations
     agg_map = {}
     for c in measures:
@@ -65,41 +65,36 @@ def build_monthly(df: pd.DataFrame) -> pd.DataFrame:
         else:
             agg_map[c] = ["mean", "min", "max", "std"]
 
-    monthly = (
-        df.groupby(keys, dropna=False)
-          .agg(agg_map)
-    )
-
-    # Flatten multi-index columns
-    monthly.columns = [
-        f"{col}_{stat}" for col, stat in monthly.columns.to_flat_index()
-    ]
-    monthly = monthly.reset_index()
-
-    # Valid-day counts per variable (coverage)
-    valid_counts = {}
-    for c in measures:
-        valid_counts[f"{c}_n_valid_days"] = (
-            df.groupby(keys, dropna=False)[c].apply(_count_valid)
-        )
-    valid_counts_df = pd.DataFrame(valid_counts).reset_index()
+    # Valid-day counts per variable (coverage): "count" is the non-null count
+    fused_map = {c: stats + ["count"] for c, stats in agg_map.items()}
 
     # Rainy days (precipitation > 0) — only if precipitation exists
-    rainy_days_df = None
     if "precipitation" in df.columns:
-        rainy_days_df = (
-            df.assign(_rainy=(pd.to_numeric(df["precipitation"], errors="coerce") > 0))
-              .groupby(keys, dropna=False)["_rainy"]
-              .sum()
-              .rename("precipitation_rainy_days")
-              .reset_index()
-        )
-
-    # Merge all together
-    out = monthly.merge(total_days, on=keys, how="left")
-    out = out.merge(valid_counts_df, on=keys, how="left")
-    if rainy_days_df is not None:
-        out = out.merge(rainy_days_df, on=keys, how="left")
+        df["_rainy"] = pd.to_numeric(df["precipitation"], errors="coerce") > 0
+        fused_map["_rainy"] = ["sum"]
+
+    # Single grouped pass: the grouping is computed once and every statistic
+    # runs as a cython kernel over it (no per-group Python callbacks, no merges)
+    # observed=True: a categorical station_name (compact daily.parquet) must
+    # not expand into every station x year x month combination
+    grouped = df.groupby(keys, dropna=False, observed=True)
+    stats = grouped.agg(fused_map)
+    stats.columns = [f"{col}_{stat}" for col, stat in stats.columns.to_flat_index()]
+    stats["n_days_rows"] = grouped.size()
+
+    # Same column layout as before: stats, n_days_rows, *_n_valid_days, rainy days
+    renames = {f"{c}_count": f"{c}_n_valid_days" for c in measures}
+    renames["_rainy_sum"] = "precipitation_rainy_days"
+    stats = stats.rename(columns=renames)
+
+    ordered = [f"{c}_{stat}" for c, stat_list in agg_map.items() for stat in stat_list]
+    ordered += ["n_days_rows"] + [f"{c}_n_valid_days" for c in measures]
+    if "precipitation" in df.columns:
+        ordered.append("precipitation_rainy_days")
+
+    out = stats[ordered].reset_index()
+    if isinstance(out["station_name"].dtype, pd.CategoricalDtype):
+        out["station_name"] = out["station_name"].astype(str)
 
     # Coverage ratios (optional but useful)
     for c in measures:
@@ -113,20 +108,36 @@ def build_monthly(df: pd.DataFrame) -> pd.DataFrame:
     return out
 
 
-def main():
+@metrics.instrument(profile=False)
+def main(partitioned: bool = False, ipc: bool = False):
     if not IN_PATH.exists():
         raise FileNotFoundError(f"Missing input parquet: {IN_PATH}")
 
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_parquet(IN_PATH)
+    with metrics.stage("build_monthly.read_parquet"):
+        df = read_table(IN_PATH)
 
     monthly = build_monthly(df)
-    monthly.to_parquet(OUT_PATH, index=False)
+    with metrics.stage("build_monthly.write_parquet"):
+        monthly.to_parquet(OUT_PATH, index=False)
 
     print(f"[OK] monthly rows: {len(monthly)}")
     print(f"[OK] written: {OUT_PATH}")
 
+    if partitioned:
+        print(f"[OK] partitioned dataset: {write_processed(monthly, 'monthly', OUT_DIR)}")
+
+    if ipc:
+        print(f"[OK] Arrow IPC cache: {write_ipc(monthly, OUT_PATH)}")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build monthly.parquet from daily.parquet.")
+    parser.add_argument("--partitioned", action="store_true", help="also write data/processed/monthly/ (by station)")
+    parser.add_argument("--ipc", action="store_true", help="also write data/processed/monthly.arrow (memory-mapped cache)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.enable_from_args(args)
+
+    main(partitioned=args.partitioned, ipc=args.ipc)
\ No newline at end of file
@@ -0,0 +1,251 @@
+"""
+Top-k most similar months for every month of every station.
+
+Distances are the weighted 1-D Wasserstein distances of
+src/processing/quantile_index.py (same gates, weights and tie order as
+QuantileIndex.similar_months). Each station's reference x candidate
+matrix is computed in BLOCK_SIZE x BLOCK_SIZE tiles, keeping only a
+running top-k per reference, so memory does not grow with N^2 for long
+histories. Stations are spread over a process pool: workers get the path
+of the index's Arrow IPC file and a row range, and memory-map it, so they
+share the sketches through the OS page cache instead of each unpickling
+its own copy.
+
+    python -m src.processing.build_similar_months --top-k 10 --workers 4
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from src.processing import quantile_index
+from src.processing.datasets import ipc_is_current, ipc_path, open_ipc, read_table, write_ipc_file
+from src.processing.quantile_index import QuantileIndex, MIN_SAMPLES, weighted_total
+
+
+OUT_PATH = Path("data/processed/similar_months.parquet")
+
+TOP_K = 10
+BLOCK_SIZE = 64
+
+
+# ---- Per-station job ----
+def _tile_distances(ref, cand, widths, min_samples):
+    """(len(ref), len(cand), n_vars) distances between two tiles of sketches."""
+    sk_r, n_r = ref
+    sk_c, n_c = cand
+    d = np.empty((len(sk_r), len(sk_c), sk_r.shape[1]))
+    for j in range(sk_r.shape[1]):
+        d[:, :, j] = np.abs(sk_r[:, None, j, :] - sk_c[None, :, j, :]) @ widths
+    too_few = (n_r[:, None, :] < min_samples) | (n_c[None, :, :] < min_samples)
+    d[too_few] = np.nan
+    return d
+
+
+def station_neighbours(
+    sketch: np.ndarray,
+    n_samples: np.ndarray,
+    is_reference: np.ndarray,
+    is_candidate: np.ndarray,
+    widths: np.ndarray,
+    weights: np.ndarray,
+    top_k: int = TOP_K,
+    min_samples: int = MIN_SAMPLES,
+    block_size: int = BLOCK_SIZE,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Top-k candidates for every reference month of one station (rows are
+    station-local). Returns (ref, cand, total, per_var) with one entry per
+    neighbour, ordered by reference and then by distance.
+    """
+    refs = np.flatnonzero(is_reference)
+    cands = np.flatnonzero(is_candidate)
+
+    out_ref, out_cand, out_total, out_var = [], [], [], []
+    for r0 in range(0, len(refs), block_size):
+        r_rows = refs[r0:r0 + block_size]
+        ref_tile = (sketch[r_rows], n_samples[r_rows])
+
+        # running top-k per reference, in (distance, candidate order)
+        best_cand = np.empty((len(r_rows), 0), dtype="int64")
+        best_total = np.empty((len(r_rows), 0))
+        best_var = np.empty((len(r_rows), 0, sketch.shape[1]))
+
+        for c0 in range(0, len(cands), block_size):
+            c_rows = cands[c0:c0 + block_size]
+            per_var = _tile_distances(ref_tile, (sketch[c_rows], n_samples[c_rows]), widths, min_samples)
+
+            total, _ = weighted_total(per_var.reshape(-1, per_var.shape[2]), weights)
+            total = total.reshape(len(r_rows), len(c_rows))
+            total[r_rows[:, None] == c_rows[None, :]] = np.nan   # a month is not its own neighbour
+
+            cand_ids = np.broadcast_to(c_rows, total.shape)
+            merged_total = np.concatenate([best_total, total], axis=1)
+            merged_cand = np.concatenate([best_cand, cand_ids], axis=1)
+            merged_var = np.concatenate([best_var, per_var], axis=1)
+
+            key = np.where(np.isnan(merged_total), np.inf, merged_total)
+            order = np.argsort(key, axis=1, kind="stable")[:, :top_k]
+            best_total = np.take_along_axis(merged_total, order, axis=1)
+            best_cand = np.take_along_axis(merged_cand, order, axis=1)
+            best_var = np.take_along_axis(merged_var, order[:, :, None], axis=1)
+
+        keep = ~np.isnan(best_total)
+        out_ref.append(np.broadcast_to(r_rows[:, None], best_total.shape)[keep])
+        out_cand.append(best_cand[keep])
+        out_total.append(best_total[keep])
+        out_var.append(best_var[keep])
+
+    if not out_ref:
+        return (np.empty(0, dtype="int64"), np.empty(0, dtype="int64"), np.empty(0), np.empty((0, sketch.shape[1])))
+    return (
+        np.concatenate(out_ref),
+        np.concatenate(out_cand),
+        np.concatenate(out_total),
+        np.concatenate(out_var),
+    )
+
+
+def _station_job(args) -> pd.DataFrame:
+    station, keys, sketch, n_samples, widths, weights, variables, top_k, min_samples, block_size = args
+    ref, cand, total, per_var = station_neighbours(
+        sketch,
+        n_samples,
+        keys["is_reference"].to_numpy(),
+        keys["is_candidate"].to_numpy(),
+        widths,
+        weights,
+        top_k=top_k,
+        min_samples=min_samples,
+        block_size=block_size,
+    )
+
+    years, months = keys["year"].to_numpy(), keys["month"].to_numpy()
+    out = pd.DataFrame({
+        "station_name": station,
+        "reference_year": years[ref],
+        "reference_month": months[ref],
+        "rank": _ranks(ref),
+        "candidate_year": years[cand],
+        "candidate_month": months[cand],
+    })
+    for j, v in enumerate(variables):
+        out[f"w_{v}"] = per_var[:, j]
+    out["distance_total"] = total
+    out["n_valid_vars"] = np.isfinite(per_var).sum(axis=1)
+    return out
+
+
+def output_columns(variables: list[str]) -> list[str]:
+    """Columns of the _station_job frames (and of similar_months.parquet)."""
+    return [
+        "station_name", "reference_year", "reference_month", "rank",
+        "candidate_year", "candidate_month",
+        *(f"w_{v}" for v in variables),
+        "distance_total", "n_valid_vars",
+    ]
+
+
+def _mapped_station_job(args) -> pd.DataFrame:
+    """_station_job on rows [start, stop) of a memory-mapped index file."""
+    path, station, start, stop, weights, top_k, min_samples, block_size = args
+    index = QuantileIndex.from_table(open_ipc(path).slice(start, stop - start))
+    return _station_job((
+        station, index.keys, index.sketch, index.n_samples, index.widths,
+        weights, index.variables, top_k, min_samples, block_size,
+    ))
+
+
+def _ranks(ref: np.ndarray) -> np.ndarray:
+    """1-based position within each run of equal (sorted) reference ids."""
+    if len(ref) == 0:
+        return np.empty(0, dtype="int64")
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(ref)) + 1])
+    run_start = np.repeat(starts, np.diff(np.concatenate([starts, [len(ref)]])))
+    return np.arange(len(ref)) - run_start + 1
+
+
+# ---- Batch ----
+def build_similar_months(
+    index: QuantileIndex,
+    top_k: int = TOP_K,
+    n_workers: int = 1,
+    block_size: int = BLOCK_SIZE,
+    min_samples: int = MIN_SAMPLES,
+    variable_weights: dict = None,
+    index_path: Path = None,
+) -> pd.DataFrame:
+    """
+    `index_path` is the Parquet file `index` was loaded from: with workers,
+    its IPC cache is memory-mapped when current, otherwise the index is
+    written to a temporary IPC file first.
+    """
+    weights = index.weights(variable_weights)
+    stations = [(station, index.station_rows(station)) for station in index.stations()]
+
+    if n_workers > 1:
+        with tempfile.TemporaryDirectory() as tmp:
+            if index_path is not None and ipc_is_current(index_path):
+                path = ipc_path(index_path)
+            else:
+                path = write_ipc_file(index.to_table(), Path(tmp) / "quantile_index.arrow")
+            jobs = [
+                (path, station, rows.start, rows.stop, weights, top_k, min_samples, block_size)
+                for station, rows in stations
+            ]
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                frames = list(pool.map(_mapped_station_job, jobs))
+    else:
+        frames = [
+            _station_job((
+                station,
+                index.keys.iloc[rows].reset_index(drop=True),
+                index.sketch[rows],
+                index.n_samples[rows],
+                index.widths,
+                weights,
+                index.variables,
+                top_k,
+                min_samples,
+                block_size,
+            ))
+            for station, rows in stations
+        ]
+
+    if not frames:
+        return pd.DataFrame(columns=output_columns(index.variables))
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(top_k: int = TOP_K, n_workers: int = 1, block_size: int = BLOCK_SIZE):
+    index_path = quantile_index.OUT_PATH
+    if quantile_index.is_current(index_path):
+        index = QuantileIndex.load(index_path)
+    else:
+        # missing, or built before the last daily / monthly run
+        index = QuantileIndex.build(
+            read_table(quantile_index.DAILY_PATH),
+            read_table(quantile_index.MONTHLY_PATH),
+        )
+        index.save(index_path)
+        print(f"[OK] quantile index rebuilt: {index_path}")
+
+    df = build_similar_months(index, top_k=top_k, n_workers=n_workers, block_size=block_size, index_path=index_path)
+
+    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(OUT_PATH, index=False)
+    print(f"[OK] {len(df)} neighbours for {df.groupby(['station_name', 'reference_year', 'reference_month']).ngroups} months")
+    print(f"[OK] written: {OUT_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Top-k similar months for every station-month.")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--workers", type=int, default=1, help="process pool size (stations are split across workers)")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="months per tile side")
+    args = parser.parse_args()
+
+    main(top_k=args.top_k, n_workers=args.workers, block_size=args.block_size)
@@ -0,0 +1,217 @@
+"""
+Long-term trends of monthly.parquet: Theil–Sen slope and Mann–Kendall test
+per (station_name, month, variable), e.g. "July mean temperature at
+Udine, 1995–2024".
+
+The series are laid out as one NaN-padded (series, year, variable) array,
+with years at a fixed offset from the first year of the table. Every pair
+of years (i < j) is then the same pair of columns for all series, so the
+pairwise slopes (y[j] - y[i]) / (j - i), their median (Theil–Sen) and the
+sum of their signs (Mann–Kendall S) are computed for blocks of series in
+a few NumPy operations.
+
+Long spans have L(L-1)/2 pairs: above MAX_PAIRS a fixed random subset of
+pairs is used for every series. The slope is then the median of the
+sampled slopes, and S is the sampled mean sign scaled to all valid pairs
+(the variance keeps the exact formula with tie correction).
+
+    python -m src.processing.build_trends
+"""
+from pathlib import Path
+import argparse
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from src.processing.build_anomalies import CORE_FEATURES, FEATURE_TO_COVERAGE, MIN_DAYS_ROWS
+from src.processing.datasets import read_table
+from src.utils import metrics
+
+IN_PATH = Path("data/processed/monthly.parquet")
+OUT_DIR = Path("data/processed")
+OUT_PATH = OUT_DIR / "trends.parquet"
+
+TREND_FEATURES = CORE_FEATURES
+MIN_COVERAGE = 0.70     # monthly value used only if its feature coverage reaches this
+MIN_YEARS = 10          # series with fewer valid years get no trend
+MAX_PAIRS = 2000        # pairs of years per series before subsampling
+SEED = 0
+ALPHA = 0.05
+BLOCK_ELEMENTS = 1 << 23
+
+
+# ---- Kernels ----
+def year_pairs(n_years: int, max_pairs: int = MAX_PAIRS, seed: int = SEED) -> tuple[np.ndarray, np.ndarray]:
+    """(i, j) column pairs with i < j, all of them or a fixed random subset of max_pairs."""
+    i, j = np.triu_indices(n_years, k=1)
+    if len(i) > max_pairs:
+        keep = np.sort(np.random.default_rng(seed).choice(len(i), size=max_pairs, replace=False))
+        i, j = i[keep], j[keep]
+    return i, j
+
+
+def _tie_term(y: np.ndarray) -> np.ndarray:
+    """Σ t(t-1)(2t+5) over groups of tied values, for each (series, variable) of y (B, L, F)."""
+    b, n_years, f = y.shape
+    flat = np.sort(np.moveaxis(y, 1, 2).reshape(b * f, n_years), axis=1)   # NaN last
+    new_run = np.ones_like(flat, dtype=bool)
+    new_run[:, 1:] = flat[:, 1:] != flat[:, :-1]
+    run = np.cumsum(new_run, axis=1) - 1 + np.arange(b * f)[:, None] * n_years
+    t = np.bincount(run.ravel(), weights=~np.isnan(flat.ravel()), minlength=b * f * n_years)
+    return (t * (t - 1) * (2 * t + 5)).reshape(b * f, n_years).sum(axis=1).reshape(b, f)
+
+
+def theil_sen_mann_kendall(y: np.ndarray, max_pairs: int = MAX_PAIRS, seed: int = SEED) -> dict[str, np.ndarray]:
+    """
+    Trend statistics of every (series, variable) of y, shape (G, L, F):
+    values by year offset, NaN for missing years. Returns (G, F) arrays.
+    """
+    g, n_years, f = y.shape
+    i, j = year_pairs(n_years, max_pairs, seed)
+    dx = (j - i).astype("float64")[None, :, None]
+
+    out = {name: np.full((g, f), np.nan) for name in ("slope", "mk_s", "n_pairs")}
+    step = max(1, BLOCK_ELEMENTS // max(1, len(i) * f))
+    with warnings.catch_warnings():
+        # series with no valid pair get a NaN slope
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for s in range(0, g, step):
+            e = min(s + step, g)
+            d = y[s:e, j, :] - y[s:e, i, :]     # (B, P, F)
+            valid = ~np.isnan(d)
+            out["slope"][s:e] = np.nanmedian(d / dx, axis=1)
+            out["mk_s"][s:e] = np.nansum(np.sign(d), axis=1)
+            out["n_pairs"][s:e] = valid.sum(axis=1)
+
+    n = (~np.isnan(y)).sum(axis=1).astype("float64")
+    all_pairs = n * (n - 1) / 2
+    # subsampled pairs: scale the sampled sign sum to all valid pairs
+    s_stat = np.where(out["n_pairs"] > 0, out["mk_s"] * all_pairs / np.maximum(out["n_pairs"], 1), 0.0)
+
+    var = (n * (n - 1) * (2 * n + 5) - _tie_term(y)) / 18
+    z = np.where(var > 0, (s_stat - np.sign(s_stat)) / np.sqrt(np.where(var > 0, var, 1)), 0.0)
+    p = np.vectorize(math.erfc, otypes=[float])(np.abs(z) / math.sqrt(2)) if z.size else z
+
+    return {
+        "slope": out["slope"],
+        "mk_s": s_stat,
+        "mk_z": z,
+        "p_value": p,
+        "kendall_tau": np.divide(s_stat, all_pairs, out=np.full_like(s_stat, np.nan), where=all_pairs > 0),
+        "n_years": n,
+        "n_pairs": out["n_pairs"],
+    }
+
+
+# ---- Table ----
+def trend_inputs(df: pd.DataFrame, features: list[str]) -> tuple[pd.DataFrame, np.ndarray, int]:
+    """
+    Series keys (station_name, month), the (series, year, feature) value
+    array and its first year. Monthly values below MIN_DAYS_ROWS days or
+    MIN_COVERAGE feature coverage are left out (NaN).
+    """
+    df = df.sort_values(["station_name", "month", "year"], kind="stable")
+    years = df["year"].to_numpy(dtype="int64")
+    first_year = int(years.min())
+
+    grouped = df.groupby(["station_name", "month"], sort=True, observed=True)
+    codes = grouped.ngroup().to_numpy()
+    keys = grouped.size().reset_index()[["station_name", "month"]]
+
+    values = df[features].to_numpy(dtype="float64", na_value=np.nan)
+    days_ok = df["n_days_rows"].to_numpy() >= MIN_DAYS_ROWS
+    for k, feature in enumerate(features):
+        ok = days_ok
+        cov = FEATURE_TO_COVERAGE.get(feature)
+        if cov in df.columns:
+            ok = ok & (df[cov].to_numpy(dtype="float64", na_value=0.0) >= MIN_COVERAGE)
+        values[~ok, k] = np.nan
+
+    y = np.full((len(keys), int(years.max()) - first_year + 1, len(features)), np.nan)
+    y[codes, years - first_year] = values
+    return keys, y, first_year
+
+
+@metrics.instrument()
+def build_trends(
+    df: pd.DataFrame,
+    features: list[str] = None,
+    min_years: int = MIN_YEARS,
+    max_pairs: int = MAX_PAIRS,
+) -> pd.DataFrame:
+    """One row per (station_name, month, variable) with at least `min_years` valid years."""
+    for c in ["station_name", "year", "month", "n_days_rows"]:
+        if c not in df.columns:
+            raise ValueError(f"Missing required column in monthly.parquet: {c}")
+
+    features = [c for c in (features or TREND_FEATURES) if c in df.columns]
+    columns = [
+        "station_name", "month", "variable", "n_years", "first_year", "last_year",
+        "slope", "slope_per_decade", "kendall_tau", "mk_s", "mk_z", "p_value", "trend", "n_pairs",
+    ]
+    if df.empty or not features:
+        return pd.DataFrame(columns=columns)
+
+    keys, y, first_year = trend_inputs(df, features)
+    stats = theil_sen_mann_kendall(y, max_pairs=max_pairs)
+
+    present = ~np.isnan(y)
+    first = first_year + present.argmax(axis=1)
+    last = first_year + y.shape[1] - 1 - present[:, ::-1].argmax(axis=1)
+
+    g, f = stats["slope"].shape
+    out = pd.DataFrame({
+        "station_name": np.repeat(keys["station_name"].to_numpy(), f),
+        "month": np.repeat(keys["month"].to_numpy(), f).astype("int64"),
+        "variable": np.tile(np.asarray(features, dtype=object), g),
+        "n_years": stats["n_years"].ravel().astype("int64"),
+        "first_year": first.ravel(),
+        "last_year": last.ravel(),
+        "slope": stats["slope"].ravel(),
+        "slope_per_decade": stats["slope"].ravel() * 10,
+        "kendall_tau": stats["kendall_tau"].ravel(),
+        "mk_s": stats["mk_s"].ravel(),
+        "mk_z": stats["mk_z"].ravel(),
+        "p_value": stats["p_value"].ravel(),
+        "n_pairs": stats["n_pairs"].ravel().astype("int64"),
+    })
+
+    out = out[out["n_years"] >= min_years].reset_index(drop=True)
+    significant = out["p_value"] < ALPHA
+    out["trend"] = np.where(
+        significant & (out["mk_s"] > 0), "increasing",
+        np.where(significant & (out["mk_s"] < 0), "decreasing", "no trend"),
+    )
+    return out[columns]
+
+
+@metrics.instrument(profile=False)
+def main(min_years: int = MIN_YEARS, max_pairs: int = MAX_PAIRS):
+    if not IN_PATH.exists():
+        raise FileNotFoundError(f"Missing input parquet: {IN_PATH}")
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    with metrics.stage("build_trends.read_parquet"):
+        df = read_table(IN_PATH)
+
+    trends = build_trends(df, min_years=min_years, max_pairs=max_pairs)
+    with metrics.stage("build_trends.write_parquet"):
+        trends.to_parquet(OUT_PATH, index=False)
+
+    n_sig = int((trends["trend"] != "no trend").sum())
+    print(f"[OK] trend rows: {len(trends)} ({n_sig} significant at p < {ALPHA})")
+    print(f"[OK] written: {OUT_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build trends.parquet (Theil–Sen + Mann–Kendall) from monthly.parquet.")
+    parser.add_argument("--min-years", type=int, default=MIN_YEARS, help="valid years needed for a trend")
+    parser.add_argument("--max-pairs", type=int, default=MAX_PAIRS, help="pairs of years per series before subsampling")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.enable_from_args(args)
+
+    main(min_years=args.min_years, max_pairs=args.max_pairs)
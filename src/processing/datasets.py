@@ -0,0 +1,436 @@
+"""
+Hive-partitioned Parquet datasets for the processed tables, and a reader
+that pushes station / year / month predicates down to the Parquet scan.
+
+    data/processed/daily/station_name=Piancavallo/year=2004/part-0.parquet
+    data/processed/monthly/station_name=Piancavallo/part-0.parquet
+
+Rows are sorted before writing, so row-group min/max statistics on the
+non-partition keys (month, date) are tight and prune well. A
+`_common_metadata` file keeps the full schema (including the partition
+columns' types and the original column order).
+
+monthly / anomalies are partitioned by station only: a year level would
+mean 12-row files, and year predicates prune through row-group
+statistics just as well.
+
+iter_stations streams a table (directory or sorted single file) one
+station at a time, for steps whose memory should be bounded by the
+largest station.
+
+daily.parquet can also be written in a compact layout (write_daily with
+compact=True): the storage types of COMPACT_DAILY_TYPES, dictionary-encoded
+station names and explicit per-column Parquet encodings. pd.read_parquet
+gives back a categorical station_name, int8/int16 date parts and float32
+measures.
+
+daily / monthly (and the quantile index) can also have an Arrow IPC cache
+next to the Parquet file (daily.arrow, written by write_ipc): uncompressed,
+one record batch. read_table memory-maps it instead of decoding the
+Parquet file, so processes reading the same table share one copy in the
+OS page cache. Worker processes open_ipc the file themselves and slice
+their rows rather than receiving pickled arrays (build_similar_months).
+"""
+from pathlib import Path
+from typing import get_args
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.schema.layout import COMPACT_DAILY_TYPES, SCHEMA_VERSION
+
+
+PROCESSED_DIR = Path("data/processed")
+
+PARTITION_COLS = {
+    "daily": ["station_name", "year"],
+    "monthly": ["station_name"],
+    "monthly_anomalies": ["station_name"],
+}
+
+SORT_KEYS = {
+    "daily": ["station_name", "year", "month", "day"],
+    "monthly": ["station_name", "year", "month"],
+    "monthly_anomalies": ["station_name", "year", "month"],
+}
+
+COMPRESSION = "zstd"
+MAX_ROWS_PER_GROUP = 64 * 1024
+
+COMMON_METADATA = "_common_metadata"
+_PARTITION_KEY = b"fvg.partition_cols"
+_SORT_KEY = b"fvg.sort_by"
+_LAYOUT_KEY = b"fvg.layout"
+_SCHEMA_VERSION_KEY = b"fvg.schema_version"
+_IPC_SOURCE_KEY = b"fvg.ipc_source"
+
+IPC_SUFFIX = ".arrow"
+
+# Parquet encodings of the compact daily layout (station_name is dictionary
+# encoded): sorted date parts delta-encode to almost nothing, and splitting
+# float bytes into streams lets zstd find the repeated exponents.
+COMPACT_DAILY_ENCODINGS = {
+    name: "DELTA_BINARY_PACKED" if arrow.startswith(("int", "date")) else "BYTE_STREAM_SPLIT"
+    for name, arrow in COMPACT_DAILY_TYPES.items()
+    if not arrow.startswith("dictionary")
+}
+
+
+def dataset_path(name: str, base: Path = PROCESSED_DIR) -> Path:
+    """
+    The partitioned directory or the single file, whichever was written
+    last: a step run without --partitioned (or incremental) rewrites only
+    the single file, and the older partitioned copy must not shadow it.
+    `_common_metadata` is written after the partitions, so its mtime dates
+    the directory.
+    """
+    base = Path(base)
+    single = base / f"{name}.parquet"
+    metadata = base / name / COMMON_METADATA
+    if not metadata.exists():
+        return single
+    if single.exists() and single.stat().st_mtime_ns > metadata.stat().st_mtime_ns:
+        return single
+    return base / name
+
+
+def write_partitioned(
+    df: pd.DataFrame,
+    root: Path,
+    partition_cols: list[str],
+    sort_by: list[str] = None,
+    replace: bool = True,
+):
+    """
+    Write `df` as a hive-partitioned dataset under `root`.
+
+    replace=True drops a previous dataset at `root` first; replace=False
+    only rewrites the partitions present in `df` (useful for partial
+    refreshes).
+    """
+    root = Path(root)
+    if sort_by:
+        df = df.sort_values(sort_by, kind="stable")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    if replace and (root / COMMON_METADATA).exists():
+        shutil.rmtree(root)
+
+    table = write_fragments(table, root, partition_cols)
+    write_common_metadata(table.schema, root, partition_cols, sort_by)
+
+
+def decode_columns(table: pa.Table, columns: list[str]) -> pa.Table:
+    """Dictionary-encoded `columns` cast back to their value type (hive keys, sorting)."""
+    for name in columns:
+        field = table.schema.field(name)
+        if pa.types.is_dictionary(field.type):
+            i = table.schema.get_field_index(name)
+            table = table.set_column(i, name, pc.cast(table[name], field.type.value_type))
+    return table
+
+
+def write_fragments(table: pa.Table, root: Path, partition_cols: list[str]) -> pa.Table:
+    """
+    Write the partitions of `table` under `root`, replacing only those
+    partitions, without `_common_metadata` (see write_common_metadata).
+    Several processes can write disjoint partitions of the same dataset.
+    Returns the table as written (dictionary partition columns decoded).
+    """
+    table = decode_columns(table, partition_cols)
+    partitioning = ds.partitioning(
+        pa.schema([table.schema.field(c) for c in partition_cols]),
+        flavor="hive",
+    )
+    file_options = ds.ParquetFileFormat().make_write_options(
+        compression=COMPRESSION,
+        write_statistics=True,
+    )
+
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet",
+        partitioning=partitioning,
+        file_options=file_options,
+        max_rows_per_group=MAX_ROWS_PER_GROUP,
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+    return table
+
+
+def write_common_metadata(schema: pa.Schema, root: Path, partition_cols: list[str], sort_by: list[str] = None):
+    """`_common_metadata` of a dataset: full schema, partition columns and sort keys."""
+    metadata = dict(schema.metadata or {})
+    metadata[_PARTITION_KEY] = json.dumps(partition_cols).encode("utf-8")
+    metadata[_SORT_KEY] = json.dumps(sort_by or []).encode("utf-8")
+    pq.write_metadata(schema.with_metadata(metadata), Path(root) / COMMON_METADATA)
+
+
+def write_processed(df: pd.DataFrame, name: str, base: Path = PROCESSED_DIR) -> Path:
+    """Partitioned copy of one of the processed tables, with default layout."""
+    root = Path(base) / name
+    write_partitioned(df, root, PARTITION_COLS[name], sort_by=SORT_KEYS[name])
+    return root
+
+
+# ---- Compact daily layout ----
+def _nullable(name: str) -> bool:
+    # pydantic only when a compact table is built (build_daily already has it)
+    from src.schema.observations import DailyObservation
+
+    return type(None) in get_args(DailyObservation.model_fields[name].annotation)
+
+
+def compact_daily(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` (daily rows as built by build_daily) with the COMPACT_DAILY_TYPES
+    storage types on the pandas side: categorical station_name (sorted
+    categories, so sorting by station is unchanged), int8/int16 date parts,
+    float32 measures and a nullable Int16 wind direction.
+    """
+    out = {}
+    for name in df.columns:
+        arrow = COMPACT_DAILY_TYPES.get(name)
+        col = df[name]
+        if arrow is None or arrow == "date32":
+            out[name] = col
+        elif arrow.startswith("dictionary"):
+            out[name] = pd.Categorical(col, categories=sorted(col.dropna().unique()))
+        elif arrow.startswith("float"):
+            out[name] = pd.to_numeric(col, errors="coerce").astype(arrow)
+        elif _nullable(name):
+            out[name] = pd.to_numeric(col, errors="coerce").astype(arrow.capitalize())
+        else:
+            out[name] = col.astype(arrow)
+    return pd.DataFrame(out, index=df.index)
+
+
+def compact_daily_table(df: pd.DataFrame) -> pa.Table:
+    table = pa.Table.from_pandas(compact_daily(df), preserve_index=False)
+    if "date" in table.column_names and table.schema.field("date").type != pa.date32():
+        table = table.set_column(table.column_names.index("date"), "date", pc.cast(table["date"], pa.date32()))
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[_LAYOUT_KEY] = b"compact"
+    metadata[_SCHEMA_VERSION_KEY] = SCHEMA_VERSION.encode("utf-8")
+    return table.replace_schema_metadata(metadata)
+
+
+def compact_write_options(schema: pa.Schema) -> dict:
+    """pq.write_table / ParquetWriter options of the compact daily layout."""
+    return {
+        "compression": COMPRESSION,
+        "use_dictionary": [c for c in schema.names if c not in COMPACT_DAILY_ENCODINGS],
+        "column_encoding": {c: e for c, e in COMPACT_DAILY_ENCODINGS.items() if c in schema.names},
+        "write_statistics": True,
+    }
+
+
+def write_daily(df: pd.DataFrame, path: Path, compact: bool = False):
+    """Write daily.parquet in the default (pandas dtypes) or compact layout."""
+    if not compact:
+        df.to_parquet(path, index=False)
+        return
+
+    table = compact_daily_table(df)
+    pq.write_table(table, path, row_group_size=MAX_ROWS_PER_GROUP, **compact_write_options(table.schema))
+
+
+def is_compact(path: Path) -> bool:
+    """True if the Parquet file at `path` was written by write_daily(compact=True)."""
+    metadata = pq.read_schema(path).metadata or {}
+    return metadata.get(_LAYOUT_KEY) == b"compact"
+
+
+def _predicate(column: str, value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, range)):
+        return ds.field(column).isin(list(value))
+    return ds.field(column) == value
+
+
+def open_dataset(path: Path) -> ds.Dataset:
+    path = Path(path)
+    if path.is_dir():
+        schema = pq.read_schema(path / COMMON_METADATA)
+        partition_cols = json.loads(schema.metadata[_PARTITION_KEY])
+        partitioning = ds.partitioning(
+            pa.schema([schema.field(c) for c in partition_cols]),
+            flavor="hive",
+        )
+        return ds.dataset(path, format="parquet", schema=schema, partitioning=partitioning)
+    return ds.dataset(path, format="parquet")
+
+
+def read_dataset(
+    path: Path,
+    station=None,
+    year=None,
+    month=None,
+    columns: list[str] = None,
+) -> pd.DataFrame:
+    """
+    Read a processed table (partitioned directory or single file) keeping
+    only matching rows. Each predicate takes a scalar or a list of values.
+    Partition pruning skips whole directories; row-group statistics skip
+    the rest.
+    """
+    dataset = open_dataset(path)
+
+    filt = None
+    for column, value in (("station_name", station), ("year", year), ("month", month)):
+        expr = _predicate(column, value)
+        if expr is not None:
+            filt = expr if filt is None else filt & expr
+
+    table = dataset.to_table(columns=columns, filter=filt)
+
+    # fragments are scanned in no particular order: restore the written one
+    meta = dataset.schema.metadata or {}
+    sort_by = [c for c in json.loads(meta.get(_SORT_KEY, b"[]")) if c in table.column_names]
+    if sort_by:
+        table = table.sort_by([(c, "ascending") for c in sort_by])
+
+    df = table.to_pandas()
+
+    # hive partition columns come back last; restore the written column order
+    order = [c["name"] for c in (dataset.schema.pandas_metadata or {}).get("columns", [])]
+    order = [c for c in order if c in df.columns]
+    if columns is None and len(order) == len(df.columns):
+        df = df[order]
+    return df
+
+
+def iter_stations(path: Path, columns: list[str] = None, batch_size: int = MAX_ROWS_PER_GROUP):
+    """
+    Yield (station_name, DataFrame) for every station of a processed table,
+    in station order, with only one station's rows in memory.
+
+    A partitioned directory is read one station partition at a time. A
+    single file is streamed in record batches and must be sorted by
+    station_name, as the processed tables are written; ValueError otherwise.
+    """
+    path = Path(path)
+    if columns is not None and "station_name" not in columns:
+        columns = ["station_name", *columns]
+
+    if path.is_dir():
+        dataset = open_dataset(path)
+        stations = {
+            ds.get_partition_keys(fragment.partition_expression)["station_name"]
+            for fragment in dataset.get_fragments()
+        }
+        for station in sorted(stations):
+            yield station, read_dataset(path, station=station, columns=columns)
+        return
+
+    pending, current, seen = [], None, set()
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+        names = batch.column(batch.schema.get_field_index("station_name"))
+        if pa.types.is_dictionary(names.type):
+            names = names.dictionary_decode()
+        names = names.to_numpy(zero_copy_only=False)
+
+        starts = [0, *(np.flatnonzero(names[1:] != names[:-1]) + 1), len(names)]
+        for start, stop in zip(starts[:-1], starts[1:]):
+            name = names[start]
+            if name != current:
+                if pending:
+                    yield current, pa.Table.from_batches(pending).to_pandas()
+                if name in seen:
+                    raise ValueError(f"{path} is not sorted by station_name ({name!r} appears twice)")
+                pending, current = [], name
+                seen.add(name)
+            pending.append(batch.slice(start, stop - start))
+
+    if pending:
+        yield current, pa.Table.from_batches(pending).to_pandas()
+
+
+def read_processed(name: str, base: Path = PROCESSED_DIR, **predicates) -> pd.DataFrame:
+    """read_dataset on data/processed/<name> (directory or .parquet)."""
+    return read_dataset(dataset_path(name, base), **predicates)
+
+
+# ---- Arrow IPC cache ----
+def ipc_path(path: Path) -> Path:
+    """The Arrow IPC cache next to a processed Parquet file (daily.parquet -> daily.arrow)."""
+    return Path(path).with_suffix(IPC_SUFFIX)
+
+
+def _source_signature(path: Path) -> bytes:
+    st = Path(path).stat()
+    return f"{st.st_size}:{st.st_mtime_ns}".encode("utf-8")
+
+
+def _nan_floats(table: pa.Table) -> pa.Table:
+    """Float nulls as NaN, so float columns have no validity bitmap (as pandas reads them anyway)."""
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        if pa.types.is_floating(field.type) and column.null_count:
+            table = table.set_column(i, field, pc.fill_null(column, pa.scalar(float("nan"), field.type)))
+    return table
+
+
+def write_ipc(data, parquet_path: Path) -> Path:
+    """
+    Write the Arrow IPC cache of the Parquet file just written at
+    `parquet_path`, from the same DataFrame or Table. One record batch,
+    uncompressed; the Parquet file's size and mtime are stored in the
+    schema metadata so a stale cache is never read.
+    """
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_IPC_SOURCE_KEY] = _source_signature(parquet_path)
+    return write_ipc_file(table.replace_schema_metadata(metadata), ipc_path(parquet_path))
+
+
+def write_ipc_file(table: pa.Table, path: Path) -> Path:
+    """`table` as an uncompressed, single-batch Arrow IPC file, float nulls stored as NaN."""
+    table = _nan_floats(table).combine_chunks()
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=max(1, table.num_rows))
+    tmp.replace(path)
+    return path
+
+
+def ipc_is_current(parquet_path: Path) -> bool:
+    """True if the IPC cache of `parquet_path` exists and was written from its current content."""
+    path = ipc_path(parquet_path)
+    if not path.exists() or not Path(parquet_path).exists():
+        return False
+    metadata = pa.ipc.open_file(pa.memory_map(str(path), "r")).schema.metadata or {}
+    return metadata.get(_IPC_SOURCE_KEY) == _source_signature(parquet_path)
+
+
+def open_ipc(path: Path, columns: list[str] = None) -> pa.Table:
+    """
+    Memory-map an Arrow IPC file. The buffers of the returned Table point
+    into the mapping: nothing is read until it is touched, and processes
+    mapping the same file share its pages through the OS cache.
+    """
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    return table if columns is None else table.select(columns)
+
+
+def read_table(path: Path, columns: list[str] = None) -> pd.DataFrame:
+    """
+    pd.read_parquet(path, columns=columns), served from the memory-mapped
+    IPC cache when it is current. Numeric columns of the frame are then
+    read-only views of the mapping (pandas copies on write).
+    """
+    if ipc_is_current(path):
+        return open_ipc(ipc_path(path), columns).to_pandas(split_blocks=True)
+    return pd.read_parquet(path, columns=columns)
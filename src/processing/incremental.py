@@ -0,0 +1,346 @@
+"""
+Incremental rebuild of daily.parquet, monthly.parquet and
+monthly_anomalies.parquet, and of what is built from them.
+
+Every raw station-year is fingerprinted (the manifest sha256 for chunked
+stations, the sha256 of the same JSON Lines payload for legacy files).
+Only changed station-years are re-validated; daily.parquet is spliced
+block by block so its row order matches a full build. Monthly groups and
+anomaly stations touched by those rows are the only ones recomputed.
+
+Derived artifacts that exist are kept in step: the Arrow IPC caches, the
+partitioned copies (daily/, monthly/, monthly_anomalies/, rewritten from
+the new tables), trends.parquet (recomputed from monthly), and
+quantile_index.parquet / similar_months.parquet, which are per station:
+only the affected stations are rebuilt and spliced in.
+
+    python -m src.processing.incremental          # nightly refresh
+    python -m src.processing.incremental --full   # rebuild everything
+    python -m src.processing.incremental --audit  # and, if anything changed, re-audit the raw archive
+"""
+from pathlib import Path
+import argparse
+import hashlib
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.schema.observations import SCHEMA_VERSION
+from src.processing import audit as audit_step
+from src.processing import build_anomalies as anomalies_step
+from src.processing import build_monthly as monthly_step
+from src.processing import build_similar_months as similar_step
+from src.processing import build_trends as trends_step
+from src.processing import quantile_index
+from src.processing.build_daily import OUT_DIR
+from src.processing.datasets import (
+    COMMON_METADATA,
+    compact_daily,
+    ipc_path,
+    is_compact,
+    read_table,
+    write_daily,
+    write_ipc,
+    write_processed,
+)
+from src.processing.quantile_index import QuantileIndex
+from src.processing.load_raw import RAW_JSON_DIR, raw_sources, iter_station_years
+from src.processing.validate_columnar import validate_records, concat_validated
+from src.utils.raw_store import RawStationStore, chunk_payload
+
+
+DAILY_PATH = OUT_DIR / "daily.parquet"
+STATE_PATH = OUT_DIR / "incremental_state.json"
+
+GROUP_KEYS = ["station_name", "year", "month"]
+
+
+# ---- State ----
+def load_state(path: Path = STATE_PATH) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state: dict, path: Path = STATE_PATH):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(path)
+
+
+def _source_id(path: Path) -> str:
+    return path.name if path.is_dir() else path.stem
+
+
+def scan_inputs(raw_dir: Path, state: dict) -> tuple[list[tuple[str, str]], dict]:
+    """
+    Ordered (key, fingerprint) for every raw station-year, key being
+    "<source>/<year>". Legacy files whose size and mtime did not change
+    reuse the fingerprints from the previous state instead of being parsed.
+    """
+    prev = {e["key"]: e["fingerprint"] for e in state.get("keys", [])}
+    prev_stat = state.get("legacy_stat", {})
+
+    keys = []
+    legacy_stat = {}
+    for path in raw_sources(raw_dir):
+        sid = _source_id(path)
+
+        if path.is_dir():
+            store = RawStationStore(path)
+            keys.extend((f"{sid}/{y}", store.manifest["years"][y]["sha256"]) for y in store.years())
+            continue
+
+        st = path.stat()
+        legacy_stat[path.name] = [st.st_size, st.st_mtime_ns]
+        if prev_stat.get(path.name) == legacy_stat[path.name]:
+            keys.extend((k, fp) for k, fp in prev.items() if k.split("/", 1)[0] == sid)
+        else:
+            for year_key, records in iter_station_years(path):
+                keys.append((f"{sid}/{year_key}", hashlib.sha256(chunk_payload(records)).hexdigest()))
+
+    return keys, legacy_stat
+
+
+def _read_years(raw_dir: Path, wanted_keys: set[str]):
+    """Yield (key, records) for the requested station-years only."""
+    for path in raw_sources(raw_dir):
+        sid = _source_id(path)
+        years = {k.split("/", 1)[1] for k in wanted_keys if k.split("/", 1)[0] == sid}
+        if not years:
+            continue
+
+        if path.is_dir():
+            store = RawStationStore(path)
+            for year_key in store.years():
+                if year_key in years:
+                    yield f"{sid}/{year_key}", list(store.iter_year_records(year_key))
+        else:
+            for year_key, records in iter_station_years(path):
+                if year_key in years:
+                    yield f"{sid}/{year_key}", records
+
+
+def _groups(df: pd.DataFrame) -> set[tuple]:
+    if df is None or df.empty:
+        return set()
+    return set(df[GROUP_KEYS].drop_duplicates().itertuples(index=False, name=None))
+
+
+# ---- Stages ----
+def update_daily(raw_dir: Path, state: dict, full: bool = False):
+    """
+    Returns (daily, entries, affected_groups, rebuilt_all, legacy_stat).
+    `daily` is None when nothing changed; `entries` is the new per-key state.
+    """
+    keys, legacy_stat = scan_inputs(raw_dir, state)
+
+    usable = (
+        not full
+        and DAILY_PATH.exists()
+        and state.get("schema_version") == SCHEMA_VERSION
+    )
+    old_entries = state.get("keys", []) if usable else []
+
+    old_daily = read_table(DAILY_PATH) if old_entries else None
+    if old_daily is not None and len(old_daily) != sum(e["n_rows"] for e in old_entries):
+        print("[WARN] daily.parquet does not match incremental state, rebuilding all")
+        old_entries, old_daily = [], None
+
+    old = {e["key"]: e for e in old_entries}
+    current = dict(keys)
+    changed = {k for k, fp in keys if k not in old or old[k]["fingerprint"] != fp}
+    removed = [k for k in old if k not in current]
+
+    if not changed and not removed:
+        return None, old_entries, set(), False, legacy_stat
+
+    # ---- Old blocks: daily is the concatenation of key blocks in key order
+    old_blocks = {}
+    pos = 0
+    for e in old_entries:
+        old_blocks[e["key"]] = old_daily.iloc[pos:pos + e["n_rows"]]
+        pos += e["n_rows"]
+
+    affected = set()
+    for k in list(changed) + removed:
+        affected |= _groups(old_blocks.get(k))
+
+    new_blocks = {}
+    for k, records in _read_years(raw_dir, changed):
+        new_blocks[k], _ = validate_records(records)
+        affected |= _groups(new_blocks[k])
+
+    frames, entries = [], []
+    for k, fp in keys:
+        block = new_blocks[k] if k in new_blocks else old_blocks[k]
+        if len(block):
+            frames.append(block)
+        entries.append({"key": k, "fingerprint": fp, "n_rows": len(block)})
+
+    daily = concat_validated(frames) if frames else validate_records([])[0]
+
+    print(f"[OK] daily: {len(changed)} station-years re-derived, {len(removed)} removed")
+    return daily, entries, affected, not old_entries, legacy_stat
+
+
+def update_monthly(daily: pd.DataFrame, affected: set[tuple], full: bool = False) -> pd.DataFrame:
+    if full or not monthly_step.OUT_PATH.exists():
+        return monthly_step.build_monthly(daily)
+
+    old = read_table(monthly_step.OUT_PATH)
+    affected_idx = pd.MultiIndex.from_tuples(sorted(affected), names=GROUP_KEYS)
+
+    d_mask = pd.MultiIndex.from_frame(daily[GROUP_KEYS].astype({"year": "int64", "month": "int64"})).isin(affected_idx)
+    m_mask = pd.MultiIndex.from_frame(old[GROUP_KEYS].astype({"year": "int64", "month": "int64"})).isin(affected_idx)
+
+    parts = [old[~m_mask]]
+    if d_mask.any():
+        parts.append(monthly_step.build_monthly(daily[d_mask]))
+
+    print(f"[OK] monthly: {len(affected)} station-months recomputed")
+    return pd.concat(parts, ignore_index=True).sort_values(GROUP_KEYS).reset_index(drop=True)
+
+
+def update_anomalies(monthly: pd.DataFrame, stations: set[str], full: bool = False) -> pd.DataFrame:
+    if full or not anomalies_step.OUT_PATH.exists():
+        return anomalies_step.build_anomalies(monthly)
+
+    old = pd.read_parquet(anomalies_step.OUT_PATH)
+    subset = monthly[monthly["station_name"].isin(stations)]
+
+    parts = [old[~old["station_name"].isin(stations)]]
+    if not subset.empty:
+        parts.append(anomalies_step.build_anomalies(subset))
+
+    print(f"[OK] anomalies: {len(stations)} stations rescored")
+    return (
+        pd.concat(parts, ignore_index=True)
+        .sort_values(GROUP_KEYS, kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def update_similar(daily: pd.DataFrame, monthly: pd.DataFrame, stations: set[str], full: bool = False):
+    """
+    Rebuild quantile_index.parquet and similar_months.parquet (those that
+    exist) for `stations`, keeping the other stations' rows. Both are
+    computed station by station, so the result matches a full build.
+    """
+    has_index = quantile_index.OUT_PATH.exists()
+    has_similar = similar_step.OUT_PATH.exists()
+    if not (has_index or has_similar):
+        return
+
+    if full:
+        index = QuantileIndex.build(daily, monthly)
+    else:
+        index = QuantileIndex.build(
+            daily[daily["station_name"].isin(stations)],
+            monthly[monthly["station_name"].isin(stations)],
+        )
+
+    if has_index:
+        table = index.to_table()
+        if not full:
+            old = QuantileIndex.load(quantile_index.OUT_PATH).to_table()
+            keep = pc.invert(pc.is_in(old["station_name"], pa.array(sorted(stations), pa.string())))
+            table = pa.concat_tables([old.filter(keep), table]).sort_by([(k, "ascending") for k in quantile_index.KEYS])
+        QuantileIndex.from_table(table).save(quantile_index.OUT_PATH)
+        print(f"[OK] written: {quantile_index.OUT_PATH}")
+
+    if has_similar:
+        old = pd.read_parquet(similar_step.OUT_PATH)
+        top_k = int(old["rank"].max()) if len(old) else similar_step.TOP_K
+        parts = [similar_step.build_similar_months(index, top_k=top_k)]
+        if not full:
+            parts.insert(0, old[~old["station_name"].isin(stations)])
+        similar = (
+            pd.concat([p for p in parts if len(p.columns)], ignore_index=True)
+            .sort_values(["station_name", "reference_year", "reference_month", "rank"], kind="stable")
+            .reset_index(drop=True)
+        )
+        similar.to_parquet(similar_step.OUT_PATH, index=False)
+        print(f"[OK] written: {similar_step.OUT_PATH}")
+
+
+def update_partitioned(tables: dict[str, pd.DataFrame], base: Path = OUT_DIR):
+    """Rewrite the partitioned copies that exist (build_* --partitioned) from the new tables."""
+    for name, df in tables.items():
+        if (Path(base) / name / COMMON_METADATA).exists():
+            print(f"[OK] partitioned dataset: {write_processed(df, name, base)}")
+
+
+def main(raw_dir: Path = RAW_JSON_DIR, full: bool = False, audit: bool = False):
+    state = load_state()
+
+    daily, entries, affected, rebuilt_all, legacy_stat = update_daily(raw_dir, state, full=full)
+
+    if daily is None:
+        print("[OK] no raw station-year changed, nothing to do")
+        return
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    # keep the layout daily.parquet was built with (build_daily --compact)
+    compact = DAILY_PATH.exists() and is_compact(DAILY_PATH)
+    write_daily(daily, DAILY_PATH, compact=compact)
+    print(f"[OK] Written {len(daily)} rows to {DAILY_PATH}")
+    # Arrow IPC caches (build_daily / build_monthly --ipc) are kept in step
+    if ipc_path(DAILY_PATH).exists():
+        write_ipc(pq.read_table(DAILY_PATH), DAILY_PATH)
+
+    monthly = update_monthly(daily, affected, full=rebuilt_all)
+    monthly.to_parquet(monthly_step.OUT_PATH, index=False)
+    if ipc_path(monthly_step.OUT_PATH).exists():
+        write_ipc(monthly, monthly_step.OUT_PATH)
+    print(f"[OK] written: {monthly_step.OUT_PATH}")
+
+    stations = {s for s, _, _ in affected}
+    df_a = update_anomalies(monthly, stations, full=rebuilt_all)
+    df_a.to_parquet(anomalies_step.OUT_PATH, index=False)
+    print(f"[OK] written: {anomalies_step.OUT_PATH}")
+
+    update_partitioned({
+        "daily": compact_daily(daily) if compact else daily,
+        "monthly": monthly,
+        "monthly_anomalies": df_a,
+    })
+
+    if trends_step.OUT_PATH.exists():
+        trends_step.build_trends(monthly).to_parquet(trends_step.OUT_PATH, index=False)
+        print(f"[OK] written: {trends_step.OUT_PATH}")
+
+    update_similar(daily, monthly, stations, full=rebuilt_all)
+
+    # state last: an interrupted run is simply redone next time
+    save_state({
+        "schema_version": SCHEMA_VERSION,
+        "legacy_stat": legacy_stat,
+        "keys": entries,
+    })
+
+    # only reached when raw data changed; the summary's missing / min / max
+    # are totals over every source, so the whole archive is re-scanned
+    if audit:
+        report, summary = audit_step.audit_raw(raw_dir)
+        audit_step.write_report(report, summary)
+        print(f"[OK] written: {audit_step.REPORT_PATH}, {audit_step.SUMMARY_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally refresh processed datasets.")
+    parser.add_argument("--full", action="store_true", help="ignore saved state and rebuild everything")
+    parser.add_argument(
+        "--audit",
+        action="store_true",
+        help="after a run that changed raw data, rebuild the data-quality report (re-scans the whole archive)",
+    )
+    args = parser.parse_args()
+
+    main(full=args.full, audit=args.audit)
@@ -1,19 +1,223 @@
 from pathlib import Path
 import json
 
+import pandas as pd
+
+from src.utils import metrics
+from src.utils.raw_store import RawStationStore, is_chunked
+
 
 RAW_JSON_DIR = Path("data/raw/arpa")
 
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 50_000
+BATCH_FORMATS = ("records", "pandas", "arrow")
+
+
+def raw_sources(raw_dir: Path = RAW_JSON_DIR) -> list[Path]:
+    """
+    One entry per station, sorted by name: a chunk directory (see
+    utils.raw_store) or, for stations not migrated yet, the legacy
+    `meteo_<station>.json`.
+    """
+    raw_dir = Path(raw_dir)
+    chunked = {p.name: p for p in raw_dir.iterdir() if p.is_dir() and is_chunked(p)} if raw_dir.exists() else {}
+    legacy = {p.stem: p for p in raw_dir.glob("*.json") if p.stem not in chunked}
+    sources = {**legacy, **chunked}
+    return [sources[name] for name in sorted(sources)]
+
+
+def load_source_records(path: Path):
+    """All records of one station (an entry of raw_sources), in file order."""
+    path = Path(path)
+    if path.is_dir():
+        for _, records in RawStationStore(path).iter_years():
+            yield from records
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        station_data = json.load(f)
+
+    # station_data: { "1999": [ {...}, {...} ], ... }
+    for year_str, records in station_data.items():
+        if not isinstance(records, list):
+            continue
+
+        for rec in records:
+            yield rec
 
-def load_all_raw_records():
-    for path in RAW_JSON_DIR.glob("*.json"):
-        with open(path, "r", encoding="utf-8") as f:
-            station_data = json.load(f)
 
-        # station_data: { "1999": [ {...}, {...} ], ... }
-        for year_str, records in station_data.items():
-            if not isinstance(records, list):
+@metrics.instrument()
+def load_all_raw_records(raw_dir: Path = RAW_JSON_DIR):
+    for path in raw_sources(raw_dir):
+        yield from load_source_records(path)
+
+
+# ---- Streaming reader ----
+class _JsonStream:
+    """
+    Minimal pull parser over a station file ({ "1999": [ {...}, ... ], ... }).
+    Only the current value is decoded; the buffer holds at most one
+    record plus one read chunk.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, fh, chunk_size: int = CHUNK_SIZE):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.fh.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # drop what has already been consumed before growing the buffer
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            n = len(self.buf)
+            while self.pos < n and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < n:
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed raw JSON: expected {char!r}, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # a bare number may continue in the next chunk
+            if end == len(self.buf) and self._fill():
                 continue
+            self.pos = end
+            return obj
+
+
+def iter_station_years(path: Path, chunk_size: int = CHUNK_SIZE):
+    """
+    Yield (year_str, records) for one station file, one year at a time,
+    without parsing the whole file. Non-list entries are skipped like in
+    load_all_raw_records.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JsonStream(f, chunk_size=chunk_size)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+
+        while True:
+            year_str = stream.value()
+            stream.expect(":")
+
+            if stream.peek() == "[":
+                stream.expect("[")
+                records = []
+                if stream.peek() != "]":
+                    while True:
+                        records.append(stream.value())
+                        if stream.peek() != ",":
+                            break
+                        stream.expect(",")
+                stream.expect("]")
+                yield year_str, records
+            else:
+                stream.value()
+
+            if stream.peek() != ",":
+                break
+            stream.expect(",")
+
+        stream.expect("}")
+
+
+def iter_source_years(path: Path):
+    """(year_str, records) for either storage layout."""
+    if path.is_dir():
+        store = RawStationStore(path)
+        for year_key in store.years():
+            yield year_key, list(store.iter_year_records(year_key))
+    else:
+        yield from iter_station_years(path)
+
+
+@metrics.instrument()
+def stream_all_raw_records(raw_dir: Path = RAW_JSON_DIR):
+    """Same records, same order as load_all_raw_records, at bounded memory."""
+    for path in raw_sources(raw_dir):
+        if path.is_dir():
+            store = RawStationStore(path)
+            for year_key in store.years():
+                yield from store.iter_year_records(year_key)
+        else:
+            for _, records in iter_station_years(path):
+                yield from records
+
+
+def _to_arrow_batch(records: list[dict]):
+    import pyarrow as pa
+
+    keys = list(dict.fromkeys(k for r in records for k in r))
+    arrays = []
+    for key in keys:
+        values = [r.get(key) for r in records]
+        try:
+            arrays.append(pa.array(values, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # columns mixing numbers and "-" sentinels are carried as text
+            arrays.append(pa.array([None if v is None else str(v) for v in values], pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, names=keys)
+
+
+@metrics.instrument(item_rows=len)
+def iter_raw_batches(
+    batch_size: int = BATCH_SIZE,
+    fmt: str = "records",
+    raw_dir: Path = RAW_JSON_DIR,
+):
+    """
+    Stream all raw records in fixed-size batches.
+
+    fmt="records" yields lists of dicts (values untouched), "pandas"
+    DataFrames (usual pandas dtype inference) and "arrow" pyarrow
+    RecordBatches (NaN becomes null, mixed-type columns become strings).
+    """
+    if fmt not in BATCH_FORMATS:
+        raise ValueError(f"Unknown batch format: {fmt!r} (expected one of {BATCH_FORMATS})")
+
+    def emit(batch):
+        if fmt == "pandas":
+            return pd.DataFrame.from_records(batch)
+        if fmt == "arrow":
+            return _to_arrow_batch(batch)
+        return batch
+
+    batch = []
+    for rec in stream_all_raw_records(raw_dir):
+        batch.append(rec)
+        if len(batch) >= batch_size:
+            yield emit(batch)
+            batch = []
 
-            for rec in records:
-                yield rec
\ No newline at end of file
+    if batch:
+        yield emit(batch)
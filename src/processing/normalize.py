@@ -1,4 +1,6 @@
-from src.utils.casting import to_float, to_int
+import numpy as np
+
+from src.utils.casting import to_float, to_int, to_float_column, to_int_column
 
 FIELD_MAP = {
     "Pioggia mm": "precipitation",
@@ -26,4 +28,25 @@ def normalize_record(raw: dict) -> dict:
         else:
             data[field] = to_float(val)
 
-    return data
\ No newline at end of file
+    return data
+
+
+def normalize_columns(columns: dict) -> dict[str, tuple]:
+    """
+    Column version of normalize_record: raw columns (keyed like FIELD_MAP)
+    -> {field: (float64 values, present mask)}. Missing raw keys count as
+    all-None columns.
+    """
+    n = len(next(iter(columns.values()))) if columns else 0
+
+    data = {}
+    for raw_key, field in FIELD_MAP.items():
+        values = columns.get(raw_key)
+        if values is None:
+            values = np.full(n, None, dtype=object)
+        if field == "wind_direction_max":
+            data[field] = to_int_column(values)
+        else:
+            data[field] = to_float_column(values)
+
+    return data
@@ -0,0 +1,385 @@
+"""
+Pipeline runner: daily -> monthly -> anomalies / trends as a small DAG with a
+content-addressed stage cache.
+
+Each stage gets a key = sha256 of
+    - the content hashes of its inputs (raw data, or the upstream outputs)
+    - the source of the modules implementing it (code version)
+    - its config (module constants such as SCALE / ZCAP / PCTL, run options)
+    - SCHEMA_VERSION
+When the key is already in the cache the stored output is restored instead
+of recomputing it, so a tweak to the anomaly constants only re-runs the
+anomaly stage.
+
+    data/cache/pipeline/
+        objects/ab/ab12...      stage outputs, named by their sha256
+        stages/<key>.json       key -> object, size, last use
+
+Objects are evicted least-recently-used first once the cache is larger
+than MAX_CACHE_BYTES.
+
+    python -m src.processing.pipeline                    # all stages
+    python -m src.processing.pipeline anomalies --force anomalies
+"""
+from pathlib import Path
+import argparse
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from src.schema.observations import SCHEMA_VERSION
+from src.processing import build_anomalies as anomalies_step
+from src.processing.build_anomalies import build_anomalies_streaming
+from src.processing.build_daily import build_daily_columnar, build_daily_pydantic
+from src.processing.build_monthly import build_monthly
+from src.processing import build_trends as trends_step
+from src.processing.build_trends import build_trends
+from src.processing.datasets import write_daily
+from src.processing.load_raw import RAW_JSON_DIR, raw_sources, load_all_raw_records
+from src.utils import metrics
+from src.utils.raw_store import MANIFEST_NAME
+
+
+OUT_DIR = Path("data/processed")
+CACHE_DIR = Path("data/cache/pipeline")
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+_HASH_CHUNK = 1 << 20
+
+
+# ---- Hashing ----
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def raw_digest(raw_dir: Path) -> str:
+    """
+    Content hash of the raw archive: manifests for chunked stations (they
+    carry the sha256 of every year chunk), file bytes for legacy JSON.
+    """
+    h = hashlib.sha256()
+    for path in raw_sources(raw_dir):
+        h.update(path.name.encode("utf-8"))
+        h.update(file_digest(path / MANIFEST_NAME if path.is_dir() else path).encode("ascii"))
+    return h.hexdigest()
+
+
+def code_digest(modules: list[str]) -> str:
+    h = hashlib.sha256()
+    for name in sorted(modules):
+        h.update(name.encode("utf-8"))
+        h.update(Path(inspect.getsourcefile(importlib.import_module(name))).read_bytes())
+    return h.hexdigest()
+
+
+def _json_key(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# ---- Cache ----
+class StageCache:
+    """Content-addressed store of stage outputs with LRU size-based eviction."""
+
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.objects = self.root / "objects"
+        self.stages = self.root / "stages"
+        self._touched = set()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+
+    def _entry_path(self, key: str) -> Path:
+        return self.stages / f"{key}.json"
+
+    def _write_entry(self, key: str, entry: dict):
+        self.stages.mkdir(parents=True, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        tmp_path.replace(path)
+
+    def lookup(self, key: str):
+        """Entry for `key` if its object is still in the cache, else None."""
+        path = self._entry_path(key)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if not self._object_path(entry["object"]).exists():
+            return None
+        entry["last_used"] = time.time()
+        self._write_entry(key, entry)
+        self._touched.add(entry["object"])
+        return entry
+
+    def restore(self, entry: dict, out_path: Path):
+        """Put the cached object at `out_path` (skipped if already there)."""
+        out_path = Path(out_path)
+        if out_path.exists() and out_path.stat().st_size == entry["size"] and file_digest(out_path) == entry["object"]:
+            return
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+        shutil.copyfile(self._object_path(entry["object"]), tmp_path)
+        os.replace(tmp_path, out_path)
+
+    def store(self, key: str, stage: str, out_path: Path) -> dict:
+        digest = file_digest(out_path)
+        obj = self._object_path(digest)
+        if not obj.exists():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = obj.with_suffix(".tmp")
+            shutil.copyfile(out_path, tmp_path)
+            os.replace(tmp_path, obj)
+
+        entry = {
+            "stage": stage,
+            "object": digest,
+            "size": obj.stat().st_size,
+            "created": time.time(),
+            "last_used": time.time(),
+        }
+        self._write_entry(key, entry)
+        self._touched.add(digest)
+        return entry
+
+    def evict(self) -> int:
+        """Drop least-recently-used objects until the cache fits; returns bytes freed."""
+        if not self.stages.exists():
+            return 0
+
+        last_used, sizes, keys_of = {}, {}, {}
+        for path in self.stages.glob("*.json"):
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            obj = entry["object"]
+            last_used[obj] = max(last_used.get(obj, 0), entry["last_used"])
+            sizes[obj] = entry["size"]
+            keys_of.setdefault(obj, []).append(path)
+
+        total = sum(sizes.values())
+        freed = 0
+        for obj in sorted(last_used, key=last_used.get):
+            if total <= self.max_bytes:
+                break
+            if obj in self._touched:
+                continue
+            self._object_path(obj).unlink(missing_ok=True)
+            for path in keys_of[obj]:
+                path.unlink(missing_ok=True)
+            total -= sizes[obj]
+            freed += sizes[obj]
+        return freed
+
+
+# ---- Stages ----
+class Stage:
+    """
+    One node of the DAG. `run(inputs, output, options)` builds `output` from
+    the upstream output paths; `config(options)` lists everything besides
+    inputs and code that changes the result.
+    """
+
+    def __init__(self, name: str, deps: list[str], output: str, modules: list[str], config, run):
+        self.name = name
+        self.deps = deps
+        self.output = output
+        self.modules = modules
+        self.config = config
+        self.run = run
+
+
+def _run_daily(inputs: dict, output: Path, options: dict):
+    records = load_all_raw_records(options["raw_dir"])
+    if options["engine"] == "columnar":
+        df = build_daily_columnar(records=records)
+    else:
+        df = build_daily_pydantic(records)
+    write_daily(df, output, compact=options["compact"])
+
+
+def _run_monthly(inputs: dict, output: Path, options: dict):
+    build_monthly(pd.read_parquet(inputs["daily"])).to_parquet(output, index=False)
+
+
+def _run_anomalies(inputs: dict, output: Path, options: dict):
+    build_anomalies_streaming(inputs["monthly"], output, top_features_format=options["top_features"])
+
+
+def _run_trends(inputs: dict, output: Path, options: dict):
+    build_trends(pd.read_parquet(inputs["monthly"])).to_parquet(output, index=False)
+
+
+ANOMALY_CONSTANTS = [
+    "SCALE", "ZCAP", "PCTL", "BASELINE", "BASELINE_WINDOW",
+    "MIN_DAYS_ROWS", "MIN_MEAN_COVERAGE", "MIN_FEATURES_PRESENT",
+    "TOP_K", "CORE_FEATURES", "FEATURE_TO_COVERAGE",
+]
+
+
+def _anomaly_config(options: dict) -> dict:
+    config = {name: getattr(anomalies_step, name) for name in ANOMALY_CONSTANTS}
+    config["top_features"] = options["top_features"]
+    return config
+
+
+TREND_CONSTANTS = [
+    "TREND_FEATURES", "MIN_COVERAGE", "MIN_YEARS", "MAX_PAIRS", "SEED", "ALPHA",
+]
+
+
+STAGES = {
+    "daily": Stage(
+        "daily",
+        deps=[],
+        output="daily.parquet",
+        modules=[
+            "src.processing.build_daily",
+            "src.processing.datasets",
+            "src.processing.load_raw",
+            "src.processing.validate",
+            "src.processing.validate_columnar",
+            "src.processing.normalize",
+            "src.utils.casting",
+            "src.utils.raw_store",
+            "src.schema.observations",
+            "src.schema.layout",
+        ],
+        config=lambda options: {"engine": options["engine"], "compact": options["compact"]},
+        run=_run_daily,
+    ),
+    "monthly": Stage(
+        "monthly",
+        deps=["daily"],
+        output="monthly.parquet",
+        modules=["src.processing.build_monthly"],
+        config=lambda options: {},
+        run=_run_monthly,
+    ),
+    "anomalies": Stage(
+        "anomalies",
+        deps=["monthly"],
+        output="monthly_anomalies.parquet",
+        modules=["src.processing.build_anomalies", "src.processing.baselines", "src.processing.datasets"],
+        config=_anomaly_config,
+        run=_run_anomalies,
+    ),
+    "trends": Stage(
+        "trends",
+        deps=["monthly"],
+        output="trends.parquet",
+        modules=["src.processing.build_trends", "src.processing.build_anomalies"],
+        config=lambda options: {name: getattr(trends_step, name) for name in TREND_CONSTANTS},
+        run=_run_trends,
+    ),
+}
+
+
+def plan(targets: list[str] = None) -> list[str]:
+    """Stages needed for `targets` (default: all), in dependency order."""
+    order, seen = [], set()
+
+    def visit(name: str):
+        if name in seen:
+            return
+        seen.add(name)
+        for dep in STAGES[name].deps:
+            visit(dep)
+        order.append(name)
+
+    for name in targets or list(STAGES):
+        visit(name)
+    return order
+
+
+def stage_key(stage: Stage, input_digests: dict, options: dict) -> str:
+    return _json_key({
+        "stage": stage.name,
+        "inputs": input_digests,
+        "code": code_digest(stage.modules),
+        "config": stage.config(options),
+        "schema_version": SCHEMA_VERSION,
+    })
+
+
+def run(
+    targets: list[str] = None,
+    force: list[str] = (),
+    raw_dir: Path = RAW_JSON_DIR,
+    out_dir: Path = OUT_DIR,
+    cache: StageCache = None,
+    engine: str = "columnar",
+    top_features: str = "json",
+    compact: bool = False,
+) -> dict[str, str]:
+    """Run (or restore) the stages; returns {stage: "cached" | "built"}."""
+    cache = cache or StageCache()
+    options = {"raw_dir": Path(raw_dir), "engine": engine, "top_features": top_features, "compact": compact}
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    digests = {"raw": raw_digest(raw_dir)}
+    status = {}
+    for name in plan(targets):
+        stage = STAGES[name]
+        inputs = {dep: out_dir / STAGES[dep].output for dep in stage.deps}
+        input_digests = {dep: digests[dep] for dep in stage.deps or ["raw"]}
+        key = stage_key(stage, input_digests, options)
+        output = out_dir / stage.output
+
+        entry = None if name in force else cache.lookup(key)
+        if entry is not None:
+            cache.restore(entry, output)
+            status[name] = "cached"
+        else:
+            with metrics.stage(f"pipeline.{name}"):
+                stage.run(inputs, output, options)
+            entry = cache.store(key, name, output)
+            status[name] = "built"
+
+        digests[name] = entry["object"]
+        print(f"[OK] {name}: {status[name]} -> {output} ({entry['object'][:12]})")
+
+    freed = cache.evict()
+    if freed:
+        print(f"[OK] cache: evicted {freed / 1024 ** 2:.1f} MB")
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the processing pipeline with a stage cache.")
+    parser.add_argument("targets", nargs="*", help=f"stages to bring up to date: {', '.join(STAGES)} (default: all)")
+    parser.add_argument("--force", action="append", default=[], choices=list(STAGES), help="rebuild this stage even if cached")
+    parser.add_argument("--engine", choices=("pydantic", "columnar"), default="columnar")
+    parser.add_argument("--top-features", choices=("json", "struct"), default="json")
+    parser.add_argument("--compact", action="store_true", help="compact daily.parquet layout (docs/schema.md)")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--max-cache-mb", type=int, default=MAX_CACHE_BYTES // 1024 ** 2)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.enable_from_args(args)
+
+    unknown = [t for t in args.targets if t not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    run(
+        targets=args.targets or None,
+        force=args.force,
+        cache=StageCache(args.cache_dir, args.max_cache_mb * 1024 ** 2),
+        engine=args.engine,
+        top_features=args.top_features,
+        compact=args.compact,
+    )
@@ -0,0 +1,308 @@
+"""
+Quantile-sketch index for similar-month retrieval.
+
+For every (station, year, month, variable) the daily values are reduced
+once to a fixed-length sketch: the mean of the empirical quantile function
+over each cell of a grid on [0, 1]. The 1-D Wasserstein distance between
+two months is the cell-width weighted sum of absolute sketch differences,
+so all candidates of a station are scored in one array operation instead
+of re-sorting raw samples per pair.
+
+The grid edges are all fractions j / k with k <= MAX_EXACT_SAMPLES (31,
+a full month of daily values; ~300 cells). A month with n <= 31 samples
+has a quantile function that is constant on every cell, so the sketch
+distance equals scipy.stats.wasserstein_distance up to float rounding
+(tolerance: 1e-9 relative). Months with more samples (duplicated days)
+get a lower bound, off by at most (range(a) + range(b)) * max cell width.
+
+    python -m src.processing.quantile_index     # writes data/processed/quantile_index.parquet
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.processing.datasets import ipc_is_current, ipc_path, open_ipc, read_table, write_ipc
+
+
+DAILY_PATH = Path("data/processed/daily.parquet")
+MONTHLY_PATH = Path("data/processed/monthly.parquet")
+OUT_PATH = Path("data/processed/quantile_index.parquet")
+
+MAX_EXACT_SAMPLES = 31
+
+# Same variables and gates as notebooks/05_similar_months.ipynb
+SIMILARITY_VARS = [
+    "temperature_mean",
+    "temperature_max",
+    "temperature_min",
+    "precipitation",
+    "humidity_mean",
+]
+MIN_COVERAGE = 0.80          # candidate months: coverage >= 80% on every variable
+MIN_VALID_DAYS = 20          # reference months: >= 20 valid days on every variable
+MIN_SAMPLES = 10             # per-variable distance needs >= 10 samples on both sides
+
+KEYS = ["station_name", "year", "month"]
+
+
+def is_current(path: Path = OUT_PATH, inputs: tuple[Path, ...] = (DAILY_PATH, MONTHLY_PATH)) -> bool:
+    """True if the index at `path` exists and is newer than every existing input table."""
+    path = Path(path)
+    if not path.exists():
+        return False
+    built = path.stat().st_mtime_ns
+    return all(built >= Path(p).stat().st_mtime_ns for p in inputs if Path(p).exists())
+
+
+# ---- Sketches ----
+def quantile_grid(max_samples: int = MAX_EXACT_SAMPLES) -> np.ndarray:
+    """Sorted cell edges {j / k : 1 <= k <= max_samples, 0 <= j <= k}."""
+    return np.unique(np.concatenate([np.arange(k + 1) / k for k in range(1, max_samples + 1)]))
+
+
+def quantile_sketches(
+    daily: pd.DataFrame,
+    keys: pd.DataFrame,
+    variable: str,
+    edges: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (sketch, n_samples) for one variable: sketch is (len(keys), len(edges) - 1),
+    NaN where a month has no samples. Rows follow `keys`.
+    """
+    values = daily[variable].to_numpy(dtype="float64", na_value=np.nan)
+    ok = ~np.isnan(values)
+
+    # month position of every daily row (-1 if the month is not in keys)
+    key_idx = pd.MultiIndex.from_frame(keys[KEYS])
+    pos = key_idx.get_indexer(pd.MultiIndex.from_frame(daily[KEYS]))
+    ok &= pos >= 0
+
+    pos, values = pos[ok], values[ok]
+    order = np.lexsort((values, pos))
+    values = values[order]
+
+    n_samples = np.bincount(pos, minlength=len(keys))
+    ends = np.cumsum(n_samples)
+    starts = ends - n_samples
+
+    # cumulative integral of the quantile function at the cell edges:
+    #   C(u) = (sum of the floor(u n) smallest values + frac(u n) * next value) / n
+    csum = np.concatenate([[0.0], np.cumsum(values)])
+    has = n_samples > 0
+    n = n_samples[has, None]
+    un = edges[None, :] * n
+    k = np.minimum(np.floor(un).astype("int64"), n - 1)
+    first = starts[has, None]
+    cum = (csum[first + k] - csum[first] + (un - k) * values[first + k]) / n
+
+    sketch = np.full((len(keys), len(edges) - 1), np.nan)
+    sketch[has] = np.diff(cum, axis=1) / np.diff(edges)
+
+    return sketch, n_samples
+
+
+class QuantileIndex:
+    """
+    keys:      DataFrame (station_name, year, month, is_reference, is_candidate),
+               sorted by station / year / month
+    sketch:    float64 (n_months, n_vars, n_cells)
+    n_samples: int64 (n_months, n_vars)
+    """
+
+    def __init__(
+        self,
+        keys: pd.DataFrame,
+        sketch: np.ndarray,
+        n_samples: np.ndarray,
+        variables: list[str],
+        max_samples: int = MAX_EXACT_SAMPLES,
+    ):
+        self.keys = keys.reset_index(drop=True)
+        self.sketch = sketch
+        self.n_samples = n_samples
+        self.variables = list(variables)
+        self.max_samples = max_samples
+        self.widths = np.diff(quantile_grid(max_samples))
+
+        stations = self.keys["station_name"].to_numpy()
+        bounds = np.flatnonzero(stations[1:] != stations[:-1]) + 1
+        starts = np.concatenate([[0], bounds]) if len(stations) else bounds
+        ends = np.concatenate([bounds, [len(stations)]]) if len(stations) else bounds
+        self._station_rows = {stations[s]: slice(s, e) for s, e in zip(starts, ends)}
+
+        ym = self.keys["year"].to_numpy() * 100 + self.keys["month"].to_numpy()
+        self._ym = ym.astype("int64")
+
+    # ---- Build / IO
+    @classmethod
+    def build(
+        cls,
+        daily: pd.DataFrame,
+        monthly: pd.DataFrame,
+        variables: list[str] = SIMILARITY_VARS,
+        max_samples: int = MAX_EXACT_SAMPLES,
+    ) -> "QuantileIndex":
+        keys = (
+            monthly[KEYS]
+            .astype({"year": "int64", "month": "int64"})
+            .drop_duplicates()
+            .sort_values(KEYS)
+            .reset_index(drop=True)
+        )
+        m = keys.merge(monthly.astype({"year": "int64", "month": "int64"}), on=KEYS, how="left")
+
+        coverage = [f"{v}_coverage" for v in _monthly_fields(monthly, "coverage")]
+        valid_days = [f"{v}_n_valid_days" for v in _monthly_fields(monthly, "n_valid_days")]
+        keys["is_reference"] = m[valid_days].ge(MIN_VALID_DAYS).all(axis=1).to_numpy()
+        keys["is_candidate"] = m[coverage].ge(MIN_COVERAGE).all(axis=1).to_numpy()
+
+        daily = daily[KEYS + list(variables)].astype({"year": "int64", "month": "int64"})
+        edges = quantile_grid(max_samples)
+        sketches, counts = zip(*(quantile_sketches(daily, keys, v, edges) for v in variables))
+        return cls(keys, np.stack(sketches, axis=1), np.stack(counts, axis=1), variables, max_samples)
+
+    def to_table(self) -> pa.Table:
+        n_cells = self.sketch.shape[2]
+        columns = {c: pa.array(self.keys[c].to_numpy()) for c in self.keys.columns}
+        for j, v in enumerate(self.variables):
+            columns[f"{v}_n"] = pa.array(self.n_samples[:, j])
+            flat = pa.array(self.sketch[:, j, :].reshape(-1))
+            columns[f"{v}_q"] = pa.FixedSizeListArray.from_arrays(flat, n_cells)
+
+        return pa.table(columns).replace_schema_metadata({
+            b"fvg.variables": ",".join(self.variables).encode("utf-8"),
+            b"fvg.max_samples": str(self.max_samples).encode("utf-8"),
+        })
+
+    def save(self, path: Path = OUT_PATH):
+        """Parquet file plus its Arrow IPC cache (memory-mapped by build_similar_months workers)."""
+        table = self.to_table()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, path)
+        write_ipc(table, path)
+
+    @classmethod
+    def load(cls, path: Path = OUT_PATH) -> "QuantileIndex":
+        table = open_ipc(ipc_path(path)) if ipc_is_current(path) else pq.read_table(path)
+        return cls.from_table(table)
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "QuantileIndex":
+        """Index of a to_table() table, or of a row slice of one (e.g. one station)."""
+        variables = table.schema.metadata[b"fvg.variables"].decode("utf-8").split(",")
+        max_samples = int(table.schema.metadata[b"fvg.max_samples"])
+
+        keys = table.select(KEYS + ["is_reference", "is_candidate"]).to_pandas()
+        n_samples = np.stack([table[f"{v}_n"].to_numpy() for v in variables], axis=1)
+        sketch = np.stack(
+            [
+                table[f"{v}_q"].combine_chunks().flatten().to_numpy(zero_copy_only=False)
+                .reshape(len(keys), -1)
+                for v in variables
+            ],
+            axis=1,
+        )
+        return cls(keys, sketch, n_samples, variables, max_samples)
+
+    # ---- Queries
+    def stations(self) -> list[str]:
+        return list(self._station_rows)
+
+    def station_rows(self, station: str) -> slice:
+        """Contiguous rows of one station (empty slice if unknown)."""
+        return self._station_rows.get(station, slice(0, 0))
+
+    def locate(self, station: str, year: int, month: int) -> int:
+        """Row of (station, year, month), or -1."""
+        rows = self._station_rows.get(station)
+        if rows is None:
+            return -1
+        i = rows.start + np.searchsorted(self._ym[rows], year * 100 + month)
+        return int(i) if i < rows.stop and self._ym[i] == year * 100 + month else -1
+
+    def distances(self, ref: int, rows: np.ndarray, min_samples: int = MIN_SAMPLES) -> np.ndarray:
+        """(len(rows), n_vars) Wasserstein distances; NaN below min_samples."""
+        d = np.abs(self.sketch[rows] - self.sketch[ref]) @ self.widths
+        too_few = (self.n_samples[rows] < min_samples) | (self.n_samples[ref] < min_samples)
+        d[too_few] = np.nan
+        return d
+
+    def similar_months(
+        self,
+        station: str,
+        year: int,
+        month: int,
+        top_k: int = 10,
+        min_samples_per_var: int = MIN_SAMPLES,
+        variable_weights: dict = None,
+    ) -> pd.DataFrame:
+        """
+        Same result layout as get_similar_months in notebook 05: one row per
+        candidate with the per-variable distances (w_<var>), their weighted
+        mean (distance_total) and n_valid_vars, closest first.
+        """
+        ref = self.locate(station, year, month)
+        if ref < 0 or not self.keys.at[ref, "is_reference"]:
+            print(f"[WARN] {station}, {year}-{month:02d} is not a valid reference month")
+            return pd.DataFrame()
+
+        rows = np.arange(self.station_rows(station).start, self.station_rows(station).stop)
+        rows = rows[self.keys["is_candidate"].to_numpy()[rows] & (rows != ref)]
+
+        per_var = self.distances(ref, rows, min_samples=min_samples_per_var)
+        total, n_valid = weighted_total(per_var, self.weights(variable_weights))
+
+        keep = np.flatnonzero(~np.isnan(total))
+        keep = keep[np.argsort(total[keep], kind="stable")][:top_k]
+
+        out = pd.DataFrame({
+            "station_name": station,
+            "reference_year": year,
+            "reference_month": month,
+            "candidate_year": self.keys["year"].to_numpy()[rows[keep]],
+            "candidate_month": self.keys["month"].to_numpy()[rows[keep]],
+        })
+        for j, v in enumerate(self.variables):
+            out[f"w_{v}"] = per_var[keep, j]
+        out["distance_total"] = total[keep]
+        out["n_valid_vars"] = n_valid[keep]
+        return out
+
+    def weights(self, variable_weights: dict = None) -> np.ndarray:
+        variable_weights = variable_weights or {}
+        return np.array([float(variable_weights.get(v, 1.0)) for v in self.variables])
+
+
+# ---- Helpers ----
+def _monthly_fields(monthly: pd.DataFrame, suffix: str) -> list[str]:
+    """Variables with a <var>_<suffix> column in monthly (all measures, as in the notebook)."""
+    return [c[: -len(suffix) - 1] for c in monthly.columns if c.endswith(f"_{suffix}")]
+
+
+def weighted_total(per_var: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Weighted mean over the finite per-variable distances, and how many there were."""
+    finite = np.isfinite(per_var)
+    w = np.where(finite, weights, 0.0)
+    num = (np.where(finite, per_var, 0.0) * w).sum(axis=1)
+    den = w.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = np.where(den > 0, num / den, np.nan)
+    return total, finite.sum(axis=1)
+
+
+def main():
+    daily = read_table(DAILY_PATH)
+    monthly = read_table(MONTHLY_PATH)
+
+    index = QuantileIndex.build(daily, monthly)
+    index.save(OUT_PATH)
+    print(f"[OK] quantile index: {len(index.keys)} station-months x {len(index.variables)} variables")
+    print(f"[OK] written: {OUT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
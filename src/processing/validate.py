@@ -1,6 +1,7 @@
 from src.schema.observations import DailyObservation
 from src.utils.casting import build_date
 from src.processing.normalize import normalize_record
+from src.utils import metrics
 
 
 def record_to_daily_observation(raw: dict):
@@ -25,4 +26,24 @@ def record_to_daily_observation(raw: dict):
     try:
         return DailyObservation(**data)
     except Exception:
-        return None
\ No newline at end of file
+        return None
+
+
+@metrics.instrument()
+def daily_observation_rows(records) -> list[dict]:
+    """
+    `model_dump()` of every record that record_to_daily_observation accepts.
+    Instrumented here, once per batch, rather than per record: a wrapper on
+    every call would cost more than the validation it measures.
+    """
+    rows = []
+    n_in = 0
+
+    for raw in records:
+        n_in += 1
+        obs = record_to_daily_observation(raw)
+        if obs is not None:
+            rows.append(obs.model_dump())
+
+    metrics.count(rows_in=n_in, rejected=n_in - len(rows))
+    return rows
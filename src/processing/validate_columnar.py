@@ -0,0 +1,206 @@
+"""
+Columnar validation engine for daily observations.
+
+Same rules as `validate.record_to_daily_observation`, but applied as
+vectorized masks over whole columns instead of one `DailyObservation`
+object per record. Constraints are read from the pydantic schema, so
+changing a `Field(ge=..., le=...)` there changes both engines.
+"""
+from typing import Union, get_args, get_origin
+
+import numpy as np
+import pandas as pd
+from annotated_types import Ge, Gt, Le, Lt, MaxLen, MinLen
+
+from src.schema.observations import DailyObservation
+from src.utils.casting import to_int_column, date_from_parts
+from src.processing.normalize import FIELD_MAP, normalize_columns
+from src.utils import metrics
+
+
+DATE_PARTS = {"year": "anno", "month": "mese", "day": "giorno*"}
+STATION_KEY = "stazione"
+
+RAW_KEYS = [*DATE_PARTS.values(), STATION_KEY, *FIELD_MAP]
+
+# annotated_types metadata -> (attribute / rule suffix, "value is ok" comparison)
+_CONSTRAINTS = {
+    Ge: ("ge", np.greater_equal),
+    Gt: ("gt", np.greater),
+    Le: ("le", np.less_equal),
+    Lt: ("lt", np.less),
+    MinLen: ("min_length", np.greater_equal),
+    MaxLen: ("max_length", np.less_equal),
+}
+# rule suffix -> "value is ok" comparison, e.g. COMPARE["le"](x, 100)
+COMPARE = dict(_CONSTRAINTS.values())
+
+
+# ---- Schema introspection ----
+def _base_type(annotation):
+    """Optional[float] -> (float, True); int -> (int, False)."""
+    if get_origin(annotation) is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        return args[0], len(args) < len(get_args(annotation))
+    return annotation, False
+
+
+def schema_rules(model=DailyObservation) -> list[tuple[str, str, str, object]]:
+    """
+    Flatten the `Field` constraints of a pydantic model into
+    (rule_name, field, op, bound) tuples, e.g.
+    ("temperature_min.ge", "temperature_min", "ge", -50).
+    """
+    rules = []
+    for name, info in model.model_fields.items():
+        for meta in info.metadata:
+            spec = _CONSTRAINTS.get(type(meta))
+            if spec is None:
+                continue
+            op = spec[0]
+            rules.append((f"{name}.{op}", name, op, getattr(meta, op)))
+    return rules
+
+
+# ---- Column helpers ----
+def records_to_columns(records) -> dict[str, np.ndarray]:
+    """Transpose raw records into one object array per raw key."""
+    records = records if isinstance(records, list) else list(records)
+    return {
+        key: np.array([r.get(key) for r in records], dtype=object)
+        for key in RAW_KEYS
+    }
+
+
+def str_column(values: np.ndarray, strip: bool) -> tuple[np.ndarray, np.ndarray]:
+    """(values, is-a-string mask) of an object column, strings stripped if `strip`."""
+    is_str = np.array([isinstance(v, str) for v in values], dtype=bool)
+    out = values.copy()
+    if strip and is_str.any():
+        out[is_str] = [v.strip() for v in values[is_str]]
+    return out, is_str
+
+
+def _output_column(values: np.ndarray, present: np.ndarray, base: type, optional: bool):
+    """Mimic the dtype pandas infers from a list of `model_dump()` dicts."""
+    if optional and not present.any():
+        return np.full(len(values), None, dtype=object)
+    if base is int and present.all():
+        return values.astype(np.int64)
+    return np.where(present, values, np.nan)
+
+
+# ---- Engine ----
+@metrics.instrument()
+def validate_columns(columns: dict[str, np.ndarray], model=DailyObservation):
+    """
+    Validate raw columns against the schema.
+
+    Returns (df, rejections): the accepted rows as a DataFrame with the same
+    columns and dtypes as the pydantic path, and the number of records
+    failing each rule. A record failing several rules is counted under each
+    of them; field rules are only evaluated for records with a valid date.
+    """
+    n = len(columns[STATION_KEY])
+
+    # ---- Date construction (build_date)
+    parts = {f: to_int_column(columns[k]) for f, k in DATE_PARTS.items()}
+    all_parts = np.logical_and.reduce([p for _, p in parts.values()]) if n else np.zeros(0, bool)
+    dates, date_ok = date_from_parts(
+        parts["year"][0], parts["month"][0], parts["day"][0], all_parts
+    )
+
+    rejections = {"date.valid": int((~date_ok).sum())}
+
+    # ---- Typed fields (normalize_record)
+    measures = normalize_columns({k: columns[k] for k in FIELD_MAP})
+    strip = bool(model.model_config.get("str_strip_whitespace"))
+
+    fields = {}
+    for name, info in model.model_fields.items():
+        base, optional = _base_type(info.annotation)
+        if name == "date":
+            fields[name] = (dates, date_ok, base, optional)
+        elif name in parts:
+            fields[name] = (*parts[name], base, optional)
+        elif base is str:
+            fields[name] = (*str_column(columns[STATION_KEY], strip), base, optional)
+        else:
+            fields[name] = (*measures[name], base, optional)
+
+    # ---- Required / type rules
+    keep = date_ok.copy()
+    for name, (_, present, base, optional) in fields.items():
+        if optional or name == "date" or name in parts:
+            continue
+        bad = date_ok & ~present
+        rule = f"{name}.type" if base is str else f"{name}.missing"
+        rejections[rule] = int(bad.sum())
+        keep &= ~bad
+
+    # ---- Field constraints (ranges, lengths)
+    for rule, name, op, bound in schema_rules(model):
+        values, present, base, _ = fields[name]
+        if base is str:
+            values = pd.Series(values).where(present, "").str.len().to_numpy()
+        # NaN compares False, so a parsed "nan" fails like it does in pydantic
+        with np.errstate(invalid="ignore"):
+            bad = date_ok & present & ~COMPARE[op](values, bound)
+        rejections[rule] = int(bad.sum())
+        keep &= ~bad
+
+    metrics.count(rows_in=n, rejected=n - int(keep.sum()))
+
+    # ---- Output frame
+    out = {}
+    for name, (values, present, base, optional) in fields.items():
+        values, present = values[keep], present[keep]
+        if name == "date":
+            out[name] = values.astype(object)
+        elif base is str:
+            out[name] = values
+        else:
+            out[name] = _output_column(values, present, base, optional)
+
+    return pd.DataFrame(out), rejections
+
+
+def validate_records(records, model=DailyObservation):
+    """Convenience wrapper: raw records -> (df, rejections)."""
+    return validate_columns(records_to_columns(records), model=model)
+
+
+def validate_batches(batches, model=DailyObservation):
+    """
+    Validate an iterable of record batches (e.g. load_raw.iter_raw_batches)
+    and combine them. Rows and dtypes match a single validate_records call.
+    """
+    frames = []
+    rejections: dict[str, int] = {}
+    for batch in batches:
+        df, rej = validate_records(batch, model=model)
+        frames.append(df)
+        for rule, count in rej.items():
+            rejections[rule] = rejections.get(rule, 0) + count
+
+    if not frames:
+        return validate_records([], model=model)
+
+    return concat_validated(frames, model=model), rejections
+
+
+def concat_validated(frames: list[pd.DataFrame], model=DailyObservation) -> pd.DataFrame:
+    """
+    Concatenate validated frames with the dtypes a single pass would give:
+    a frame where an optional column is all-null comes back as object, and
+    a batch with every record rejected has object columns, so it is left
+    out rather than widening the others.
+    """
+    df = pd.concat([f for f in frames if len(f)] or frames[:1], ignore_index=True)
+
+    for name, info in model.model_fields.items():
+        base, optional = _base_type(info.annotation)
+        if optional and base in (int, float) and df[name].dtype == object and df[name].notna().any():
+            df[name] = df[name].astype(np.float64)
+
+    return df
@@ -0,0 +1,33 @@
+"""
+Schema version and compact storage types of daily.parquet.
+
+Kept apart from observations.py so that the steps which only read or
+write processed tables do not import pydantic; observations.py re-exports
+both names.
+"""
+
+
+SCHEMA_VERSION = "v1.1"
+
+# Storage types of daily.parquet written in compact mode (build_daily
+# --compact), as Arrow type names. Same columns, values and nullability as
+# DailyObservation; see docs/schema.md ("Compact storage layout").
+COMPACT_DAILY_TYPES = {
+    "date": "date32",
+    "year": "int16",
+    "month": "int8",
+    "day": "int8",
+    "station_name": "dictionary<string>",
+    "precipitation": "float32",
+    "temperature_min": "float32",
+    "temperature_mean": "float32",
+    "temperature_max": "float32",
+    "humidity_min": "float32",
+    "humidity_mean": "float32",
+    "humidity_max": "float32",
+    "wind_speed_mean": "float32",
+    "wind_speed_max": "float32",
+    "wind_direction_max": "int16",
+    "solar_radiation": "float32",
+    "pressure_mean": "float32",
+}
@@ -2,8 +2,7 @@ from typing import Optional
 from datetime import date as Date
 from pydantic import BaseModel, Field, ConfigDict
 
-
-SCHEMA_VERSION = "v1.1"
+from src.schema.layout import COMPACT_DAILY_TYPES, SCHEMA_VERSION  # noqa: F401 (re-exported)
 
 
 class DailyObservation(BaseModel):
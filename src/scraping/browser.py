@@ -0,0 +1,566 @@
+"""
+Pilotaggio di archivio.php con Selenium: form, attesa del link salvaDati,
+download per stazione/anno (un driver o un pool di driver).
+
+selenium e tqdm sono importati qui una volta sola; scrape_all_months (CLI)
+e il fallback di http_fetch importano questo modulo solo quando serve un
+browser, quindi --mode http senza fallback non li carica. Costanti, pacer
+e archivio per stazione sono in common.py.
+"""
+import json
+import queue
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+import pandas as pd
+from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import Select, WebDriverWait
+from tqdm import tqdm
+
+from src.scraping.common import (
+    ALL_MONTHS_VALUE,
+    CLICK_WAIT,
+    URL,
+    AdaptivePacer,
+    LatencyLog,
+    StationStore,
+    TokenBucket,
+    csv_to_frame,
+)
+from src.utils.raw_store import RawStationStore
+
+
+# secondi concessi alla pagina, a richiesta conclusa, per mostrare salvaDati
+SETTLE_WAIT = 1.0
+
+
+def wait_years_refresh(driver, wait):
+    """Aspetta che il select anni abbia almeno 1 option non disabled."""
+    wait.until(
+        lambda d: len(d.find_elements(By.CSS_SELECTOR, "#anno option:not([disabled])")) > 0
+    )
+
+
+def get_enabled_years_xpath(driver) -> list[int]:
+    """Prende SOLO anni non disabled, leggendo direttamente dal DOM aggiornato."""
+    opts = driver.find_elements(By.CSS_SELECTOR, "#anno option:not([disabled])")
+    years = []
+    for o in opts:
+        v = (o.get_attribute("value") or "").strip()
+        if v.isdigit():
+            years.append(int(v))
+    return sorted(set(years))
+
+
+def accept_cookies_if_present(driver, wait):
+    try:
+        modal = wait.until(
+            EC.presence_of_element_located((By.ID, "cookieModal"))
+        )
+        ok_btn = modal.find_element(By.ID, "ok")
+        ok_btn.click()
+        wait.until(EC.invisibility_of_element(modal))
+        print("✔ Cookie modal accettato")
+    except Exception:
+        print("ℹ Cookie modal non presente")
+
+
+def build_driver(headless: bool = True, log_network: bool = False) -> webdriver.Chrome:
+    opts = webdriver.ChromeOptions()
+    if headless:
+        opts.add_argument("--headless=new")
+    opts.add_argument("--window-size=1200,900")
+    if log_network:
+        # log di rete di Chrome, letto da capture_data_request
+        opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return webdriver.Chrome(options=opts)
+
+
+def open_archive(driver, wait, url: str = URL):
+    driver.get(url)
+    wait.until(EC.presence_of_element_located((By.ID, "anno")))
+    accept_cookies_if_present(driver, wait)
+
+
+def select_station(driver, wait, station: str) -> list[int]:
+    """Seleziona la stazione e ritorna gli anni disponibili."""
+    Select(driver.find_element(By.ID, "stazione")).select_by_visible_text(station)
+    wait_years_refresh(driver, wait)
+    return get_enabled_years_xpath(driver)
+
+
+def _salva_dati_state(driver):
+    """(id elemento, href) del link salvaDati corrente, o (None, None)."""
+    try:
+        els = driver.find_elements(By.ID, "salvaDati")
+        if not els:
+            return None, None
+        return els[0].id, els[0].get_attribute("href")
+    except StaleElementReferenceException:
+        return None, None
+
+
+def _fresh_salva_dati(previous):
+    """Condizione per WebDriverWait: un salvaDati diverso da `previous`."""
+    def condition(driver):
+        el_id, href = _salva_dati_state(driver)
+        if href and (el_id, href) != previous:
+            return href
+        return False
+    return condition
+
+
+# conta le richieste fetch / XHR della pagina (installato alla prima
+# chiamata): [avviate, concluse, appena installato, readyState]
+_TRACK_REQUESTS_JS = """
+let fresh = false;
+if (!window.__fvgRequests) {
+  fresh = true;
+  const state = window.__fvgRequests = {started: 0, finished: 0};
+  if (window.fetch) {
+    const fetch0 = window.fetch;
+    window.fetch = function () {
+      state.started++;
+      return fetch0.apply(this, arguments).finally(() => { state.finished++; });
+    };
+  }
+  const send0 = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function () {
+    state.started++;
+    this.addEventListener("loadend", () => { state.finished++; });
+    return send0.apply(this, arguments);
+  };
+}
+const s = window.__fvgRequests;
+return [s.started, s.finished, fresh, document.readyState];
+"""
+
+# la richiesta di "visualizza" si è conclusa (senza salvaDati, per ora)
+_ANSWERED = object()
+
+
+def _salva_dati_or_answer(previous, started_before: int):
+    """
+    Condizione per WebDriverWait: l'href di un salvaDati nuovo, oppure
+    _ANSWERED quando le richieste partite dopo il click sono tutte concluse
+    (o il form ha ricaricato la pagina). Se il server non risponde non
+    torna mai: il WebDriverWait scade.
+    """
+    def condition(driver):
+        el_id, href = _salva_dati_state(driver)
+        if href and (el_id, href) != previous:
+            return href
+        started, finished, fresh, ready = driver.execute_script(_TRACK_REQUESTS_JS)
+        if fresh:
+            return _ANSWERED if ready == "complete" else False
+        if started > started_before and finished == started:
+            return _ANSWERED
+        return False
+    return condition
+
+
+def request_csv(driver, wait, year: int, month_value, pacer=None, latency_log: LatencyLog = None, station: str = None):
+    """
+    Invia il form per (anno, mese) e ritorna il testo CSV del link
+    'salvaDati', oppure None se non ci sono dati o il server non risponde.
+
+    Invece di una pausa fissa aspetta che compaia un salvaDati *nuovo*
+    (elemento o href diverso da quello prima del click). Lo status passato
+    al pacer distingue i due casi senza CSV: "no_data" se la richiesta
+    della pagina si è conclusa senza salvaDati (anno vuoto, nessun
+    backoff), "timeout" se entro il timeout di `wait` non è arrivata
+    nessuna risposta (server lento: il pacer rallenta).
+    """
+    Select(driver.find_element(By.ID, "anno")).select_by_visible_text(str(year))
+    Select(driver.find_element(By.ID, "mese")).select_by_value(str(month_value))
+
+    driver.find_element(By.ID, "giornalieri").click()
+
+    chk = driver.find_element(By.ID, "confnote")
+    if not chk.is_selected():
+        chk.click()
+
+    if pacer is not None:
+        pacer.wait_turn()
+
+    previous = _salva_dati_state(driver)
+    started_before = driver.execute_script(_TRACK_REQUESTS_JS)[0]
+    t0 = time.monotonic()
+    driver.find_element(By.ID, "visualizza").click()
+
+    try:
+        found = wait.until(_salva_dati_or_answer(previous, started_before))
+    except TimeoutException:
+        found = None
+    latency = time.monotonic() - t0
+
+    if found is _ANSWERED:
+        # risposta arrivata: il link può comparire subito dopo
+        try:
+            found = WebDriverWait(driver, SETTLE_WAIT).until(_fresh_salva_dati(previous))
+        except TimeoutException:
+            pass
+
+    if found is None:
+        csv_href, status = None, "timeout"
+    elif found is _ANSWERED:
+        csv_href, status = None, "no_data"
+    else:
+        csv_href, status = found, "ok"
+
+    if pacer is not None:
+        pacer.record(latency, status)
+    if latency_log is not None:
+        latency_log.write(
+            station=station, year=year, month=month_value,
+            latency_s=round(latency, 3), status=status,
+            delay_s=getattr(pacer, "delay", None),
+        )
+
+    if csv_href is None:
+        return None
+    return urllib.parse.unquote(csv_href.split(",", 1)[1])
+
+
+def _form_values(url: str, body: str = None) -> set[str]:
+    query = urllib.parse.urlsplit(url).query
+    return {v for _, v in urllib.parse.parse_qsl(query) + urllib.parse.parse_qsl(body or "")}
+
+
+def capture_data_request(driver, wait, station: str, year: int, month_value=ALL_MONTHS_VALUE):
+    """
+    Invia il form per (stazione, anno, mese) e ritorna la richiesta che il
+    browser ha mandato al server, letta dal log di rete di Chrome, come
+    (metodo, url, corpo): l'ultima i cui campi (query o corpo urlencoded)
+    contengono stazione e anno. None se non ci sono dati o se nessuna
+    richiesta li porta (es. CSV costruito nella pagina).
+
+    Serve un driver creato con build_driver(log_network=True).
+    """
+    select_station(driver, wait, station)
+    driver.get_log("performance")  # scarta il log fin qui
+
+    if request_csv(driver, wait, year, month_value, station=station) is None:
+        return None
+
+    found = None
+    for entry in driver.get_log("performance"):
+        message = json.loads(entry["message"])["message"]
+        if message.get("method") != "Network.requestWillBeSent":
+            continue
+        request = message["params"]["request"]
+        values = _form_values(request["url"], request.get("postData"))
+        if station in values and str(year) in values:
+            found = (request["method"], request["url"], request.get("postData"))
+    return found
+
+
+def discover(stations: list[str], url: str = URL, headless: bool = True, capture: bool = True):
+    """
+    Una sessione del browser prima dei download HTTP: gli anni abilitati
+    nel select #anno per ogni stazione e, se `capture`, la richiesta di
+    "visualizza" (capture_data_request) sull'ultimo anno della prima
+    stazione che ne restituisce una.
+
+    Ritorna (anni per stazione, richiesta) dove richiesta è
+    (metodo, url, corpo, stazione, anno, mese) oppure None.
+    """
+    driver = build_driver(headless=headless, log_network=capture)
+    try:
+        wait = WebDriverWait(driver, 15)
+        open_archive(driver, wait, url)
+
+        years = {}
+        for station in stations:
+            years[station] = select_station(driver, wait, station)
+            print(f"Anni disponibili per {station}: {len(years[station])}")
+
+        captured = None
+        for station in stations if capture else ():
+            # un tentativo per stazione, sull'ultimo anno disponibile
+            for year in years[station][-1:]:
+                request = capture_data_request(driver, wait, station, year)
+                if request is not None:
+                    captured = (*request, station, year, ALL_MONTHS_VALUE)
+            if captured is not None:
+                break
+    finally:
+        driver.quit()
+
+    return years, captured
+
+
+def fetch_year(
+    driver,
+    wait,
+    station: str,
+    year: int,
+    months,
+    all_month_value=ALL_MONTHS_VALUE,
+    pacer=None,
+    latency_log: LatencyLog = None,
+):
+    """
+    Scarica un anno di una stazione (già selezionata nel form).
+    Il ritmo delle richieste è dato da `pacer` (AdaptivePacer o TokenBucket).
+    """
+    year_dfs = []
+
+    # --- CASO 1: mese = TUTTI (1 richiesta per anno) ---
+    # --- CASO 2: fallback 12 mesi ---
+    if all_month_value is not None:
+        requests = [(all_month_value, None)]
+    else:
+        requests = [(month, month) for month in months]
+
+    for month_value, month in requests:
+        csv_text = request_csv(
+            driver, wait, year, month_value,
+            pacer=pacer, latency_log=latency_log, station=station,
+        )
+        if csv_text is None:
+            if month is None:
+                print(f"  ⚠️ Nessun dato (tutti i mesi) per {station} {year}")
+            continue
+
+        year_dfs.append(csv_to_frame(csv_text, station, year, month))
+
+    if not year_dfs:
+        return None
+
+    return pd.concat(year_dfs, ignore_index=True)
+
+
+def scrape_station_monthly(
+    driver: webdriver.Chrome,
+    wait: WebDriverWait,
+    station: str,
+    months,
+    store: RawStationStore,
+    rate_limit: int = 3,
+    pacer: AdaptivePacer = None,
+    latency_log: LatencyLog = None,
+):
+    """
+    Scrape dati giornalieri (CSV) per una singola stazione.
+    Se disponibile, usa 'mese = Tutti' per fare 1 richiesta per anno.
+    Ogni anno diventa un chunk immutabile in `store` (vedi utils.raw_store).
+    Il pacer parte dalla vecchia pausa fissa (rate_limit + CLICK_WAIT tra
+    due richieste) e, se il server risponde in fretta, scende fino a
+    `rate_limit` secondi, mai sotto.
+    """
+
+    if pacer is None:
+        pacer = AdaptivePacer(min_delay=rate_limit, start_delay=rate_limit + CLICK_WAIT)
+
+    # seleziona stazione UNA volta e aspetta refresh anni
+    available_years = select_station(driver, wait, station)
+    print(
+        f"Anni disponibili per {station}: "
+        f"{available_years[0]}..{available_years[-1]} ({len(available_years)})"
+    )
+
+    # prova a scoprire il value di "Tutti" (una volta, dopo che il DOM è pronto)
+    all_month_value = ALL_MONTHS_VALUE
+    if all_month_value is not None:
+        print(f"✔ Opzione mese 'Tutti' rilevata: value={all_month_value!r} (1 richiesta/anno)")
+    else:
+        print("ℹ Opzione mese 'Tutti' non trovata: fallback a 12 mesi")
+
+    for year in tqdm(available_years, desc=f"{station} – anni", leave=True):
+        year_key = str(year)
+
+        if store.has_year(year_key):
+            print(f"⏭️ {station} {year} già presente, skip")
+            continue
+
+        year_df = fetch_year(
+            driver, wait, station, year, months,
+            all_month_value=all_month_value,
+            pacer=pacer,
+            latency_log=latency_log,
+        )
+
+        if year_df is None:
+            print(f"⚠️ Nessun dato per {station} {year}")
+            continue
+
+        # salva anno come chunk JSON Lines (lista di record)
+        store.write_year(year_key, year_df.to_dict(orient="records"))
+
+        print(f"✔ Salvato {station} {year} ({len(year_df)} record)")
+
+
+def scrape_stations(
+    stations: list[str],
+    months,
+    out_dir: Path,
+    rate_limit: int = 3,
+    headless: bool = True,
+    url: str = URL,
+    latency_log_path: Path = None,
+):
+    """
+    Scrape più stazioni, salvando un JSON per ciascuna.
+    """
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # un solo pacer per tutte le stazioni: il ritmo appreso non riparte da zero
+    pacer = AdaptivePacer(min_delay=rate_limit, start_delay=rate_limit + CLICK_WAIT)
+    latency_log = LatencyLog(latency_log_path) if latency_log_path else None
+
+    driver = build_driver(headless=headless)
+    wait = WebDriverWait(driver, 15)
+
+    open_archive(driver, wait, url)
+
+    for station in tqdm(stations, desc="Stazioni"):
+        print(f"\n▶ Scraping stazione: {station}")
+
+        scrape_station_monthly(
+            driver=driver,
+            wait=wait,
+            station=station,
+            months=months,
+            store=RawStationStore.for_station(out_dir, station),
+            rate_limit=rate_limit,
+            pacer=pacer,
+            latency_log=latency_log,
+        )
+
+    driver.quit()
+
+
+# -----------------
+# Modalità parallela (pool di driver)
+# -----------------
+def scrape_stations_parallel(
+    stations: list[str],
+    months,
+    out_dir: Path,
+    n_workers: int = 4,
+    requests_per_second: float = 1 / 3,
+    headless: bool = True,
+    url: str = URL,
+    driver_factory=build_driver,
+    fetch=fetch_year,
+    latency_log_path: Path = None,
+):
+    """
+    Come scrape_stations, ma con `n_workers` driver in parallelo che si
+    dividono le coppie (stazione, anno). Il ritmo globale delle richieste
+    resta limitato da un unico token bucket (`requests_per_second`).
+    """
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    store = StationStore(out_dir)
+    limiter = TokenBucket(rate=requests_per_second)
+    latency_log = LatencyLog(latency_log_path) if latency_log_path else None
+
+    # ---- Scoperta anni (un solo driver)
+    driver = driver_factory(headless=headless)
+    try:
+        wait = WebDriverWait(driver, 15)
+        open_archive(driver, wait, url)
+
+        tasks = queue.Queue()
+        n_tasks = 0
+        for station in stations:
+            years = select_station(driver, wait, station)
+            print(f"Anni disponibili per {station}: {len(years)}")
+            for year in years:
+                if store.has_year(station, str(year)):
+                    continue
+                tasks.put((station, year))
+                n_tasks += 1
+    finally:
+        driver.quit()
+
+    if n_tasks == 0:
+        print("[OK] niente da scaricare")
+        return
+
+    pbar = tqdm(total=n_tasks, desc="Stazione/anno")
+    errors = []
+    startup_errors = []
+    done = {"saved": 0, "empty": 0}
+    done_lock = threading.Lock()
+
+    def worker():
+        try:
+            drv = driver_factory(headless=headless)
+        except Exception as exc:
+            startup_errors.append(repr(exc))
+            return
+        wt = WebDriverWait(drv, 15)
+        current = None
+        try:
+            try:
+                open_archive(drv, wt, url)
+            except Exception as exc:
+                startup_errors.append(repr(exc))
+                return
+            while True:
+                try:
+                    station, year = tasks.get_nowait()
+                except queue.Empty:
+                    return
+
+                try:
+                    if station != current:
+                        select_station(drv, wt, station)
+                        current = station
+
+                    year_df = fetch(drv, wt, station, year, months, pacer=limiter, latency_log=latency_log)
+                    if year_df is None:
+                        print(f"⚠️ Nessun dato per {station} {year}")
+                        outcome = "empty"
+                    else:
+                        store.save_year(station, str(year), year_df.to_dict(orient="records"))
+                        outcome = "saved"
+                    with done_lock:
+                        done[outcome] += 1
+                except Exception as exc:
+                    errors.append((station, year, repr(exc)))
+                    current = None  # stato del form incerto: riseleziona
+                finally:
+                    pbar.update(1)
+        finally:
+            drv.quit()
+
+    threads = [
+        threading.Thread(target=worker, name=f"scraper-{i}", daemon=True)
+        for i in range(min(n_workers, n_tasks))
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pbar.close()
+
+    # rimasti in coda: tutti i driver sono morti prima di prenderli
+    pending = []
+    while not tasks.empty():
+        pending.append(tasks.get_nowait())
+
+    for err in startup_errors:
+        print(f"  ⚠️ Driver non avviato: {err}")
+    for station, year, err in errors:
+        print(f"  ⚠️ Errore {station} {year}: {err}")
+    for station, year in pending:
+        print(f"  ⚠️ Non scaricato {station} {year}")
+
+    n_done = done["saved"] + done["empty"]
+    status = "[OK]" if n_done == n_tasks else "[WARN]"
+    print(
+        f"{status} scaricati {n_done}/{n_tasks} anni ({done['saved']} salvati, {done['empty']} senza dati) "
+        f"con {len(threads) - len(startup_errors)}/{len(threads)} driver; "
+        f"{len(errors)} falliti, {len(pending)} non scaricati"
+    )
@@ -0,0 +1,178 @@
+"""
+Pezzi condivisi dagli scraper (browser.py, http_fetch.py) e dalla CLI in
+scrape_all_months.py: URL e costanti del form, cartella dei dati grezzi,
+ritmo delle richieste (TokenBucket, AdaptivePacer), log delle latenze,
+archivio per stazione e parsing del CSV. Nessuna dipendenza da Selenium.
+"""
+import time
+import json
+import threading
+from io import StringIO
+from pathlib import Path
+
+import pandas as pd
+
+from src.utils.raw_store import RawStationStore
+
+
+URL = "https://www.meteo.fvg.it/archivio.php?ln=&p=dati"
+
+# valore dell'opzione mese "Tutti" (1 richiesta per anno)
+ALL_MONTHS_VALUE = 99
+
+# pausa fissa che il vecchio loop faceva dopo "visualizza": con rate_limit
+# dava rate_limit + 2 s tra l'inizio di due richieste. Il pacer parte da
+# lì e accelera fino a rate_limit se il server risponde in fretta
+CLICK_WAIT = 2
+
+# ritmo per driver / connessione (una richiesta ogni 3 s, il vecchio
+# rate_limit) e tetto globale di cortesia verso il server: con più worker
+# il ritmo totale cresce con il loro numero, ma non oltre il tetto
+PER_WORKER_RPS = 1 / 3
+MAX_REQUESTS_PER_SECOND = 1.0
+
+# dove gli scraper salvano i chunk per stazione/anno (vedi utils.raw_store)
+RAW_DIR = Path("data/raw/arpa")
+
+
+def requests_per_second(
+    n_workers: int,
+    per_worker: float = PER_WORKER_RPS,
+    cap: float = MAX_REQUESTS_PER_SECOND,
+) -> float:
+    """Ritmo globale (richieste/s) per `n_workers`: n_workers * per_worker, al massimo `cap`."""
+    return min(cap, max(1, n_workers) * per_worker)
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: al massimo `rate` richieste/secondo in media,
+    con burst di `capacity` richieste. Condiviso tra tutti i driver.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate
+            time.sleep(wait_s)
+
+    # stessa interfaccia di AdaptivePacer
+    def wait_turn(self):
+        self.acquire()
+
+    def record(self, latency: float, status: str):
+        pass
+
+
+class AdaptivePacer:
+    """
+    Ritmo adattivo per un singolo driver.
+
+    Tra l'inizio di due richieste passano almeno `delay` secondi: parte da
+    `start_delay` (default `min_delay`) e non scende mai sotto `min_delay`,
+    quindi il picco resta <= 1/min_delay richieste/s. Il delay cresce di
+    `backoff` dopo timeout o risposte più lente di `slow_after`, e cala di
+    `speedup` quando il server risponde in fretta. Le richieste senza dati
+    ("no_data": risposta arrivata, anno vuoto) non lo cambiano.
+    """
+
+    def __init__(
+        self,
+        min_delay: float = 3.0,
+        max_delay: float = 60.0,
+        slow_after: float = 5.0,
+        backoff: float = 2.0,
+        speedup: float = 0.8,
+        start_delay: float = None,
+    ):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.slow_after = slow_after
+        self.backoff = backoff
+        self.speedup = speedup
+        self.delay = min_delay if start_delay is None else max(min_delay, start_delay)
+        self._last_start = None
+
+    def wait_turn(self):
+        if self._last_start is not None:
+            remaining = self._last_start + self.delay - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        self._last_start = time.monotonic()
+
+    def record(self, latency: float, status: str):
+        if status == "no_data":
+            return
+        if status == "timeout" or latency > self.slow_after:
+            self.delay = min(self.max_delay, self.delay * self.backoff)
+        else:
+            self.delay = max(self.min_delay, self.delay * self.speedup)
+
+
+class LatencyLog:
+    """Append JSON-lines con la latenza di ogni richiesta (thread-safe)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, **entry):
+        line = json.dumps({"ts": time.time(), **entry}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def csv_to_frame(csv_text: str, station: str, year: int, month=None) -> pd.DataFrame:
+    """CSV di salvaDati -> DataFrame con le colonne `anno` / `stazione` (e `mese` se fissato)."""
+    df = pd.read_csv(StringIO(csv_text), sep=";")
+    df["anno"] = year
+    # NOTA: in modalità "tutti", il CSV dovrebbe già contenere la data/giorno/mese.
+    # Non forziamo df["mese"] qui, perché rischi di sovrascrivere un campo già presente.
+    if month is not None:
+        df["mese"] = month
+    df["stazione"] = station
+    return df
+
+
+# -----------------
+# Modalità parallela (pool di driver)
+# -----------------
+class StationStore:
+    """
+    Un RawStationStore per stazione condiviso tra i worker: ogni anno è un
+    chunk separato e il manifest è aggiornato sotto lock, quindi anni della
+    stessa stazione scaricati da driver diversi non si pestano i piedi.
+    """
+
+    def __init__(self, out_dir: Path):
+        self.out_dir = out_dir
+        self._stores: dict[str, RawStationStore] = {}
+        self._guard = threading.Lock()
+
+    def _store(self, station: str) -> RawStationStore:
+        with self._guard:
+            if station not in self._stores:
+                self._stores[station] = RawStationStore.for_station(self.out_dir, station)
+            return self._stores[station]
+
+    def has_year(self, station: str, year_key: str) -> bool:
+        return self._store(station).has_year(year_key)
+
+    def save_year(self, station: str, year_key: str, records: list[dict]):
+        self._store(station).write_year(year_key, records)
@@ -0,0 +1,414 @@
+"""
+Fetcher HTTP diretto per l'export CSV dell'archivio (--mode http, non di
+default).
+
+Chrome serve a inviare il form di archivio.php: qui la richiesta che parte
+dal pulsante "visualizza" viene ripetuta direttamente per ogni (stazione,
+anno) e il CSV letto dalla risposta, senza passare dal data-URI di
+salvaDati. La richiesta (DataRequest) non è scritta nel codice:
+
+- di default una sessione del browser (browser.discover) legge gli anni
+  abilitati nel select #anno di ogni stazione e cattura dal log di rete di
+  Chrome la richiesta vera di "visualizza" (URL, metodo, campi);
+- con --data-url (template con {station} / {year} / {month}) e --years
+  non serve nessun browser, es. contro lo stand-in.
+
+Se la richiesta catturata non risponde con un CSV (es. la pagina costruisce
+il CSV da una tabella HTML) la prova iniziale fallisce e tutto passa al
+fallback Selenium.
+
+- connessioni: un urllib3.PoolManager condiviso (keep-alive, al massimo
+  `n_workers` connessioni aperte, retry con backoff su 429/5xx)
+- concorrenza: thread oppure asyncio; in entrambi i casi un solo token
+  bucket limita il ritmo globale delle richieste
+- fallback: gli anni la cui risposta non è un CSV (errore HTTP, HTML,
+  timeout) vengono riscaricati con Selenium (browser.scrape_stations), che salta
+  gli anni già salvati
+
+    python -m src.scraping.scrape_all_months --mode http
+    # test locale contro lo stand-in (i dati sono in /dati.php):
+    python -m src.scraping.standin --port 8765
+    python -m src.scraping.scrape_all_months --mode http --years 2000-2005 --no-fallback \\
+        --url "http://127.0.0.1:8765/archivio.php?ln=&p=dati" \\
+        --data-url "http://127.0.0.1:8765/dati.php?stazione={station}&anno={year}&mese={month}"
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import asyncio
+import time
+import urllib.parse
+
+import pandas as pd
+import urllib3
+
+from src.scraping.common import (
+    ALL_MONTHS_VALUE,
+    PER_WORKER_RPS,
+    URL,
+    LatencyLog,
+    StationStore,
+    TokenBucket,
+    csv_to_frame,
+)
+
+
+# prima colonna del CSV esportato: distingue il CSV da una pagina HTML
+CSV_FIRST_COLUMN = "mese"
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class FetchError(RuntimeError):
+    """Risposta inattesa (non CSV, status HTTP non gestito, rete)."""
+
+
+class DataRequest:
+    """
+    La richiesta dati di "visualizza": metodo, URL e campi del form, con i
+    nomi dei campi che portano stazione, anno e mese. I campi vanno nella
+    query per GET e nel corpo (urlencoded) per POST.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        url: str,
+        fields: dict[str, str],
+        station_field: str,
+        year_field: str,
+        month_field: str,
+    ):
+        self.method = method.upper()
+        self.url = url
+        self.fields = fields
+        self.station_field = station_field
+        self.year_field = year_field
+        self.month_field = month_field
+
+    def __repr__(self):
+        return f"DataRequest({self.method} {self.url} {sorted(self.fields)})"
+
+    def fields_for(self, station: str, year: int, month_value) -> dict[str, str]:
+        return {
+            **self.fields,
+            self.station_field: station,
+            self.year_field: str(year),
+            self.month_field: str(month_value),
+        }
+
+    @classmethod
+    def _from_fields(cls, method: str, url: str, fields: list[tuple[str, str]], values: dict[str, str]):
+        names = {}
+        for key, wanted in values.items():
+            matches = [name for name, value in fields if value == wanted]
+            if not matches:
+                raise ValueError(f"nessun campo con {key}={wanted!r} in {method} {url}")
+            names[key] = matches[0]
+        fixed = {name: value for name, value in fields if name not in names.values()}
+        return cls(method, url, fixed, names["station"], names["year"], names["month"])
+
+    @classmethod
+    def from_captured(cls, method: str, url: str, body: str, station: str, year: int, month_value):
+        """Dalla richiesta catturata dal browser (browser.discover) per (stazione, anno, mese)."""
+        parts = urllib.parse.urlsplit(url)
+        if method.upper() == "GET":
+            fields = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+            url = urllib.parse.urlunsplit(parts._replace(query=""))
+        else:
+            fields = urllib.parse.parse_qsl(body or "", keep_blank_values=True)
+        values = {"station": station, "year": str(year), "month": str(month_value)}
+        return cls._from_fields(method, url, fields, values)
+
+    @classmethod
+    def from_template(cls, template: str, method: str = "GET"):
+        """Da un URL con {station} / {year} / {month} nella query, es. quello di --data-url."""
+        parts = urllib.parse.urlsplit(template)
+        fields = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        url = urllib.parse.urlunsplit(parts._replace(query=""))
+        values = {"station": "{station}", "year": "{year}", "month": "{month}"}
+        return cls._from_fields(method, url, fields, values)
+
+
+class HttpArchiveClient:
+    """Client thread-safe per l'endpoint dati; le connessioni restano aperte tra le richieste."""
+
+    def __init__(
+        self,
+        data_request: DataRequest,
+        url: str = URL,
+        pool_size: int = 4,
+        timeout: float = 15.0,
+        retries: int = 2,
+    ):
+        self.archive_url = url
+        self.data_request = data_request
+        self.data_url = data_request.url
+        self.http = urllib3.PoolManager(
+            maxsize=pool_size,
+            block=True,
+            timeout=urllib3.Timeout(total=timeout),
+            retries=urllib3.Retry(
+                total=retries,
+                backoff_factor=0.5,
+                status_forcelist=RETRY_STATUS,
+                raise_on_status=False,
+            ),
+            headers={"Referer": url, "User-Agent": "fvg-meteo-analysis"},
+        )
+
+    def request_csv(
+        self,
+        station: str,
+        year: int,
+        month_value,
+        pacer=None,
+        latency_log: LatencyLog = None,
+    ):
+        """
+        Testo CSV per (stazione, anno, mese), None se non ci sono dati
+        (un CSV con la sola intestazione). FetchError per tutto il resto,
+        404 compreso: un endpoint sbagliato non deve sembrare "senza dati".
+        """
+        request = self.data_request
+        fields = request.fields_for(station, year, month_value)
+        # POST: corpo urlencoded come quello del form, non multipart
+        body_kw = {} if request.method in ("GET", "HEAD", "DELETE") else {"encode_multipart": False}
+
+        if pacer is not None:
+            pacer.wait_turn()
+
+        t0 = time.monotonic()
+        try:
+            resp = self.http.request(request.method, self.data_url, fields=fields, **body_kw)
+            status = "ok" if resp.status == 200 else f"http_{resp.status}"
+        except urllib3.exceptions.HTTPError as exc:
+            resp = None
+            status = "timeout" if isinstance(exc, urllib3.exceptions.TimeoutError) else "error"
+        latency = time.monotonic() - t0
+
+        if pacer is not None:
+            pacer.record(latency, status)
+        if latency_log is not None:
+            latency_log.write(
+                station=station, year=year, month=month_value,
+                latency_s=round(latency, 3), status=status, via="http",
+            )
+
+        if resp is None:
+            raise FetchError(f"{status}: {self.data_url}")
+        if resp.status != 200:
+            raise FetchError(f"HTTP {resp.status}: {self.data_url}")
+
+        text = resp.data.decode(_charset(resp.headers.get("Content-Type", "")))
+        lines = text.strip().splitlines()
+        if not lines or not lines[0].startswith(CSV_FIRST_COLUMN) or ";" not in lines[0]:
+            raise FetchError(f"risposta non CSV da {self.data_url} ({text[:40]!r})")
+        if len(lines) == 1:
+            return None
+        return text
+
+    def close(self):
+        self.http.clear()
+
+
+def _charset(content_type: str, default: str = "utf-8") -> str:
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "charset" and value:
+            return value.strip('"')
+    return default
+
+
+class AsyncTokenBucket:
+    """TokenBucket per asyncio: le attese non bloccano il loop."""
+
+    def __init__(self, rate: float, capacity: float = 1.0, tokens: float = None):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity if tokens is None else tokens
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def fetch_year_http(
+    client: HttpArchiveClient,
+    station: str,
+    year: int,
+    months,
+    all_month_value=ALL_MONTHS_VALUE,
+    pacer=None,
+    latency_log: LatencyLog = None,
+):
+    """Come fetch_year, ma via HTTP: DataFrame dell'anno o None se non ci sono dati."""
+    if all_month_value is not None:
+        requests = [(all_month_value, None)]
+    else:
+        requests = [(month, month) for month in months]
+
+    year_dfs = []
+    for month_value, month in requests:
+        csv_text = client.request_csv(station, year, month_value, pacer=pacer, latency_log=latency_log)
+        if csv_text is not None:
+            year_dfs.append(csv_to_frame(csv_text, station, year, month))
+
+    if not year_dfs:
+        return None
+    return pd.concat(year_dfs, ignore_index=True)
+
+
+def _fetch_task(client, store: StationStore, station: str, year: int, months, pacer, latency_log) -> str:
+    """
+    Scarica e salva un anno; ritorna "saved", "empty" o "failed: ...".
+    Qualsiasi errore (anche di parsing o di scrittura) resta confinato a
+    questo anno, che passa al fallback come gli altri falliti.
+    """
+    try:
+        year_df = fetch_year_http(client, station, year, months, pacer=pacer, latency_log=latency_log)
+        if year_df is None:
+            return "empty"
+        store.save_year(station, str(year), year_df.to_dict(orient="records"))
+    except FetchError as exc:
+        return f"failed: {exc}"
+    except Exception as exc:
+        return f"failed: {exc!r}"
+    return "saved"
+
+
+async def _fetch_all_async(client, store, tasks, months, n_workers, requests_per_second, latency_log):
+    # la richiesta di prova ha appena usato il primo token
+    limiter = AsyncTokenBucket(rate=requests_per_second, tokens=0)
+    slots = asyncio.Semaphore(n_workers)
+
+    async def one(station, year):
+        async with slots:
+            await limiter.acquire()
+            # la richiesta resta bloccante (urllib3) ma gira fuori dal loop
+            return await asyncio.to_thread(_fetch_task, client, store, station, year, months, None, latency_log)
+
+    return await asyncio.gather(*(one(s, y) for s, y in tasks))
+
+
+def _captured_request(captured) -> DataRequest:
+    """DataRequest dalla richiesta catturata da browser.discover, o None (con avviso)."""
+    if captured is None:
+        print("⚠️ nessuna richiesta dati catturata da \"visualizza\"")
+        return None
+    try:
+        return DataRequest.from_captured(*captured)
+    except ValueError as exc:
+        print(f"⚠️ richiesta catturata non utilizzabile: {exc}")
+        return None
+
+
+def scrape_stations_http(
+    stations: list[str],
+    years,
+    months,
+    out_dir: Path,
+    data_request: DataRequest = None,
+    url: str = URL,
+    n_workers: int = 4,
+    requests_per_second: float = 1 / 3,
+    use_asyncio: bool = False,
+    fallback: bool = True,
+    headless: bool = True,
+    latency_log_path: Path = None,
+) -> list[tuple[str, int, str]]:
+    """
+    Scarica le coppie (stazione, anno) non ancora salvate in `out_dir` via
+    HTTP. `years` sono gli anni da provare per tutte le stazioni (quelli
+    senza dati, CSV con la sola intestazione, vengono saltati); None li
+    legge dal form. `data_request` None cattura la richiesta dal browser
+    (vedi browser.discover); una sola sessione serve per entrambi.
+
+    Le stazioni con anni falliti passano a Selenium se `fallback`; se la
+    richiesta manca o già la prima non dà un CSV passano tutte.
+    Ritorna i fallimenti HTTP come (stazione, anno, errore).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    store = StationStore(out_dir)
+    latency_log = LatencyLog(latency_log_path) if latency_log_path else None
+
+    years_by_station = {s: list(years) for s in stations} if years is not None else None
+    if years_by_station is None or data_request is None:
+        from src.scraping.browser import discover
+
+        found, captured = discover(stations, url=url, headless=headless, capture=data_request is None)
+        years_by_station = years_by_station or found
+        if data_request is None:
+            data_request = _captured_request(captured)
+
+    tasks = [(s, y) for s in stations for y in years_by_station[s] if not store.has_year(s, str(y))]
+    if not tasks:
+        print("[OK] niente da scaricare")
+        return []
+
+    t0 = time.monotonic()
+    if data_request is None:
+        probe = "failed: nessuna richiesta dati"
+        results = [probe] * len(tasks)
+    else:
+        print(f"✔ {data_request!r}")
+        client = HttpArchiveClient(data_request, url, pool_size=n_workers)
+        limiter = TokenBucket(rate=requests_per_second)
+        try:
+            # prova l'endpoint con il primo anno prima di lanciare tutto il resto
+            probe = _fetch_task(client, store, tasks[0][0], tasks[0][1], months, limiter, latency_log)
+            if probe.startswith("failed"):
+                print(f"⚠️ {client.data_url} non risponde con un CSV ({probe})")
+                results = [probe] * len(tasks)
+            elif use_asyncio:
+                results = [probe, *asyncio.run(
+                    _fetch_all_async(client, store, tasks[1:], months, n_workers, requests_per_second, latency_log)
+                )]
+            else:
+                with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                    results = [probe, *pool.map(
+                        lambda task: _fetch_task(client, store, task[0], task[1], months, limiter, latency_log),
+                        tasks[1:],
+                    )]
+        finally:
+            client.close()
+
+    failures = [(s, y, r) for (s, y), r in zip(tasks, results) if r.startswith("failed")]
+    n_saved = sum(r == "saved" for r in results)
+    status = "[OK]" if not failures else "[WARN]"
+    print(
+        f"{status} HTTP: {n_saved} anni salvati, {results.count('empty')} senza dati, "
+        f"{len(failures)} falliti in {time.monotonic() - t0:.1f}s"
+    )
+    if not probe.startswith("failed"):
+        for station, year, err in failures:
+            print(f"  ⚠️ {station} {year}: {err}")
+
+    if failures and fallback:
+        from src.scraping.browser import scrape_stations
+
+        failed_stations = list(dict.fromkeys(s for s, _, _ in failures))
+        print(f"▶ Fallback Selenium per: {', '.join(failed_stations)}")
+        scrape_stations(
+            stations=failed_stations,
+            months=months,
+            out_dir=out_dir,
+            # un solo driver: non più veloce di un worker
+            rate_limit=max(1, round(1 / min(requests_per_second, PER_WORKER_RPS))),
+            headless=headless,
+            url=url,
+            latency_log_path=latency_log_path,
+        )
+
+    return failures
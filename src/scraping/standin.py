@@ -0,0 +1,196 @@
+"""
+Stand-in locale per archivio.php (solo per sviluppo/test dello scraper).
+
+Serve un form con gli stessi id della pagina ARPA (#stazione, #anno, #mese,
+#giornalieri, #confnote, #visualizza, #cookieModal/#ok) e, dopo "visualizza",
+un link #salvaDati con il CSV in data-URI. I dati sono sintetici ma
+deterministici per (stazione, anno, mese).
+
+    python -m src.scraping.standin --port 8765
+    # poi: browser.scrape_stations(..., url="http://127.0.0.1:8765/archivio.php?ln=&p=dati")
+    # oppure, senza browser: http_fetch.scrape_stations_http(..., url=..., data_request=
+    #     DataRequest.from_template(".../dati.php?stazione={station}&anno={year}&mese={month}"))
+"""
+import calendar
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CSV_COLUMNS = [
+    "mese", "giorno*",
+    "Pioggia mm",
+    "Temp. min °C", "Temp. med °C", "Temp. max °C",
+    "Umidita' min %", "Umidita' med %", "Umidita' max %",
+    "Vento med km/h", "Vento max km/h", "Dir. V. max °N",
+    "Radiaz. KJ/m2", "Press. med hPa",
+]
+
+DEFAULT_STATIONS = {
+    "Monte Lussari": list(range(2000, 2005)),
+    "Piancavallo": list(range(2002, 2006)),
+}
+
+PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>archivio (stand-in)</title></head>
+<body>
+<div id="cookieModal" style="display:block">
+  <button id="ok" onclick="document.getElementById('cookieModal').style.display='none'">OK</button>
+</div>
+<form onsubmit="return false">
+  <select id="stazione"><option value="">--</option>__STATIONS__</select>
+  <select id="anno">__YEARS__</select>
+  <select id="mese">__MONTHS__<option value="99">Tutti</option></select>
+  <input type="radio" id="giornalieri" name="tipo" value="giornalieri">
+  <input type="checkbox" id="confnote">
+  <button type="button" id="visualizza">Visualizza</button>
+</form>
+<div id="risultato"></div>
+<script>
+const YEARS = __YEARS_JSON__;
+const st = document.getElementById("stazione");
+st.addEventListener("change", () => {
+  const ok = YEARS[st.value] || [];
+  for (const o of document.querySelectorAll("#anno option")) {
+    o.disabled = !ok.includes(parseInt(o.value));
+  }
+});
+document.getElementById("visualizza").addEventListener("click", async () => {
+  const old = document.getElementById("salvaDati");
+  if (old) old.remove();
+  const q = new URLSearchParams({
+    stazione: st.value,
+    anno: document.getElementById("anno").value,
+    mese: document.getElementById("mese").value,
+  });
+  const r = await fetch("/dati.php?" + q.toString());
+  const text = await r.text();
+  if (r.status !== 200 || !text.trim().includes("\n")) return;
+  const a = document.createElement("a");
+  a.id = "salvaDati";
+  a.textContent = "Salva dati";
+  a.href = "data:text/csv;charset=utf-8," + encodeURIComponent(text);
+  document.getElementById("risultato").appendChild(a);
+});
+</script>
+</body></html>
+"""
+
+
+def _value(rng: random.Random, col: str) -> str:
+    if rng.random() < 0.1:
+        return "-"
+    if col == "Dir. V. max °N":
+        return str(rng.randint(0, 360))
+    if col == "Press. med hPa":
+        return f"{rng.uniform(850, 1040):.1f}"
+    if col.startswith("Umidita"):
+        return f"{rng.uniform(20, 100):.1f}"
+    if col.startswith("Temp."):
+        return f"{rng.uniform(-15, 30):.1f}"
+    return f"{rng.uniform(0, 40):.1f}"
+
+
+def make_csv(station: str, year: int, month: int) -> str:
+    """CSV ';'-separato come quello esportato da salvaDati."""
+    months = range(1, 13) if month == 99 else [month]
+    lines = [";".join(CSV_COLUMNS)]
+    for m in months:
+        rng = random.Random(f"{station}|{year}|{m}")
+        for d in range(1, calendar.monthrange(year, m)[1] + 1):
+            lines.append(";".join([str(m), str(d)] + [_value(rng, c) for c in CSV_COLUMNS[2:]]))
+    return "\n".join(lines) + "\n"
+
+
+def _render_page(stations: dict[str, list[int]]) -> str:
+    all_years = sorted({y for ys in stations.values() for y in ys})
+    return (
+        PAGE
+        .replace("__STATIONS__", "".join(f"<option>{s}</option>" for s in stations))
+        .replace("__YEARS__", "".join(f'<option value="{y}" disabled>{y}</option>' for y in all_years))
+        .replace("__MONTHS__", "".join(f'<option value="{m}">{m}</option>' for m in range(1, 13)))
+        .replace("__YEARS_JSON__", json.dumps(stations))
+    )
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    stations: dict[str, list[int]] = None,
+    latency: float = 0.0,
+) -> ThreadingHTTPServer:
+    """
+    Crea (senza avviarlo) il server stand-in. `latency` simula il tempo di
+    risposta di dati.php. I timestamp delle richieste dati finiscono in
+    `server.data_requests`, utile per verificare il rate limit.
+    """
+    stations = stations or DEFAULT_STATIONS
+    page = _render_page(stations).encode("utf-8")
+    log_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, ctype: str):
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parsed = urllib.parse.urlparse(self.path)
+            if parsed.path == "/archivio.php":
+                return self._send(200, page, "text/html; charset=utf-8")
+
+            if parsed.path == "/dati.php":
+                q = dict(urllib.parse.parse_qsl(parsed.query))
+                with log_lock:
+                    server.data_requests.append(time.monotonic())
+                if latency:
+                    time.sleep(latency)
+                station = q.get("stazione", "")
+                try:
+                    year, month = int(q.get("anno", "")), int(q.get("mese", ""))
+                except ValueError:
+                    return self._send(400, b"", "text/plain")
+                if year not in stations.get(station, []):
+                    # anno senza dati: CSV con la sola intestazione
+                    header = ";".join(CSV_COLUMNS) + "\n"
+                    return self._send(200, header.encode("utf-8"), "text/csv; charset=utf-8")
+                return self._send(200, make_csv(station, year, month).encode("utf-8"), "text/csv; charset=utf-8")
+
+            self._send(404, b"", "text/plain")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.data_requests = []
+    return server
+
+
+def archive_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/archivio.php?ln=&p=dati"
+
+
+def start_in_thread(**kwargs) -> ThreadingHTTPServer:
+    """Avvia il server in un thread daemon; chiudere con server.shutdown()."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stand-in locale di archivio.php")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    srv = make_server(port=args.port, latency=args.latency)
+    print(f"[OK] stand-in su {archive_url(srv)}")
+    srv.serve_forever()
@@ -0,0 +1,404 @@
+"""
+Local query service over the processed datasets.
+
+The Parquet files are loaded once into per-station views (rows sorted by
+station / year / month, a slice per station, year * 100 + month keys for
+binary search), so a query touches one station's rows only:
+
+    anomalies(station, year=None, all_months=False)
+    top_features(station, year, month)
+    similar_months(station, year, month, top_k=10)
+
+Results go through a bounded LRU cache. Every dataset remembers the
+(mtime, size) of its file; at most every CHECK_INTERVAL seconds a query
+re-stats it, and a changed file is reloaded and the cache dropped. Loaded
+views are never modified, only replaced, so concurrent readers need no
+lock.
+
+Similar months come from similar_months.parquet when it has enough
+neighbours per month, else from the quantile index (quantile_index.py).
+
+In process:
+
+    engine = QueryEngine()
+    engine.anomalies("Udine")
+
+Over HTTP (JSON, keep-alive, one thread per connection):
+
+    python -m src.service.query --port 8766
+    curl "http://127.0.0.1:8766/anomalies?station=Udine"
+    curl "http://127.0.0.1:8766/top_features?station=Udine&year=2003&month=8"
+    curl "http://127.0.0.1:8766/similar_months?station=Udine&year=2003&month=8&top_k=5"
+"""
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from src.processing.datasets import PROCESSED_DIR
+from src.processing.quantile_index import QuantileIndex
+
+
+ANOMALIES_FILE = "monthly_anomalies.parquet"
+SIMILAR_FILE = "similar_months.parquet"
+INDEX_FILE = "quantile_index.parquet"
+
+CACHE_SIZE = 4096           # cached query results
+CHECK_INTERVAL = 1.0        # seconds between file change checks
+TOP_K = 10
+
+TOP_FEATURE_FIELDS = ("feature", "abs_z", "z", "value")
+
+
+# ---- Cache ----
+class LRUCache:
+    """Thread-safe LRU mapping with at most `maxsize` entries."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ---- Views ----
+def _signature(path: Path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class StationView:
+    """
+    A table sorted by station and (year, month), with the contiguous rows
+    of every station and a year * 100 + month key for binary search.
+    """
+
+    def __init__(self, df: pd.DataFrame, year_col: str = "year", month_col: str = "month"):
+        df = df.sort_values(["station_name", year_col, month_col], kind="stable").reset_index(drop=True)
+        self.df = df
+
+        stations = df["station_name"].astype(str).to_numpy()
+        bounds = np.flatnonzero(stations[1:] != stations[:-1]) + 1 if len(stations) else np.empty(0, dtype="int64")
+        starts = np.concatenate([[0], bounds]).astype("int64")
+        ends = np.concatenate([bounds, [len(stations)]]).astype("int64")
+        self.rows = {stations[s]: slice(int(s), int(e)) for s, e in zip(starts, ends)} if len(stations) else {}
+        self.ym = (df[year_col].to_numpy(dtype="int64") * 100 + df[month_col].to_numpy(dtype="int64"))
+
+    def station(self, station: str) -> slice:
+        rows = self.rows.get(station)
+        if rows is None:
+            raise KeyError(f"unknown station: {station!r}")
+        return rows
+
+    def month_rows(self, station: str, year: int, month: int) -> slice:
+        """Rows of (station, year, month); empty slice if there are none."""
+        rows = self.station(station)
+        ym = self.ym[rows]
+        key = int(year) * 100 + int(month)
+        lo = rows.start + int(np.searchsorted(ym, key, side="left"))
+        hi = rows.start + int(np.searchsorted(ym, key, side="right"))
+        return slice(lo, hi)
+
+
+class _Dataset:
+    """A file, the view loaded from it and the file signature at load time."""
+
+    def __init__(self, path: Path, loader):
+        self.path = path
+        self.loader = loader
+        self.value = None
+        self.signature = None
+        self.checked = None
+
+
+# ---- Engine ----
+class QueryEngine:
+    def __init__(
+        self,
+        processed_dir: Path = PROCESSED_DIR,
+        cache_size: int = CACHE_SIZE,
+        check_interval: float = CHECK_INTERVAL,
+    ):
+        processed_dir = Path(processed_dir)
+        self.check_interval = check_interval
+        self.cache = LRUCache(cache_size)
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._datasets = {
+            "anomalies": _Dataset(processed_dir / ANOMALIES_FILE, lambda p: StationView(pd.read_parquet(p))),
+            "similar": _Dataset(
+                processed_dir / SIMILAR_FILE,
+                lambda p: StationView(pd.read_parquet(p), "reference_year", "reference_month"),
+            ),
+            "index": _Dataset(processed_dir / INDEX_FILE, QuantileIndex.load),
+        }
+
+    # ---- Loading / invalidation
+    def _get(self, name: str, required: bool = True):
+        """Current view of a dataset, reloading it if its file changed."""
+        dataset = self._datasets[name]
+        now = time.monotonic()
+        if dataset.checked is None or now - dataset.checked >= self.check_interval:
+            with self._lock:
+                signature = _signature(dataset.path)
+                dataset.checked = now
+                if signature != dataset.signature:
+                    dataset.value = dataset.loader(dataset.path) if signature is not None else None
+                    dataset.signature = signature
+                    self.reloads += 1
+                    self.cache.clear()
+
+        value = dataset.value
+        if value is None and required:
+            raise FileNotFoundError(f"Missing dataset: {dataset.path}")
+        return value
+
+    def _cached(self, key: tuple, datasets: tuple[str, ...], compute):
+        for name in datasets:      # re-check (and maybe reload) before the lookup
+            self._get(name, required=False)
+        # a result computed from a view replaced meanwhile lands under the
+        # old generation and is never read
+        key = (*key, self.reloads)
+        result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            self.cache.put(key, result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "cache_entries": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "reloads": self.reloads,
+            "datasets": {
+                name: {"path": str(d.path), "loaded": d.value is not None}
+                for name, d in self._datasets.items()
+            },
+        }
+
+    # ---- Queries
+    def stations(self) -> list[str]:
+        return self._cached(("stations",), ("anomalies",), lambda: sorted(self._get("anomalies").rows))
+
+    def anomalies(self, station: str, year: int = None, all_months: bool = False) -> list[dict]:
+        """Scored months of a station (only the anomalous ones unless all_months), by year and month."""
+        def compute():
+            view = self._get("anomalies")
+            df = view.df.iloc[view.station(station)]
+            if year is not None:
+                df = df[df["year"] == int(year)]
+            if not all_months:
+                df = df[df["is_anomaly"]]
+            return [_anomaly_record(row) for row in df.to_dict(orient="records")]
+
+        return self._cached(("anomalies", station, year, all_months), ("anomalies",), compute)
+
+    def top_features(self, station: str, year: int, month: int) -> dict:
+        """Score, threshold and top contributing features of one station-month."""
+        def compute():
+            view = self._get("anomalies")
+            rows = view.month_rows(station, year, month)
+            if rows.start == rows.stop:
+                raise KeyError(f"no scored month: {station!r} {int(year)}-{int(month):02d}")
+            return _anomaly_record(view.df.iloc[rows.start].to_dict())
+
+        return self._cached(("top_features", station, int(year), int(month)), ("anomalies",), compute)
+
+    def similar_months(self, station: str, year: int, month: int, top_k: int = TOP_K) -> list[dict]:
+        """Closest months of the same station, closest first."""
+        if int(top_k) < 1:
+            raise ValueError(f"top_k must be >= 1, got {top_k}")
+
+        def compute():
+            similar = self._get("similar", required=False)
+            index = self._get("index", required=False)
+            if similar is None and index is None:
+                raise FileNotFoundError(f"Missing dataset: {self._datasets['index'].path}")
+
+            if similar is not None and station in similar.rows:
+                rows = similar.month_rows(station, year, month)
+                if rows.stop - rows.start >= top_k or index is None:
+                    df = similar.df.iloc[rows].sort_values("rank", kind="stable").head(top_k)
+                    return [_clean(r) for r in df.drop(columns=["rank"]).to_dict(orient="records")]
+
+            if index is None or station not in index.stations():
+                raise KeyError(f"unknown station: {station!r}")
+            ref = index.locate(station, int(year), int(month))
+            if ref < 0 or not index.keys.at[ref, "is_reference"]:
+                return []
+            df = index.similar_months(station, int(year), int(month), top_k=top_k)
+            return [_clean(r) for r in df.to_dict(orient="records")]
+
+        return self._cached(
+            ("similar_months", station, int(year), int(month), int(top_k)),
+            ("similar", "index"),
+            compute,
+        )
+
+
+# ---- Records ----
+def _clean(record: dict) -> dict:
+    """JSON-ready values: numpy scalars to Python, NaN to None."""
+    out = {}
+    for key, value in record.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        out[key] = value
+    return out
+
+
+def _top_features(value) -> list[dict]:
+    """top_features in either stored format (JSON string or list<struct>) as a list of dicts."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [_clean(dict(zip(TOP_FEATURE_FIELDS, item))) for item in json.loads(value)]
+    return [_clean(dict(item)) for item in value]
+
+
+def _anomaly_record(row: dict) -> dict:
+    row = dict(row)
+    row["top_features"] = _top_features(row.get("top_features"))
+    return _clean(row)
+
+
+# ---- HTTP ----
+ROUTES = {
+    "/stations": (lambda e, q: e.stations(), ()),
+    "/anomalies": (
+        lambda e, q: e.anomalies(q["station"], year=_opt_int(q, "year"), all_months=q.get("all") in ("1", "true")),
+        ("station",),
+    ),
+    "/top_features": (
+        lambda e, q: e.top_features(q["station"], int(q["year"]), int(q["month"])),
+        ("station", "year", "month"),
+    ),
+    "/similar_months": (
+        lambda e, q: e.similar_months(q["station"], int(q["year"]), int(q["month"]), top_k=_opt_int(q, "top_k", TOP_K)),
+        ("station", "year", "month"),
+    ),
+    "/stats": (lambda e, q: e.stats(), ()),
+}
+
+
+def _opt_int(query: dict, name: str, default: int = None):
+    return int(query[name]) if query.get(name) not in (None, "") else default
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+    disable_nagle_algorithm = True  # headers and body are separate writes
+    engine: QueryEngine = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        route = ROUTES.get(parsed.path)
+        if route is None:
+            return self._send(404, {"error": f"unknown path: {parsed.path}", "paths": sorted(ROUTES)})
+
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(parsed.query).items()}
+        handler, required = route
+        missing = [name for name in required if name not in query]
+        if missing:
+            return self._send(400, {"error": f"missing parameter(s): {', '.join(missing)}"})
+
+        try:
+            self._send(200, handler(self.engine, query))
+        except KeyError as exc:
+            self._send(404, {"error": exc.args[0] if exc.args else str(exc)})
+        except ValueError as exc:
+            self._send(400, {"error": str(exc)})
+        except FileNotFoundError as exc:
+            self._send(503, {"error": str(exc)})
+        except Exception as exc:
+            self._send(500, {"error": f"{type(exc).__name__}: {exc}"})
+
+
+def make_server(engine: QueryEngine, host: str = "127.0.0.1", port: int = 8766) -> ThreadingHTTPServer:
+    handler = type("BoundQueryHandler", (QueryHandler,), {"engine": engine})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve_in_thread(engine: QueryEngine, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the server in a daemon thread (port 0 = free port); stop with .shutdown()."""
+    server = make_server(engine, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(processed_dir: Path = PROCESSED_DIR, host: str = "127.0.0.1", port: int = 8766, cache_size: int = CACHE_SIZE):
+    engine = QueryEngine(processed_dir, cache_size=cache_size)
+    t0 = time.perf_counter()
+    print(f"[OK] {len(engine.stations())} stations loaded in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    server = make_server(engine, host, port)
+    print(f"[OK] serving on http://{host}:{server.server_port}/ ({', '.join(sorted(ROUTES))})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local query service over the processed datasets.")
+    parser.add_argument("--processed-dir", type=Path, default=PROCESSED_DIR)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="cached query results")
+    args = parser.parse_args()
+
+    main(processed_dir=args.processed_dir, host=args.host, port=args.port, cache_size=args.cache_size)
@@ -1,6 +1,10 @@
 import math
 from datetime import date
 
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
 
 def to_float(x):
     if x in ("-", "", None):
@@ -30,4 +34,148 @@ def build_date(year, month, day):
     try:
         return date(int(year), int(month), int(day))
     except Exception:
-        return None
\ No newline at end of file
+        return None
+
+
+# ---- Column-level counterparts ----
+# Same results as the scalar casters above (kept as the reference), applied
+# to whole columns. Return (float64 values, present mask); "present" is
+# where the scalar function would not return None.
+#
+# Strings that are plain decimal literals are parsed in one Arrow cast,
+# which rounds exactly like float(). Anything else (whitespace, "inf",
+# "1_0", unusual types) goes through the scalar function, so results stay
+# bit-identical. Italian decimal commas ("1,5") are not numbers for
+# float(), so they come out missing here too.
+_FLOAT_LITERAL = r"[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?"
+_INT_LITERAL = r"-?[0-9]{1,18}"
+_KINDS = (str, float, int, type(None))
+
+
+def _by_type(values: np.ndarray) -> dict[type, np.ndarray]:
+    """Positions of str / float / int / None elements; anything else under `object`."""
+    kinds = np.frompyfunc(type, 1, 1)(values) if len(values) else values
+    groups, other = {}, np.ones(len(values), dtype=bool)
+    for kind in _KINDS:
+        mask = np.asarray(kinds == kind, dtype=bool)
+        if mask.any():
+            groups[kind] = np.flatnonzero(mask)
+            other &= ~mask
+    if other.any():
+        groups[object] = np.flatnonzero(other)
+    return groups
+
+
+def _parse_strings(strings: np.ndarray, pattern: str, arrow_type):
+    """
+    For an array of str: (parsed values, matched, sentinel) where `matched`
+    marks the strings fully matching `pattern` (parsed in one Arrow cast)
+    and `sentinel` the "-" / "" placeholders.
+    """
+    arr = pa.array(strings, type=pa.string())
+    sentinel = pc.is_in(arr, value_set=pa.array(["-", ""])).to_numpy(zero_copy_only=False)
+    matched = pc.match_substring_regex(arr, f"^(?:{pattern})$").to_numpy(zero_copy_only=False)
+    parsed = pc.cast(arr.filter(matched), arrow_type).to_numpy().astype(np.float64)
+    return parsed, matched, sentinel
+
+
+def _from_strings(values, idx, pattern, arrow_type, caster, out, present):
+    parsed, matched, sentinel = _parse_strings(values[idx], pattern, arrow_type)
+    out[idx[matched]] = parsed
+    present[idx[matched]] = True
+    _scalar_fallback(values, idx[~matched & ~sentinel], caster, out, present)
+
+
+def _scalar_fallback(values, idx, caster, out, present):
+    if not len(idx):
+        return
+    res = [caster(v) for v in values[idx]]
+    ok = np.array([r is not None for r in res], dtype=bool)
+    out[idx[ok]] = [r for r in res if r is not None]
+    present[idx[ok]] = True
+
+
+def _from_ints(values, idx, caster, out, present):
+    try:
+        out[idx] = values[idx].astype(np.float64)
+        present[idx] = True
+    except OverflowError:
+        _scalar_fallback(values, idx, caster, out, present)
+
+
+def _numeric_column(values) -> np.ndarray:
+    """A float/int ndarray or Series, else None."""
+    dtype = getattr(values, "dtype", None)
+    if dtype is not None and dtype != object and np.issubdtype(dtype, np.number):
+        return np.asarray(values)
+    return None
+
+
+def to_float_column(values) -> tuple[np.ndarray, np.ndarray]:
+    """Column version of to_float."""
+    numeric = _numeric_column(values)
+    if numeric is not None:
+        out = numeric.astype(np.float64)
+        return out, ~np.isnan(out)
+
+    values = np.asarray(values, dtype=object)
+    out = np.full(len(values), np.nan)
+    present = np.zeros(len(values), dtype=bool)
+
+    for kind, idx in _by_type(values).items():
+        if kind is float:
+            out[idx] = values[idx].astype(np.float64)
+            present[idx] = ~np.isnan(out[idx])
+        elif kind is int:
+            _from_ints(values, idx, to_float, out, present)
+        elif kind is str:
+            _from_strings(values, idx, _FLOAT_LITERAL, pa.float64(), to_float, out, present)
+        elif kind is object:
+            _scalar_fallback(values, idx, to_float, out, present)
+
+    return out, present
+
+
+def to_int_column(values) -> tuple[np.ndarray, np.ndarray]:
+    """Column version of to_int (the integers are returned as float64)."""
+    numeric = _numeric_column(values)
+    if numeric is not None:
+        floats = numeric.astype(np.float64)
+        present = np.isfinite(floats)         # int(nan) / int(inf) raise -> None
+        # + 0.0: int(-0.5) is 0, not -0.0
+        return np.where(present, np.trunc(floats) + 0.0, np.nan), present
+
+    values = np.asarray(values, dtype=object)
+    out = np.full(len(values), np.nan)
+    present = np.zeros(len(values), dtype=bool)
+
+    for kind, idx in _by_type(values).items():
+        if kind is float:
+            out[idx], present[idx] = to_int_column(values[idx].astype(np.float64))
+        elif kind is int:
+            _from_ints(values, idx, to_int, out, present)
+        elif kind is str:
+            _from_strings(values, idx, _INT_LITERAL, pa.int64(), to_int, out, present)
+        elif kind is object:
+            _scalar_fallback(values, idx, to_int, out, present)
+
+    return out, present
+
+
+def date_from_parts(year: np.ndarray, month: np.ndarray, day: np.ndarray, present: np.ndarray):
+    """Vectorized `date(year, month, day)` that does not raise: (datetime64[D], ok)."""
+    ok = present & (year >= 1) & (year <= 9999) & (month >= 1) & (month <= 12) & (day >= 1)
+
+    # days in month via datetime64 month arithmetic (dummy 1970-01 where not ok)
+    ym = np.where(ok, (year - 1970) * 12 + (month - 1), 0).astype("int64").astype("datetime64[M]")
+    dim = ((ym + 1).astype("datetime64[D]") - ym.astype("datetime64[D]")).astype("int64")
+    ok &= day <= dim
+
+    dates = ym.astype("datetime64[D]") + np.where(ok, day - 1, 0).astype("int64")
+    return dates, ok
+
+
+def build_date_column(year, month, day):
+    """Column version of build_date: (datetime64[D], ok) from raw anno / mese / giorno* columns."""
+    (y, y_ok), (m, m_ok), (d, d_ok) = (to_int_column(c) for c in (year, month, day))
+    return date_from_parts(y, m, d, y_ok & m_ok & d_ok)
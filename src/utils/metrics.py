@@ -0,0 +1,412 @@
+"""
+Opt-in stage metrics for the processing modules.
+
+Off by default: an instrumented function then costs one flag check per
+call. Turn it on with an environment variable or the `--metrics` flag of
+the build_* / pipeline entry points:
+
+    FVG_METRICS=data/metrics/daily.json python -m src.processing.build_daily
+    python -m src.processing.build_anomalies --metrics anomalies.prom
+
+Per stage, aggregated over its calls:
+    calls, wall / CPU seconds (inclusive, and "self" = minus nested stages),
+    rows in / out, rejected records (total and per rule when known),
+    peak RSS of the process at stage exit and how much the stage raised it.
+
+Generator stages (load_raw) are timed inside `next()` only, so parsing time
+is separated from the validation that consumes the records.
+
+The report is written at exit as JSON, or as Prometheus text exposition
+when the path ends in `.prom`. FVG_METRICS_PROFILE=<path> (`--profile`)
+also runs the outermost stages (below the entry point) under cProfile
+and dumps the stats of the slowest call; timings in that mode include the
+profiler's overhead.
+"""
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from pathlib import Path
+import atexit
+import cProfile
+import functools
+import inspect
+import json
+import os
+import resource
+import sys
+import time
+
+
+ENV_PATH = "FVG_METRICS"
+ENV_PROFILE = "FVG_METRICS_PROFILE"
+
+PROMETHEUS_SUFFIX = ".prom"
+PROMETHEUS_PREFIX = "fvg_stage"
+
+_NULL = nullcontext()
+
+
+def peak_rss_bytes() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class StageStats:
+    """Totals for one stage name."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.self_wall = 0.0
+        self.self_cpu = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.rejected = None
+        self.rules: dict[str, int] = {}
+        self.peak_rss = 0
+        self.rss_growth = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "wall_seconds": self.wall,
+            "cpu_seconds": self.cpu,
+            "self_wall_seconds": self.self_wall,
+            "self_cpu_seconds": self.self_cpu,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rejected": self.rejected,
+            "rejected_by_rule": dict(self.rules),
+            "peak_rss_mb": self.peak_rss / 1024 ** 2,
+            "rss_growth_mb": self.rss_growth / 1024 ** 2,
+        }
+
+
+def _add(current, n):
+    return n if current is None else current + n
+
+
+class _Frame:
+    """One active stage on the stack."""
+
+    def __init__(self, stats: StageStats, new_call: bool, profile: bool):
+        self.stats = stats
+        self.new_call = new_call
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+        self.counted = set()
+        self.profiler = None
+        if profile:
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # another profiler is already active
+                self.profiler = None
+        self.rss0 = peak_rss_bytes()
+        self.cpu0 = time.process_time()
+        self.wall0 = time.perf_counter()
+
+
+class _Registry:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.profile_path = None
+        self.stages: dict[str, StageStats] = {}
+        self.stack: list[_Frame] = []
+        self.slowest = None   # (wall, stage name, profiler) of the slowest profiled call
+        self.started = None
+        self._atexit = False
+
+    def enter(self, name: str, new_call: bool = True, profile: bool = False) -> _Frame:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats(name)
+        # one profiler at a time: the outermost eligible stage gets it
+        profile = profile and self.profile_path is not None and not any(f.profiler for f in self.stack)
+        frame = _Frame(stats, new_call, profile)
+        self.stack.append(frame)
+        return frame
+
+    def exit(self, frame: _Frame):
+        wall = time.perf_counter() - frame.wall0
+        cpu = time.process_time() - frame.cpu0
+        if frame.profiler is not None:
+            frame.profiler.disable()
+        rss = peak_rss_bytes()
+        self.stack.pop()
+
+        s = frame.stats
+        s.calls += frame.new_call
+        s.wall += wall
+        s.cpu += cpu
+        s.self_wall += wall - frame.child_wall
+        s.self_cpu += cpu - frame.child_cpu
+        s.peak_rss = max(s.peak_rss, rss)
+        s.rss_growth += rss - frame.rss0
+
+        if self.stack:
+            self.stack[-1].child_wall += wall
+            self.stack[-1].child_cpu += cpu
+        if frame.profiler is not None and (self.slowest is None or wall > self.slowest[0]):
+            self.slowest = (wall, s.name, frame.profiler)
+
+
+_registry = _Registry()
+
+
+# ---- Switches ----
+def enable(path=None, profile_path=None):
+    """
+    Start collecting. The report goes to `path` at exit (nothing is written
+    if it is None; use snapshot()/write() instead).
+    """
+    _registry.enabled = True
+    _registry.path = Path(path) if path else None
+    _registry.profile_path = Path(profile_path) if profile_path else None
+    _registry.started = _registry.started or datetime.now(timezone.utc).isoformat(timespec="seconds")
+    if not _registry._atexit:
+        atexit.register(_write_at_exit)
+        _registry._atexit = True
+
+
+def disable():
+    _registry.enabled = False
+
+
+def is_enabled() -> bool:
+    return _registry.enabled
+
+
+def reset():
+    """Drop collected stats (keeps the enabled state and output paths)."""
+    _registry.stages.clear()
+    _registry.stack.clear()
+    _registry.slowest = None
+
+
+def add_arguments(parser):
+    """--metrics / --profile options for an entry point's argparse parser."""
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        default=None,
+        help=f"write per-stage metrics here at exit (JSON, or Prometheus text for *{PROMETHEUS_SUFFIX}); also ${ENV_PATH}",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=None,
+        help=f"dump cProfile stats of the slowest stage here (needs --metrics); also ${ENV_PROFILE}",
+    )
+
+
+def enable_from_args(args):
+    """Apply add_arguments options; the environment variables still work without them."""
+    if args.metrics is not None:
+        enable(args.metrics, args.profile or _registry.profile_path)
+    elif args.profile is not None and _registry.enabled:
+        _registry.profile_path = Path(args.profile)
+
+
+# ---- Instrumentation ----
+class _Stage:
+    def __init__(self, name: str):
+        self.name = name
+        self.frame = None
+
+    def __enter__(self):
+        self.frame = _registry.enter(self.name, profile=True)
+        return self
+
+    def __exit__(self, *exc):
+        _registry.exit(self.frame)
+        return False
+
+
+def stage(name: str):
+    """Context manager timing a block as stage `name` (no-op when disabled)."""
+    if not _registry.enabled:
+        return _NULL
+    return _Stage(name)
+
+
+def count(rows_in: int = None, rows_out: int = None, rejected: int = None, rules: dict = None):
+    """
+    Add row counts to the innermost active stage. Counts set here take
+    precedence over the ones `instrument` infers from arguments / results.
+    """
+    if not _registry.enabled or not _registry.stack:
+        return
+    frame = _registry.stack[-1]
+    s = frame.stats
+    for key, n in (("rows_in", rows_in), ("rows_out", rows_out), ("rejected", rejected)):
+        if n is not None:
+            setattr(s, key, _add(getattr(s, key), int(n)))
+            frame.counted.add(key)
+    for rule, n in (rules or {}).items():
+        s.rules[rule] = s.rules.get(rule, 0) + int(n)
+
+
+def _rows(obj):
+    """Row count of a table-like object (DataFrame, pyarrow Table / RecordBatch), else None."""
+    n = getattr(obj, "num_rows", None)
+    if isinstance(n, int):
+        return n
+    if hasattr(obj, "columns") and hasattr(obj, "__len__"):
+        return len(obj)
+    return None
+
+
+def _infer_counts(frame: _Frame, args: tuple, result):
+    rows_in = _rows(args[0]) if args and "rows_in" not in frame.counted else None
+    rules = None
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], dict):
+        # (df, rejections) as returned by the validation engines
+        result, rules = result
+    rows_out = _rows(result) if "rows_out" not in frame.counted else None
+    count(rows_in=rows_in, rows_out=rows_out, rules=rules)
+
+
+def _instrumented_gen(name: str, gen, item_rows):
+    new_call = True
+    while True:
+        frame = _registry.enter(name, new_call=new_call)
+        new_call = False
+        try:
+            item = next(gen)
+        except StopIteration:
+            return
+        else:
+            count(rows_out=item_rows(item))
+        finally:
+            _registry.exit(frame)
+        yield item
+
+
+def instrument(name: str = None, item_rows=None, profile: bool = True):
+    """
+    Decorator recording each call of a function as a stage (default name:
+    `<module file stem>.<function>`).
+
+    Rows in / out are taken from a table-like first argument and result;
+    a `(df, rejections)` result also fills the per-rule rejections. For
+    generator functions every yielded item counts `item_rows(item)` rows
+    out (default 1) and only the time spent producing items is recorded.
+    profile=False keeps an entry point from being the cProfile candidate,
+    so its nested stages compete for it instead.
+    """
+    def decorate(fn):
+        # file stem rather than __module__, which is "__main__" under `python -m`
+        stage_name = name or f"{Path(fn.__code__.co_filename).stem}.{fn.__qualname__}"
+
+        if inspect.isgeneratorfunction(fn):
+            rows_of = item_rows or (lambda item: 1)
+
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                if not _registry.enabled:
+                    return fn(*args, **kwargs)
+                return _instrumented_gen(stage_name, fn(*args, **kwargs), rows_of)
+
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _registry.enabled:
+                return fn(*args, **kwargs)
+            frame = _registry.enter(stage_name, profile=profile)
+            try:
+                result = fn(*args, **kwargs)
+                _infer_counts(frame, args, result)
+                return result
+            finally:
+                _registry.exit(frame)
+
+        return wrapper
+
+    return decorate
+
+
+# ---- Output ----
+def snapshot() -> dict:
+    return {
+        "started": _registry.started,
+        "pid": os.getpid(),
+        "argv": sys.argv,
+        "stages": [s.as_dict() for s in _registry.stages.values()],
+        "slowest_top_level_stage": _registry.slowest[1] if _registry.slowest else None,
+    }
+
+
+_PROMETHEUS_METRICS = [
+    # (metric, stats key, type, help, scale)
+    ("calls_total", "calls", "counter", "Number of calls of the stage.", 1),
+    ("wall_seconds_total", "wall_seconds", "counter", "Wall-clock time in the stage, nested stages included.", 1),
+    ("cpu_seconds_total", "cpu_seconds", "counter", "Process CPU time in the stage, nested stages included.", 1),
+    ("self_wall_seconds_total", "self_wall_seconds", "counter", "Wall-clock time in the stage minus nested stages.", 1),
+    ("self_cpu_seconds_total", "self_cpu_seconds", "counter", "Process CPU time in the stage minus nested stages.", 1),
+    ("rows_in_total", "rows_in", "counter", "Rows received by the stage.", 1),
+    ("rows_out_total", "rows_out", "counter", "Rows produced by the stage.", 1),
+    ("rejected_total", "rejected", "counter", "Records rejected by the stage.", 1),
+    ("peak_rss_bytes", "peak_rss_mb", "gauge", "Process peak RSS when the stage last exited.", 1024 ** 2),
+    ("rss_growth_bytes", "rss_growth_mb", "gauge", "Increase of the process peak RSS during the stage.", 1024 ** 2),
+]
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def to_prometheus(report: dict) -> str:
+    """Prometheus text exposition of a snapshot()."""
+    lines = []
+    for metric, key, kind, help_text, scale in _PROMETHEUS_METRICS:
+        samples = [(s["stage"], s[key]) for s in report["stages"] if s[key] is not None]
+        if not samples:
+            continue
+        full = f"{PROMETHEUS_PREFIX}_{metric}"
+        lines += [f"# HELP {full} {help_text}", f"# TYPE {full} {kind}"]
+        for name, value in samples:
+            lines.append(f'{full}{{stage="{_label(name)}"}} {value * scale:.6g}')
+
+    rule_samples = [(s["stage"], r, n) for s in report["stages"] for r, n in s["rejected_by_rule"].items()]
+    if rule_samples:
+        full = f"{PROMETHEUS_PREFIX}_rejected_by_rule_total"
+        lines += [f"# HELP {full} Records failing each validation rule.", f"# TYPE {full} counter"]
+        for name, rule, n in rule_samples:
+            lines.append(f'{full}{{stage="{_label(name)}",rule="{_label(rule)}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+
+def write(path=None) -> Path:
+    """Write the report (JSON, or Prometheus text for *.prom) and the slowest stage's profile."""
+    path = Path(path or _registry.path)
+    report = snapshot()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == PROMETHEUS_SUFFIX:
+        path.write_text(to_prometheus(report), encoding="utf-8")
+    else:
+        path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    if _registry.profile_path is not None and _registry.slowest is not None:
+        _registry.profile_path.parent.mkdir(parents=True, exist_ok=True)
+        _registry.slowest[2].dump_stats(_registry.profile_path)
+    return path
+
+
+def _write_at_exit():
+    if _registry.path is None or not _registry.stages:
+        return
+    out = write()
+    print(f"[OK] metrics: {out}")
+    if _registry.profile_path is not None and _registry.slowest is not None:
+        print(f"[OK] profile ({_registry.slowest[1]}): {_registry.profile_path}")
+
+
+if os.environ.get(ENV_PATH):
+    enable(os.environ[ENV_PATH], os.environ.get(ENV_PROFILE) or None)
@@ -0,0 +1,161 @@
+"""
+Append-only raw storage: one immutable JSON Lines chunk per station-year.
+
+    data/raw/arpa/
+        meteo_monte_lussari/
+            manifest.json      {"station": ..., "format": "jsonl", "years": {"1999": {...}, ...}}
+            1999.jsonl
+            2000.jsonl
+
+The directory name is the stem of the legacy `meteo_<station>.json`, so a
+station migrated from the old layout keeps the same identifier.
+Values are written exactly as scraped (strings, numbers, NaN).
+"""
+from pathlib import Path
+import hashlib
+import json
+import os
+import threading
+
+
+MANIFEST_NAME = "manifest.json"
+CHUNK_FORMAT = "jsonl"
+
+
+def station_slug(station: str) -> str:
+    return f"meteo_{station.lower().replace(' ', '_')}"
+
+
+def station_dir(root: Path, station: str) -> Path:
+    return Path(root) / station_slug(station)
+
+
+def is_chunked(path: Path) -> bool:
+    return (Path(path) / MANIFEST_NAME).exists()
+
+
+def chunk_payload(records: list[dict]) -> bytes:
+    """Exact bytes of a year chunk; its sha256 is the year's fingerprint."""
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+
+
+def _atomic_write_bytes(path: Path, payload: bytes):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+class RawStationStore:
+    """
+    Chunks + manifest for one station. Writes are thread-safe; the resume
+    check (`has_year`) is a lookup in the in-memory manifest.
+    """
+
+    def __init__(self, path: Path, station: str = None):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.manifest = self._read_manifest(station)
+
+    @classmethod
+    def for_station(cls, root: Path, station: str) -> "RawStationStore":
+        return cls(station_dir(root, station), station=station)
+
+    def _read_manifest(self, station: str) -> dict:
+        manifest_path = self.path / MANIFEST_NAME
+        if manifest_path.exists():
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"station": station, "format": CHUNK_FORMAT, "years": {}}
+
+    def years(self) -> list[str]:
+        return list(self.manifest["years"])
+
+    def has_year(self, year_key: str) -> bool:
+        return str(year_key) in self.manifest["years"]
+
+    def chunk_path(self, year_key: str) -> Path:
+        return self.path / self.manifest["years"][str(year_key)]["file"]
+
+    def write_year(self, year_key: str, records: list[dict], overwrite: bool = False):
+        """Write one year as a new chunk, then publish it in the manifest."""
+        year_key = str(year_key)
+        payload = chunk_payload(records)
+
+        with self._lock:
+            if self.has_year(year_key) and not overwrite:
+                raise FileExistsError(f"{self.path.name}: year {year_key} already stored")
+
+            self.path.mkdir(parents=True, exist_ok=True)
+            file_name = f"{year_key}.{CHUNK_FORMAT}"
+            _atomic_write_bytes(self.path / file_name, payload)
+
+            self.manifest["years"][year_key] = {
+                "file": file_name,
+                "n_records": len(records),
+                "sha256": hashlib.sha256(payload).hexdigest(),
+            }
+            manifest_bytes = json.dumps(self.manifest, ensure_ascii=False, indent=2).encode("utf-8")
+            _atomic_write_bytes(self.path / MANIFEST_NAME, manifest_bytes)
+
+    def iter_year_records(self, year_key: str):
+        with open(self.chunk_path(year_key), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_years(self):
+        """Yield (year_str, records) in manifest (i.e. scrape) order."""
+        for year_key in self.years():
+            yield year_key, list(self.iter_year_records(year_key))
+
+
+# ---- Migration from the legacy single-file layout ----
+def migrate_station_json(json_path: Path, remove_legacy: bool = False) -> int:
+    """
+    Split a legacy `meteo_<station>.json` into per-year chunks next to it.
+    Years already present in the manifest are left alone, so the
+    conversion can be re-run safely. Returns the number of years written.
+    """
+    json_path = Path(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        station_data = json.load(f)
+
+    station = None
+    for records in station_data.values():
+        if isinstance(records, list) and records:
+            station = records[0].get("stazione")
+            break
+
+    store = RawStationStore(json_path.with_suffix(""), station=station)
+
+    written = 0
+    for year_key, records in station_data.items():
+        if not isinstance(records, list) or store.has_year(year_key):
+            continue
+        store.write_year(year_key, records)
+        written += 1
+
+    if remove_legacy:
+        json_path.unlink()
+
+    return written
+
+
+def migrate_all(root: Path, remove_legacy: bool = False) -> dict[str, int]:
+    return {
+        path.name: migrate_station_json(path, remove_legacy=remove_legacy)
+        for path in sorted(Path(root).glob("*.json"))
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate legacy station JSON to per-year chunks.")
+    parser.add_argument("--raw-dir", type=Path, default=Path("data/raw/arpa"))
+    parser.add_argument("--remove-legacy", action="store_true", help="delete meteo_*.json after migrating")
+    args = parser.parse_args()
+
+    for name, n in migrate_all(args.raw_dir, remove_legacy=args.remove_legacy).items():
+        print(f"[OK] {name}: {n} years migrated")
@@ -0,0 +1,129 @@
+"""Robust baselines against hand-computed values and the former per-station pandas baseline."""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.processing import build_anomalies as anomalies
+from src.processing.baselines import BASELINE_KEYS, SCALE, robust_baseline, robust_zscores
+
+
+def pandas_baseline(df, features, by):
+    """The per-group median / scaled MAD build_anomalies used before baselines.py."""
+    grouped = df.groupby(by)[features]
+    med = grouped.transform("median")
+    mad = (df[features] - med).abs().groupby([df[k] for k in by]).transform("median") * SCALE
+    return med.to_numpy(), mad.replace(0, np.nan).to_numpy()
+
+
+def monthly_frame(n_stations=3, years=range(2000, 2012), seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [
+        {"station_name": f"S{s}", "year": y, "month": m}
+        for s in range(n_stations) for y in years for m in range(1, 13)
+    ]
+    df = pd.DataFrame(rows)
+    season = np.cos((df["month"] - 7) / 12 * 2 * np.pi)
+    for i, f in enumerate(anomalies.CORE_FEATURES):
+        df[f] = 10 * i + 8 * season + rng.normal(0, 1 + i % 3, len(df))
+    df["temperature_mean_mean"] = df["temperature_mean_mean"].round()   # ties in the MAD
+    df.loc[rng.random(len(df)) < 0.05, "pressure_mean_mean"] = np.nan
+    for c in set(anomalies.FEATURE_TO_COVERAGE.values()):
+        df[c] = 1.0
+    df["n_days_rows"] = 30
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def test_hand_computed_median_mad():
+    df = pd.DataFrame({
+        "station_name": ["A"] * 5 + ["B"] * 4,
+        "month": [1, 1, 1, 2, 2, 1, 1, 1, 1],
+        "year": [2000, 2001, 2002, 2000, 2001, 2000, 2001, 2002, 2003],
+        "x": [1.0, 2.0, 100.0, 3.0, 5.0, 4.0, 4.0, 4.0, np.nan],
+    })
+
+    med, mad = robust_baseline(df, ["x"], by=BASELINE_KEYS["station"])
+    # A: 1 2 3 5 100 -> median 3, |dev| 2 1 0 2 97 -> MAD 2; B: constant -> MAD 0 -> NaN
+    np.testing.assert_allclose(med[:, 0], [3.0] * 5 + [4.0] * 4)
+    np.testing.assert_allclose(mad[:5, 0], 2 * SCALE)
+    assert np.isnan(mad[5:, 0]).all()
+
+    med, mad = robust_baseline(df, ["x"], by=BASELINE_KEYS["station_month"])
+    # A/1: 1 2 100 -> median 2, |dev| 1 0 98 -> MAD 1; A/2: 3 5 -> median 4, MAD 1
+    np.testing.assert_allclose(med[:5, 0], [2.0, 2.0, 2.0, 4.0, 4.0])
+    np.testing.assert_allclose(mad[:5, 0], SCALE)
+
+    z = robust_zscores(df, ["x"], by=BASELINE_KEYS["station_month"])
+    np.testing.assert_allclose(z[:5, 0], np.array([-1.0, 0.0, 98.0, -1.0, 1.0]) / SCALE)
+
+
+def test_hand_computed_rolling_window():
+    df = pd.DataFrame({
+        "station_name": "A",
+        "month": 1,
+        "year": [2000, 2001, 2002, 2003, 2004],
+        "x": [1.0, 2.0, 4.0, 8.0, 16.0],
+    })
+
+    med, mad = robust_baseline(df, ["x"], by=BASELINE_KEYS["station_month"], window=3)
+    # windows: {1,2} {1,2,4} {2,4,8} {4,8,16} {8,16}
+    np.testing.assert_allclose(med[:, 0], [1.5, 2.0, 4.0, 8.0, 12.0])
+    np.testing.assert_allclose(mad[:, 0], np.array([0.5, 1.0, 2.0, 4.0, 4.0]) * SCALE)
+
+    with pytest.raises(ValueError):
+        robust_baseline(df, ["x"], by=BASELINE_KEYS["station"], window=0)
+
+
+@pytest.mark.parametrize("baseline", BASELINE_KEYS)
+def test_matches_pandas_groupby(baseline):
+    df = monthly_frame()
+    by = BASELINE_KEYS[baseline]
+
+    med, mad = robust_baseline(df, anomalies.CORE_FEATURES, by=by)
+    ref_med, ref_mad = pandas_baseline(df, anomalies.CORE_FEATURES, by)
+
+    np.testing.assert_allclose(med, ref_med, equal_nan=True)
+    np.testing.assert_allclose(mad, ref_mad, equal_nan=True)
+
+
+def test_station_baseline_matches_previous_output():
+    """baseline="station" scores exactly like the per-station baseline it replaced."""
+    df = monthly_frame()
+    core = anomalies.CORE_FEATURES
+
+    med, mad = pandas_baseline(df, core, ["station_name"])
+    z = np.clip((df[core].to_numpy() - med) / mad, -anomalies.ZCAP, anomalies.ZCAP)
+    expected = df[["station_name", "year", "month"]].assign(anomaly_score=np.nanmean(np.abs(z), axis=1))
+    expected["threshold_p99"] = expected.groupby("station_name")["anomaly_score"].transform(
+        lambda s: s.quantile(anomalies.PCTL)
+    )
+
+    got = anomalies.build_anomalies(df, baseline="station", verbose=False)
+
+    keys = ["station_name", "year", "month"]
+    got = got.sort_values(keys).reset_index(drop=True)
+    expected = expected.sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(got[keys], expected[keys])
+    np.testing.assert_allclose(got["anomaly_score"], expected["anomaly_score"])
+    np.testing.assert_allclose(got["threshold_p99"], expected["threshold_p99"])
+
+    # the explanation z-scores come from the same baseline
+    row = got.iloc[0]
+    i = df.index[(df[keys] == row[keys]).all(axis=1)][0]
+    top = {f: zv for f, _, zv, _ in json.loads(row["top_features"])}
+    for f, zv in top.items():
+        assert zv == pytest.approx(z[i, core.index(f)])
+
+
+def test_seasonal_baseline_differs_from_station():
+    df = monthly_frame()
+
+    station = anomalies.build_anomalies(df, baseline="station", verbose=False)
+    seasonal = anomalies.build_anomalies(df, baseline="station_month", verbose=False)
+
+    # the seasonal cycle inflates the pooled MAD, so pooled scores are lower
+    assert seasonal["anomaly_score"].median() > station["anomaly_score"].median()
+
+    with pytest.raises(ValueError):
+        anomalies.build_anomalies(df, baseline="month", verbose=False)
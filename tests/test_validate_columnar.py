@@ -0,0 +1,118 @@
+"""The columnar engine must accept, reject and type records exactly like the pydantic one."""
+import math
+
+import pandas as pd
+import pytest
+
+from src.processing.build_daily import build_daily_columnar, build_daily_pydantic
+from src.processing.normalize import FIELD_MAP
+
+
+def record(year=2020, month=3, day=15, station="Udine", **values):
+    raw = {"anno": year, "mese": month, "giorno*": day, "stazione": station}
+    raw.update({key: "1.0" for key in FIELD_MAP})
+    raw.update({"Temp. min °C": "-2.5", "Press. med hPa": "1013.2", "Dir. V. max °N": "270"})
+    for key, value in values.items():
+        raw[key.replace("_", " ")] = value
+    return raw
+
+
+def measure(field, value, **kwargs):
+    """record() with the raw column of `field` set to `value`."""
+    raw = record(**kwargs)
+    raw[next(k for k, f in FIELD_MAP.items() if f == field)] = value
+    return raw
+
+
+BAD_DATES = [
+    record(month=2, day=30),
+    record(month=13),
+    record(day=0),
+    record(year=None),
+    record(month="marzo"),
+    record(day="1.5"),
+    record(year=1899),
+]
+
+OUT_OF_RANGE = [
+    measure("temperature_max", "50.1"),
+    measure("temperature_min", "-50.0001"),
+    measure("humidity_mean", "100.5"),
+    measure("precipitation", "-0.1"),
+    measure("wind_direction_max", "361"),
+    measure("pressure_mean", "799.9"),
+    measure("pressure_mean", "nan"),
+    measure("temperature_mean", "inf"),
+]
+
+STRING_NUMERICS = [
+    record(year="2020", month="03", day=" 7"),
+    record(year=2021.0, month=1.0, day=2.0),
+    measure("temperature_mean", " 12.5 "),
+    measure("temperature_mean", "1e1"),
+    measure("temperature_mean", "+.5"),
+    measure("temperature_mean", "1,5"),
+    measure("temperature_mean", "-"),
+    measure("temperature_mean", ""),
+    measure("temperature_mean", float("nan")),
+    measure("temperature_mean", 7),
+    measure("wind_direction_max", "90.0"),
+    measure("wind_direction_max", 45.0),
+    measure("humidity_min", "0"),
+    measure("humidity_max", "100"),
+]
+
+MISSING_STATION = [
+    record(station=None),
+    record(station=""),
+    record(station="   "),
+    record(station=12),
+    record(station="  Lignano "),
+    {key: value for key, value in record().items() if key != "stazione"},
+]
+
+CASES = {
+    "bad_dates": BAD_DATES,
+    "out_of_range": OUT_OF_RANGE,
+    "string_numerics": STRING_NUMERICS,
+    "missing_station": MISSING_STATION,
+    "all": BAD_DATES + OUT_OF_RANGE + STRING_NUMERICS + MISSING_STATION,
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_engines_agree(case):
+    records = [record(day=1)] + CASES[case]
+
+    expected = build_daily_pydantic(records)
+    got = build_daily_columnar(records)
+
+    pd.testing.assert_frame_equal(got, expected)
+
+
+def test_engines_agree_in_batches():
+    records = CASES["all"] + [record(day=d) for d in range(1, 29)]
+    batches = [records[i:i + 5] for i in range(0, len(records), 5)]
+
+    expected = build_daily_pydantic(records)
+    got = build_daily_columnar(batches=iter(batches))
+
+    pd.testing.assert_frame_equal(got, expected)
+
+
+def test_all_null_optional_column():
+    records = [measure("solar_radiation", "-", day=d) for d in range(1, 4)]
+
+    expected = build_daily_pydantic(records)
+    got = build_daily_columnar(records)
+
+    pd.testing.assert_frame_equal(got, expected)
+    assert got["solar_radiation"].isna().all()
+
+
+def test_every_edge_case_is_decided():
+    """Guard against a case list that both engines silently drop or keep wholesale."""
+    df = build_daily_columnar(CASES["all"])
+
+    assert 0 < len(df) < len(CASES["all"])
+    assert not any(isinstance(v, float) and math.isnan(v) for v in df["station_name"])